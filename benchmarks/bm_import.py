@@ -0,0 +1,45 @@
+"""
+Time taken by `import numba` in a fresh interpreter, compared to the
+interpreter startup itself.  Running this script directly also checks
+that optional subsystems (CUDA, HSA, pycc, annotations) aren't imported.
+"""
+from __future__ import absolute_import, print_function, division
+
+import subprocess
+import sys
+
+from numba.utils import benchmark
+
+
+# Modules which must only be imported on first use
+LAZY_MODULES = ['numba.cuda', 'numba.hsa', 'numba.pycc',
+                'numba.annotations']
+
+
+def run_python(code):
+    subprocess.check_call([sys.executable, '-c', code])
+
+
+def python_main():
+    run_python('pass')
+
+
+def numba_main():
+    run_python('import numba')
+
+
+def check_lazy_modules():
+    code = ("import sys, numba; "
+            "print(' '.join(m for m in %r if m in sys.modules))"
+            % (LAZY_MODULES,))
+    out = subprocess.check_output([sys.executable, '-c', code])
+    imported = out.decode().split()
+    if imported:
+        raise AssertionError("`import numba` imported %s"
+                             % (', '.join(imported)))
+
+
+if __name__ == '__main__':
+    check_lazy_modules()
+    print(benchmark(python_main))
+    print(benchmark(numba_main))
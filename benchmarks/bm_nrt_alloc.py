@@ -0,0 +1,60 @@
+"""
+Allocation-heavy kernels: small scratch arrays created and freed at each
+loop iteration by a nopython function.  Running this script directly
+prints the timings and the NRT allocation statistics; compare runs with
+NUMBA_NRT_POOL_ALLOCATOR=0 and NUMBA_NRT_POOL_ALLOCATOR=1 to measure
+the pool allocator.
+"""
+from __future__ import absolute_import, print_function, division
+
+import numpy as np
+from numba import njit
+from numba.runtime import rtsys
+from numba.utils import benchmark
+
+
+def scratch_arrays(a, size):
+    s = 0.0
+    for i in range(a.shape[0]):
+        tmp = np.empty(size)
+        tmp[:] = a[i]
+        s += tmp[size - 1]
+    return s
+
+
+def temporaries(a):
+    s = 0.0
+    for i in range(a.shape[0] - 4):
+        window = a[i:i + 4]
+        s += (window * 2.0 + 1.0).sum()
+    return s
+
+
+a = np.arange(10000, dtype=np.float64)
+
+fast_scratch_arrays = njit(scratch_arrays)
+fast_temporaries = njit(temporaries)
+
+
+def python_main():
+    scratch_arrays(a, 16)
+    temporaries(a)
+
+
+def numba_main():
+    fast_scratch_arrays(a, 16)
+    fast_temporaries(a)
+
+
+if __name__ == '__main__':
+    print(benchmark(python_main))
+    print(benchmark(numba_main))
+    for size in (16, 1024, 8192):
+        before = rtsys.get_allocation_stats()
+        print("scratch arrays of %d items:" % size,
+              benchmark(lambda: fast_scratch_arrays(a, size)))
+        after = rtsys.get_allocation_stats()
+        print("  allocations: %d, pool hits: %d, pool misses: %d"
+              % (after.alloc - before.alloc,
+                 after.pool_hit - before.pool_hit,
+                 after.pool_miss - before.pool_miss))
@@ -0,0 +1,57 @@
+"""
+Overhead of the parallel ufunc thread pool: latency of dispatching a
+tiny loop to the worker threads, and CPU time burnt by the idle workers
+between calls.  Running this script directly prints both, to be compared
+across revisions.
+"""
+from __future__ import absolute_import, print_function, division
+
+import os
+import time
+
+import numpy as np
+from numba import vectorize
+from numba.utils import benchmark
+
+
+@vectorize(['float64(float64, float64)'], target='cpu')
+def cpu_add(a, b):
+    return a + b
+
+
+# Always dispatch to the worker threads, however small the input
+@vectorize(['float64(float64, float64)'], target='parallel',
+           serial_threshold=0)
+def parallel_add(a, b):
+    return a + b
+
+
+# Large enough to be split across all threads
+a = np.arange(1000, dtype=np.float64)
+b = a.copy()
+
+
+def python_main():
+    cpu_add(a, b)
+
+
+def numba_main():
+    parallel_add(a, b)
+
+
+def idle_cpu_time(idle=1.0):
+    """
+    CPU time used by the process while sleeping for *idle* seconds after
+    a parallel call, i.e. by the idle worker threads.
+    """
+    numba_main()
+    before = os.times()
+    time.sleep(idle)
+    after = os.times()
+    return (after[0] + after[1]) - (before[0] + before[1])
+
+
+if __name__ == '__main__':
+    print(benchmark(python_main))
+    print(benchmark(numba_main))
+    print("idle CPU time: %.3f s per wall-clock second" % idle_cpu_time())
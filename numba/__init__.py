@@ -5,12 +5,11 @@ from __future__ import print_function, division, absolute_import
 import re
 
 from . import testing, decorators
-from . import errors, special, types, config
+from . import errors, special, types, config, utils
 
 # Re-export typeof
 from .special import *
 from .errors import *
-from .pycc.decorators import export, exportmany
 
 # Re-export all type names
 from .types import *
@@ -20,8 +19,13 @@ jit = decorators.jit
 autojit = decorators.autojit
 njit = decorators.njit
 
+from .dispatcher import wait_background_compilation
+from .manifest import warmup
+
 # Re export vectorize decorators
 from .npyufunc import vectorize, guvectorize
+from .npyufunc.parallel import (set_num_threads, get_num_threads,
+                                parallel_map)
 
 # Re export from_dtype
 from .numpy_support import from_dtype
@@ -29,16 +33,38 @@ from .numpy_support import from_dtype
 # Re-export test entrypoint
 test = testing.test
 
-# Try to initialize cuda
-from . import cuda
+# The CUDA target and the pycc compiler are only imported when first used,
+# to keep `import numba` fast.
+cuda = utils.LazyModule('numba.cuda')
+
+
+def export(prototype):
+    """
+    Deprecated, use the numba.pycc.CC API instead.
+    """
+    from .pycc.decorators import export
+    return export(prototype)
+
+
+def exportmany(prototypes):
+    """
+    Deprecated, use the numba.pycc.CC API instead.
+    """
+    from .pycc.decorators import exportmany
+    return exportmany(prototypes)
 
 
 __all__ = """
 jit
 autojit
 njit
+wait_background_compilation
+warmup
 vectorize
 guvectorize
+set_num_threads
+get_num_threads
+parallel_map
 export
 exportmany
 cuda
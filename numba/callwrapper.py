@@ -77,14 +77,21 @@ class _GilManager(object):
     again.
     """
 
-    def __init__(self, builder, api, argman):
+    def __init__(self, context, builder, api, argman):
+        self.context = context
         self.builder = builder
         self.api = api
         self.argman = argman
+        if context.enable_nrt:
+            # Make functions with non-atomic refcounts use atomic
+            # operations until the GIL is re-acquired
+            context.nrt_adjust_nogil_count(builder, 1)
         self.thread_state = api.save_thread()
 
     def emit_cleanup(self):
         self.api.restore_thread(self.thread_state)
+        if self.context.enable_nrt:
+            self.context.nrt_adjust_nogil_count(self.builder, -1)
         self.argman.emit_cleanup()
 
 
@@ -150,7 +157,8 @@ class PyCallWrapper(object):
             innerargs.append(val)
 
         if self.release_gil:
-            cleanup_manager = _GilManager(builder, api, cleanup_manager)
+            cleanup_manager = _GilManager(self.context, builder, api,
+                                          cleanup_manager)
 
         status, retval = self.context.call_conv.call_function(
             builder, self.func, self.fndesc.restype, self.fndesc.argtypes,
@@ -1,18 +1,26 @@
 from __future__ import print_function, division, absolute_import
 
 import inspect
+import os
 from contextlib import contextmanager
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
 from pprint import pprint
 import sys
+import threading
+import timeit
 import warnings
 import traceback
 
+try:
+    import resource
+except ImportError:
+    # Windows
+    resource = None
+
 from numba import (bytecode, interpreter, funcdesc, typing, typeinfer,
                    lowering, objmode, irpasses, utils, config,
                    types, ir, looplifting, macro, types, rewrites)
 from numba.targets import cpu, callconv
-from numba.annotations import type_annotations
 
 
 class Flags(utils.ConfigOptions):
@@ -36,6 +44,11 @@ class Flags(utils.ConfigOptions):
         'no_cpython_wrapper': False,
         'nrt': False,
         'no_rewrites': False,
+        # Run array expressions on the parallel ufunc thread pool
+        'auto_parallel': False,
+        # Update NRT refcounts non-atomically (ignored with release_gil
+        # and auto_parallel)
+        'nonatomic_refct': False,
         'error_model': 'python',
     }
 
@@ -57,7 +70,8 @@ CR_FIELDS = ["typing_context",
              "library",
              "call_helper",
              "environment",
-             "has_dynamic_globals"]
+             "has_dynamic_globals",
+             "stage_stats"]
 
 
 class CompileResult(namedtuple("_CompileResult", CR_FIELDS)):
@@ -96,6 +110,7 @@ class CompileResult(namedtuple("_CompileResult", CR_FIELDS)):
                  typing_error=None,
                  call_helper=None,
                  has_dynamic_globals=False,  # by definition
+                 stage_stats=None,  # not compiled in this process
                  )
         return cr
 
@@ -193,6 +208,114 @@ class _CompileStatus(object):
         return ', '.join(vals)
 
 
+StageStats = namedtuple("StageStats",
+                        ["pipeline", "stage", "wall_time", "rss_growth",
+                         "peak_rss", "peak_rss_increase"])
+StageStats.__doc__ = """
+Statistics about the execution of a compiler pipeline stage: the
+pipeline and stage description, the wall clock time in seconds, and
+the change of the process' resident memory in bytes over the stage
+(including the compilation of other functions called from the compiled
+function).
+
+The process' peak resident memory at the end of the stage, and how much
+the stage raised it, are also given.  As the peak is a high-water mark
+over the process' lifetime, stages running after an earlier, larger
+compilation don't raise it at all.
+
+Memory figures are None if they cannot be measured on this platform.
+"""
+
+
+def _get_peak_memory():
+    """
+    Return the peak resident memory of the process in bytes, or None.
+    """
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes except on OS X
+    if sys.platform != 'darwin':
+        peak *= 1024
+    return peak
+
+
+def _get_current_memory():
+    """
+    Return the current resident memory of the process in bytes, or None.
+    """
+    try:
+        with open('/proc/self/statm') as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf('SC_PAGE_SIZE')
+    except (EnvironmentError, ValueError, IndexError, AttributeError):
+        # Not Linux
+        return None
+
+
+class _CompileStatsRegistry(object):
+    """
+    Process-wide record of pipeline stage statistics, enabled by
+    NUMBA_COMPILE_STATS.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._records = []
+
+    def add(self, func_name, signature, stage_stats):
+        with self._lock:
+            self._records.append((func_name, signature, stage_stats))
+
+    def get_records(self):
+        with self._lock:
+            return list(self._records)
+
+    def get_summary(self):
+        summary = OrderedDict()
+        for func_name, signature, stage_stats in self.get_records():
+            for st in stage_stats:
+                key = st.pipeline, st.stage
+                count, wall_time, growth = summary.get(key, (0, 0.0, None))
+                if st.rss_growth is not None:
+                    growth = (growth or 0) + st.rss_growth
+                summary[key] = count + 1, wall_time + st.wall_time, growth
+        return summary
+
+    def reset(self):
+        with self._lock:
+            del self._records[:]
+
+
+_compile_stats = _CompileStatsRegistry()
+
+
+def get_compile_stats():
+    """
+    Return a list of (function name, signature, stage statistics) tuples
+    for all functions compiled since the process started (or since
+    reset_compile_stats() was called) while NUMBA_COMPILE_STATS was
+    enabled.  Stage statistics are lists of StageStats tuples.
+    """
+    return _compile_stats.get_records()
+
+
+def get_compile_stats_summary():
+    """
+    Return an ordered dict mapping (pipeline, stage) tuples to
+    (number of executions, total wall time, total resident memory growth)
+    tuples, aggregated over get_compile_stats().
+    """
+    return _compile_stats.get_summary()
+
+
+def reset_compile_stats():
+    """
+    Clear the statistics returned by get_compile_stats().
+    """
+    _compile_stats.reset()
+
+
 class _EarlyPipelineCompletion(Exception):
     def __init__(self, result):
         self.result = result
@@ -202,6 +325,7 @@ class _PipelineManager(object):
     def __init__(self):
         self.pipeline_order = []
         self.pipeline_stages = {}
+        self.stage_stats = []
         self._finalized = False
 
     def create_pipeline(self, pipeline_name):
@@ -233,12 +357,32 @@ class _PipelineManager(object):
         exc.args = (newmsg,)
         return exc
 
+    def _record_stage(self, pipeline_name, stage_name, start_time,
+                      start_memory, start_peak):
+        wall_time = timeit.default_timer() - start_time
+        memory = _get_current_memory()
+        if memory is None:
+            rss_growth = None
+        else:
+            rss_growth = memory - start_memory
+        peak = _get_peak_memory()
+        if peak is None:
+            peak_increase = None
+        else:
+            peak_increase = peak - start_peak
+        self.stage_stats.append(StageStats(pipeline_name, stage_name,
+                                           wall_time, rss_growth,
+                                           peak, peak_increase))
+
     def run(self, status):
         assert self._finalized, "PM must be finalized before run()"
         res = None
         for pipeline_name in self.pipeline_order:
             is_final_pipeline = pipeline_name == self.pipeline_order[-1]
             for stage, stage_name in self.pipeline_stages[pipeline_name]:
+                start_memory = _get_current_memory()
+                start_peak = _get_peak_memory()
+                start_time = timeit.default_timer()
                 try:
                     res = stage()
                 except _EarlyPipelineCompletion as e:
@@ -253,6 +397,9 @@ class _PipelineManager(object):
                     else:
                         status.fail_reason = patched_exception
                         break
+                finally:
+                    self._record_stage(pipeline_name, stage_name,
+                                       start_time, start_memory, start_peak)
             else:
                 return res
 
@@ -276,6 +423,13 @@ class Pipeline(object):
             subtargetoptions['enable_boundcheck'] = True
         if flags.nrt:
             subtargetoptions['enable_nrt'] = True
+        if flags.auto_parallel:
+            subtargetoptions['auto_parallel'] = True
+        if (flags.nonatomic_refct and not flags.release_gil
+                and not flags.auto_parallel):
+            # Other threads may only use the function's arrays while it
+            # waits for the GIL or for the end of a prange() loop
+            subtargetoptions['atomic_refct'] = False
         error_model = callconv.error_models[flags.error_model](targetctx.call_conv)
         subtargetoptions['error_model'] = error_model
 
@@ -479,6 +633,8 @@ class Pipeline(object):
         """
         Create type annotation after type inference
         """
+        # Imported lazily to keep `import numba` fast
+        from numba.annotations import type_annotations
         self.type_annotation = type_annotations.TypeAnnotation(
             interp=self.interp,
             typemap=self.typemap,
@@ -628,7 +784,12 @@ class Pipeline(object):
             pm.add_stage(self.stage_compile_interp_mode, "compiling with interpreter mode")
 
         pm.finalize()
-        return pm.run(self.status)
+        res = pm.run(self.status)
+        res = res._replace(stage_stats=pm.stage_stats)
+        if config.COMPILE_STATS:
+            _compile_stats.add(self.bc.func_qualname, res.signature,
+                               res.stage_stats)
+        return res
 
 
 def compile_extra(typingctx, targetctx, func, args, return_type, flags,
@@ -38,6 +38,55 @@ def _parse_cc(text):
         return int(grp[0]), int(grp[1])
 
 
+def _read_cgroup_cpu_quota():
+    """
+    Return the CPU bandwidth limit of the process' cgroup as a number
+    of CPUs, or None if unlimited or unknown (e.g. not on Linux).
+    """
+    def read(path):
+        try:
+            with open(path) as f:
+                return f.read().split()
+        except (IOError, OSError):
+            return None
+
+    # cgroup v2
+    fields = read('/sys/fs/cgroup/cpu.max')
+    if fields and len(fields) == 2:
+        quota, period = fields
+    else:
+        # cgroup v1
+        quota = read('/sys/fs/cgroup/cpu/cpu.cfs_quota_us')
+        period = read('/sys/fs/cgroup/cpu/cpu.cfs_period_us')
+        if not quota or not period:
+            return None
+        quota, period = quota[0], period[0]
+    try:
+        quota, period = int(quota), int(period)
+    except ValueError:
+        # "max" means unlimited
+        return None
+    if quota <= 0 or period <= 0:
+        return None
+    return max(1, -(-quota // period))
+
+
+def _get_available_cpu_count():
+    """
+    Return the number of CPUs the process can run on, taking into
+    account its CPU affinity and its cgroup CPU quota if any.
+    """
+    try:
+        count = len(os.sched_getaffinity(0))
+    except (AttributeError, OSError):
+        import multiprocessing
+        count = multiprocessing.cpu_count()
+    quota = _read_cgroup_cpu_quota()
+    if quota is not None:
+        count = min(count, quota)
+    return max(1, count)
+
+
 class _EnvReloader(object):
 
     def __init__(self):
@@ -158,6 +207,75 @@ class _EnvReloader(object):
         # Disable jit for debugging
         DISABLE_JIT = _readenv("NUMBA_DISABLE_JIT", int, 0)
 
+        # If set, the file recording the signatures compiled by JIT
+        # functions (see numba.warmup())
+        SIGNATURE_MANIFEST = _readenv("NUMBA_SIGNATURE_MANIFEST", str, "")
+
+        # Include the compiled machine code when pickling JIT functions
+        PICKLE_OBJECT_CODE = _readenv("NUMBA_PICKLE_OBJECT_CODE", int, 0)
+
+        # Record per-stage compilation statistics process-wide
+        # (see numba.compiler.get_compile_stats())
+        COMPILE_STATS = _readenv("NUMBA_COMPILE_STATS", int, 0)
+
+        # Size of the thread pool for the parallel ufunc target
+        NUM_THREADS = _readenv("NUMBA_NUM_THREADS", int,
+                               _get_available_cpu_count())
+
+        # Scheduling of the parallel ufunc target: "static", "dynamic"
+        # or "guided", and chunk size (0 for automatic)
+        PARALLEL_SCHEDULE = _readenv("NUMBA_PARALLEL_SCHEDULE", str, "guided")
+        PARALLEL_GRAIN_SIZE = _readenv("NUMBA_PARALLEL_GRAIN_SIZE", int, 0)
+        # Number of iterations below which parallel ufuncs run serially
+        PARALLEL_SERIAL_THRESHOLD = _readenv(
+            "NUMBA_PARALLEL_SERIAL_THRESHOLD", int, 1000)
+
+        # Recycle small NRT allocations through a size-class pool allocator
+        NRT_POOL_ALLOCATOR = _readenv("NUMBA_NRT_POOL_ALLOCATOR", int, 0)
+
+        # Attribute NRT allocations to the compiled functions making them
+        # (see numba.runtime.rtsys.get_allocation_profile())
+        NRT_PROFILE = _readenv("NUMBA_NRT_PROFILE", int, 0)
+
+        # Update NRT refcounts non-atomically in functions compiled without
+        # nogil=True or parallel=True
+        NRT_NONATOMIC = _readenv("NUMBA_NRT_NONATOMIC", int, 0)
+
+        # Allocate the non-escaping temporary arrays of nopython functions
+        # on the stack or in buffers reused across loop iterations, and
+        # the maximum size in bytes of the arrays allocated on the stack
+        OPT_TEMP_ARRAYS = _readenv("NUMBA_OPT_TEMP_ARRAYS", int, 1)
+        TEMP_ARRAY_STACK_LIMIT = _readenv("NUMBA_TEMP_ARRAY_STACK_LIMIT", int,
+                                          4096)
+
+        # Number of threads compiling functions decorated with
+        # jit(background=True)
+        BACKGROUND_COMPILE_THREADS = _readenv(
+            "NUMBA_BACKGROUND_COMPILE_THREADS", int, 1)
+
+        # How on-disk cache entries of jitted functions are invalidated:
+        #   "stamp" = source file modification time and size (default)
+        #   "content" = hash of the function's code and referenced globals
+        CACHE_INVALIDATION = _readenv("NUMBA_CACHE_INVALIDATION", str,
+                                      "stamp")
+
+        # Root directory for the on-disk cache of jitted functions; if empty,
+        # cache files are stored in the __pycache__ directory next to the
+        # source file (or a user-wide directory if that isn't writable)
+        CACHE_DIR = _readenv("NUMBA_CACHE_DIR", str, "")
+
+        # Storage of the on-disk cache:
+        #   "files" = an index file and data files per function (default)
+        #   "archive" = a single archive file per module
+        CACHE_BACKEND = _readenv("NUMBA_CACHE_BACKEND", str, "files")
+
+        # Maximum size in bytes of a cache archive, 0 for unlimited
+        CACHE_MAX_SIZE = _readenv("NUMBA_CACHE_MAX_SIZE", int, 0)
+
+        # How long to wait (in seconds) for another process compiling the
+        # same cached function before compiling it anyway, 0 to disable
+        CACHE_LOCK_TIMEOUT = _readenv("NUMBA_CACHE_LOCK_TIMEOUT", float, 300)
+
         # Enable CUDA simulator
         ENABLE_CUDASIM = _readenv("NUMBA_ENABLE_CUDASIM", int, 0)
 
@@ -7,7 +7,6 @@ import warnings
 from . import config, sigutils
 from .errors import DeprecationError
 from .targets import registry
-from . import cuda
 
 # -----------------------------------------------------------------------------
 # Decorators
@@ -34,7 +33,8 @@ _msg_deprecated_signature_arg = ("Deprecated keyword argument `{0}`. "
                                  "Signatures should be passed as the first "
                                  "positional argument.")
 
-def jit(signature_or_function=None, locals={}, target='cpu', cache=False, **options):
+def jit(signature_or_function=None, locals={}, target='cpu', cache=False,
+        background=False, **options):
     """
     This decorator is used to compile a Python function into native code.
     
@@ -55,6 +55,15 @@ def jit(signature_or_function=None, locals={}, target='cpu', cache=False, **opti
         Specifies the target platform to compile for. Valid targets are cpu,
         gpu, npyufunc, and cuda. Defaults to cpu.
 
+    cache: bool
+        Set to True to write compilation results to an on-disk cache.
+
+    background: bool
+        Set to True to compile new signatures in a background thread.
+        Until compilation is finished, calls execute an existing compiled
+        version if the arguments can be safely converted, or else the
+        Python function.  Default value is False.
+
     targetoptions: 
         For a cpu target, valid options are:
             nopython: bool
@@ -143,18 +152,19 @@ def jit(signature_or_function=None, locals={}, target='cpu', cache=False, **opti
         sigs = None
 
     wrapper = _jit(sigs, locals=locals, target=target, cache=cache,
-                   targetoptions=options)
+                   background=background, targetoptions=options)
     if pyfunc is not None:
         return wrapper(pyfunc)
     else:
         return wrapper
 
 
-def _jit(sigs, locals, target, cache, targetoptions):
+def _jit(sigs, locals, target, cache, background, targetoptions):
     dispatcher = registry.target_registry[target]
 
     def wrapper(func):
         if config.ENABLE_CUDASIM and target == 'cuda':
+            from . import cuda
             return cuda.jit(func)
         if config.DISABLE_JIT and not target == 'npyufunc':
             return DisableJitWrapper(func)
@@ -162,6 +172,8 @@ def _jit(sigs, locals, target, cache, targetoptions):
                           targetoptions=targetoptions)
         if cache:
             disp.enable_caching()
+        if background:
+            disp.enable_background_compilation()
         if sigs is not None:
             for sig in sigs:
                 disp.compile(sig)
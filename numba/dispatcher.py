@@ -8,22 +8,38 @@ import errno
 import hashlib
 import itertools
 import inspect
+import io
+import mmap
 import os
+import pkgutil
 from .six.moves import cPickle as pickle
 import struct
 import sys
+import tempfile
+import threading
+import time
 import warnings
+import zipfile
+
+import numpy as np
 
 import numba
-from numba import _dispatcher, compiler, utils, types
+from numba import (_dispatcher, compiler, config, looplifting, manifest,
+                   utils, types)
 from numba.typeconv.rules import default_type_manager
 from numba import sigutils, serialize, types, typing
 from numba.typing.templates import fold_arguments
 from numba.typing.typeof import typeof
-from numba.bytecode import get_code_object
+from numba.bytecode import ByteCode, get_code_object
 from numba.six import create_bound_method, next
+from numba.six.moves import queue
 from .config import NumbaWarning
 
+if config.IS_WIN32:
+    import msvcrt
+else:
+    import fcntl
+
 
 class _OverloadedBase(_dispatcher.Dispatcher):
     """
@@ -55,6 +71,7 @@ class _OverloadedBase(_dispatcher.Dispatcher):
             has_stararg = False
         else:
             has_stararg = lastarg.kind == lastarg.VAR_POSITIONAL
+        self._has_stararg = has_stararg
         _dispatcher.Dispatcher.__init__(self, self._tm.get_pointer(),
                                         arg_count, self._fold_args,
                                         argnames, defargs,
@@ -121,6 +138,17 @@ class _OverloadedBase(_dispatcher.Dispatcher):
         self.overloads[args] = cres.entry_point
         self._compileinfos[args] = cres
 
+    def _add_cached_overload(self, cres):
+        """
+        Add an overload loaded from the disk cache.
+        """
+        # XXX fold this in add_overload()? (also see compiler.py)
+        if not cres.objectmode and not cres.interpmode:
+            self.targetctx.insert_user_function(cres.entry_point,
+                                                cres.fndesc, [cres.library])
+        self.add_overload(cres)
+        return cres.entry_point
+
     def get_call_template(self, args, kws):
         """
         Get a typing.ConcreteTemplate for this dispatcher and the given
@@ -171,6 +199,19 @@ class _OverloadedBase(_dispatcher.Dispatcher):
         sig = tuple([self.typeof_pyval(a) for a in args])
         return self.compile(sig)
 
+    def get_compile_stats(self, signature=None):
+        """
+        Return the list of compiler pipeline stage statistics
+        (compiler.StageStats tuples) for the given *signature*, or a dict
+        of those for all signatures.  None is returned for overloads
+        loaded from the disk cache.
+        """
+        if signature is not None:
+            return self._compileinfos[signature].stage_stats
+
+        return dict((sig, self.get_compile_stats(sig))
+                    for sig in self.signatures)
+
     def inspect_llvm(self, signature=None):
         if signature is not None:
             lib = self._compileinfos[signature].library
@@ -284,11 +325,110 @@ class Overloaded(_OverloadedBase):
         self.targetoptions = targetoptions
         self.locals = locals
         self._cache = NullCache()
+        # The set of signatures queued for background compilation, or None
+        # if background compilation is disabled
+        self._background_pending = None
+        self._background_lock = threading.Lock()
 
         self.typingctx.insert_overloaded(self)
 
     def enable_caching(self):
-        self._cache = FunctionCache(self.py_func)
+        try:
+            cache_class = _cache_classes[config.CACHE_BACKEND]
+        except KeyError:
+            raise ValueError("invalid cache backend %r, expected one of %s"
+                             % (config.CACHE_BACKEND,
+                                sorted(_cache_classes)))
+        self._cache = cache_class(self.py_func)
+
+    def add_overload(self, cres):
+        super(Overloaded, self).add_overload(cres)
+        manifest.record_overload(self, tuple(cres.signature.args))
+
+    def enable_background_compilation(self):
+        """
+        Compile new signatures in a background thread.  Until a signature
+        is compiled, calls fall back on an existing overload if the
+        arguments can be safely converted, or else on the Python function.
+        """
+        self._background_pending = set()
+        self._background_pid = os.getpid()
+
+    def _compile_for_args(self, *args, **kws):
+        """
+        For internal use.  Compile a specialized version of the function
+        for the given *args* and *kws*, and return the resulting callable.
+        With background compilation, return a fallback callable instead.
+        """
+        assert not kws
+        sig = tuple([self.typeof_pyval(a) for a in args])
+        if self._background_pending is None:
+            return self.compile(sig)
+        # Look up the fallback first, so that its choice doesn't depend
+        # on how fast the background compilation goes
+        fallback = (self._find_compatible_overload(sig) or
+                    self._make_python_fallback())
+        if self._background_pid != os.getpid():
+            # Forked child: the parent's pending compilations will never
+            # complete here
+            self._background_lock = threading.Lock()
+            self._background_pending = set()
+            self._background_pid = os.getpid()
+        with self._background_lock:
+            if sig not in self._background_pending:
+                self._background_pending.add(sig)
+                _background_compiler.submit(self, sig)
+        return fallback
+
+    def _compile_in_background(self, sig):
+        """
+        Called by the background compiler thread.
+        """
+        try:
+            self.compile(sig)
+        except Exception as e:
+            # The signature stays pending, so that further calls keep
+            # using the fallback rather than retrying to compile.
+            msg = ("Background compilation of %s for argument types %s "
+                   "failed, falling back on the Python function: %s"
+                   % (self.py_func.__name__, sig, e))
+            warnings.warn(msg, NumbaWarning)
+        else:
+            with self._background_lock:
+                self._background_pending.discard(sig)
+
+    def _find_compatible_overload(self, sig):
+        """
+        Return the entry point of the best compiled overload accepting
+        argument types *sig* without unsafe conversions, or None.
+        """
+        best = None
+        # Take a copy, as overloads may be added concurrently
+        for cres in list(self._compileinfos.values()):
+            if cres.objectmode or cres.interpmode:
+                continue
+            rating = self.typingctx._rate_arguments(sig, cres.signature.args)
+            if rating is None or rating.unsafe_convert:
+                continue
+            if best is None or rating.astuple() < best[0]:
+                best = rating.astuple(), cres.entry_point
+        if best is not None:
+            return best[1]
+
+    def _make_python_fallback(self):
+        """
+        Return a callable running the Python function with the folded
+        arguments passed by the C dispatcher.
+        """
+        py_func = self.py_func
+        if not self._has_stararg:
+            return py_func
+
+        def fallback(*args):
+            # The C dispatcher packs star-args in a tuple as last argument
+            return py_func(*(args[:-1] + tuple(args[-1])))
+
+        return fallback
 
     def __get__(self, obj, objtype=None):
         '''Allow a JIT function to be bound as a method to an object'''
@@ -301,23 +441,55 @@ class Overloaded(_OverloadedBase):
         """
         Reduce the instance for pickling.  This will serialize
         the original function as well the compilation options and
-        compiled signatures, but not the compiled code itself.
+        compiled signatures.  The compiled code itself is only serialized
+        if NUMBA_PICKLE_OBJECT_CODE is enabled.
         """
         if self._can_compile:
             sigs = []
         else:
             sigs = [cr.signature for cr in self._compileinfos.values()]
+        if config.PICKLE_OBJECT_CODE:
+            compiled = self._reduce_compiled()
+        else:
+            compiled = None
         return (serialize._rebuild_reduction,
                 (self.__class__, serialize._reduce_function(self.py_func),
-                 self.locals, self.targetoptions, self._can_compile, sigs))
+                 self.locals, self.targetoptions, self._can_compile, sigs,
+                 compiled))
+
+    def _reduce_compiled(self):
+        """
+        Serialize the compiled overloads which can be reloaded in another
+        process, together with the codegen's magic tuple.
+        """
+        data = []
+        for cres in self._compileinfos.values():
+            if cres.lifted or cres.interpmode or cres.has_dynamic_globals:
+                continue
+            try:
+                data.append(pickle.dumps(cres._reduce(), protocol=-1))
+            except Exception:
+                # E.g. unpicklable constants in object mode; the
+                # signature will be compiled again when unpickling.
+                continue
+        return self.targetctx.codegen().magic_tuple(), data
 
     @classmethod
-    def _rebuild(cls, func_reduced, locals, targetoptions, can_compile, sigs):
+    def _rebuild(cls, func_reduced, locals, targetoptions, can_compile, sigs,
+                 compiled=None):
         """
         Rebuild an Overloaded instance after it was __reduce__'d.
         """
         py_func = serialize._rebuild_function(*func_reduced)
         self = cls(py_func, locals, targetoptions)
+        if compiled is not None:
+            magic_tuple, data = compiled
+            # The machine code is only usable on a compatible host
+            if magic_tuple == self.targetctx.codegen().magic_tuple():
+                for cres_data in data:
+                    cres = compiler.CompileResult._rebuild(
+                        self.targetctx, *pickle.loads(cres_data))
+                    self._add_cached_overload(cres)
         for sig in sigs:
             self.compile(sig)
         self._can_compile = can_compile
@@ -334,28 +506,34 @@ class Overloaded(_OverloadedBase):
             # Try to load from disk cache
             cres = self._cache.load_overload(sig, self.targetctx)
             if cres is not None:
-                # XXX fold this in add_overload()? (also see compiler.py)
-                if not cres.objectmode and not cres.interpmode:
-                    self.targetctx.insert_user_function(cres.entry_point,
-                                                   cres.fndesc, [cres.library])
-                self.add_overload(cres)
-                return cres.entry_point
+                return self._add_cached_overload(cres)
 
-            flags = compiler.Flags()
-            self.targetdescr.options.parse_as_flags(flags, self.targetoptions)
+            # Only let one process compile a given signature at a time:
+            # the others wait for it, then load the result from the cache.
+            with self._cache.lock_overload(sig, self.targetctx):
+                cres = self._cache.load_overload(sig, self.targetctx)
+                if cres is not None:
+                    return self._add_cached_overload(cres)
 
-            cres = compiler.compile_extra(self.typingctx, self.targetctx,
-                                          self.py_func,
-                                          args=args, return_type=return_type,
-                                          flags=flags, locals=self.locals)
+                flags = compiler.Flags()
+                self.targetdescr.options.parse_as_flags(flags,
+                                                        self.targetoptions)
 
-            # Check typing error if object mode is used
-            if cres.typing_error is not None and not flags.enable_pyobject:
-                raise cres.typing_error
+                cres = compiler.compile_extra(self.typingctx, self.targetctx,
+                                              self.py_func,
+                                              args=args,
+                                              return_type=return_type,
+                                              flags=flags, locals=self.locals)
 
-            self.add_overload(cres)
-            self._cache.save_overload(sig, cres)
-            return cres.entry_point
+                # Check typing error if object mode is used
+                if cres.typing_error is not None and not flags.enable_pyobject:
+                    raise cres.typing_error
+
+                self.add_overload(cres)
+                self._cache.save_overload(sig, cres)
+                for loop in cres.lifted:
+                    loop.enable_caching(self._cache)
+                return cres.entry_point
 
     def recompile(self):
         """
@@ -366,6 +544,11 @@ class Overloaded(_OverloadedBase):
         # types.  This has an effect on cache lookups...
         sigs = list(self.overloads)
         old_can_compile = self._can_compile
+        # The caches of lifted loops would otherwise be reused by the
+        # recompiled function.
+        for cres in self._compileinfos.values():
+            for loop in cres.lifted:
+                loop._cache.flush()
         # Ensure the old overloads are disposed of, including compiled functions.
         self._make_finalizer()()
         self._reset_overloads()
@@ -396,12 +579,27 @@ class LiftedLoop(_OverloadedBase):
         self.flags = flags
         self.bytecode = bytecode
         self.lifted_from = None
+        self._cache = NullCache()
+
+    def enable_caching(self, parent_cache):
+        """
+        Enable caching, alongside the *parent_cache* of the function
+        this loop was lifted from.
+        """
+        self._cache = parent_cache.make_lifted_loop_cache(self.loop_offset)
 
     def get_source_location(self):
         """Return the starting line number of the loop.
         """
         return next(iter(self.bytecode)).lineno
 
+    @property
+    def loop_offset(self):
+        """
+        The bytecode offset of the loop in the function it was lifted from.
+        """
+        return next(iter(self.bytecode)).offset
+
     def compile(self, sig):
         with self._compile_lock:
             # FIXME this is mostly duplicated from Overloaded
@@ -412,7 +610,12 @@ class LiftedLoop(_OverloadedBase):
             # (e.g. if another thread compiled it before we got the lock)
             existing = self.overloads.get(tuple(args))
             if existing is not None:
-                return existing.entry_point
+                return existing
+
+            # Try to load from disk cache
+            cres = self._cache.load_overload(sig, self.targetctx)
+            if cres is not None:
+                return self._add_cached_overload(cres)
 
             assert not flags.enable_looplift, "Enable looplift flags is on"
             cres = compiler.compile_bytecode(typingctx=self.typingctx,
@@ -429,9 +632,72 @@ class LiftedLoop(_OverloadedBase):
                 raise cres.typing_error
 
             self.add_overload(cres)
+            self._cache.save_overload(sig, cres)
             return cres.entry_point
 
 
+class _BackgroundCompiler(object):
+    """
+    A pool of daemon threads compiling signatures queued by dispatchers
+    with background compilation enabled.  Threads are started lazily.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._queue = queue.Queue()
+        self._threads = []
+        self._lock = threading.Lock()
+        self._pid = os.getpid()
+
+    def _check_fork(self):
+        # A forked child inherits the parent's queue and thread list, but
+        # not the threads themselves: start afresh.
+        if self._pid != os.getpid():
+            self._reset()
+
+    def submit(self, dispatcher, sig):
+        self._check_fork()
+        with self._lock:
+            if not self._threads:
+                for i in range(max(config.BACKGROUND_COMPILE_THREADS, 1)):
+                    t = threading.Thread(target=self._run,
+                                         name="numba-background-compiler")
+                    t.daemon = True
+                    t.start()
+                    self._threads.append(t)
+        self._queue.put((dispatcher, sig))
+
+    def wait(self):
+        """
+        Wait for all queued compilations to finish.
+        """
+        self._check_fork()
+        self._queue.join()
+
+    def _run(self):
+        while True:
+            dispatcher, sig = self._queue.get()
+            try:
+                dispatcher._compile_in_background(sig)
+            finally:
+                # Don't keep the dispatcher alive while idle
+                del dispatcher
+                self._queue.task_done()
+
+
+_background_compiler = _BackgroundCompiler()
+
+
+def wait_background_compilation():
+    """
+    Wait until all signatures queued for background compilation
+    (see the ``background`` option to jit()) are compiled.
+    """
+    _background_compiler.wait()
+
+
 # Initialize typeof machinery
 _dispatcher.typeof_init(dict((str(t), t._code) for t in types.number_domain))
 
@@ -453,12 +719,257 @@ class NullCache(object):
     def flush(self):
         pass
 
+    @contextlib.contextmanager
+    def lock_overload(self, sig, target_context):
+        yield
+
+    def make_lifted_loop_cache(self, loop_offset):
+        return self
+
+
+class _InterProcessLock(object):
+    """
+    An advisory lock shared between processes, held on a single byte
+    at *offset* in the lock file at *path*, so that a single lock file
+    can serve many independent locks.  Acquiring polls the lock until
+    *timeout* seconds have elapsed, after which the caller proceeds
+    without holding it (e.g. if the holder is stuck).
+
+    The lock also excludes the other threads of the process.
+    """
+
+    # Record locks belong to the process, and closing any descriptor of
+    # the file releases all of them: the threads of the process share a
+    # single descriptor per lock file, as { path: [fd, number of users] }.
+    _files = {}
+    # Record locks don't exclude the threads of the process from each
+    # other: they first take a { (path, offset): threading.Lock }.
+    _thread_locks = {}
+    # Protects the above, and the file position used by msvcrt.locking()
+    _registry_lock = threading.Lock()
+    _pid = os.getpid()
+    # Lock files which can't be locked (e.g. ENOLCK on NFS), warned
+    # about once
+    _unlockable_paths = set()
+
+    def __init__(self, path, offset, timeout):
+        self._path = path
+        self._offset = offset
+        self._timeout = timeout
+        self._fd = None
+        self._thread_lock = None
+        self._locked = False
+
+    @classmethod
+    def _check_fork(cls):
+        # The parent's threads and record locks don't exist in a
+        # forked child
+        if cls._pid != os.getpid():
+            cls._files = {}
+            cls._thread_locks = {}
+            cls._pid = os.getpid()
+
+    def _poll(self, try_acquire, deadline):
+        delay = 0.001
+        while not try_acquire():
+            if time.time() >= deadline:
+                return False
+            time.sleep(delay)
+            delay = min(delay * 2, 0.1)
+        return True
+
+    def __enter__(self):
+        deadline = time.time() + self._timeout
+        cls = type(self)
+        with cls._registry_lock:
+            cls._check_fork()
+            thread_lock = cls._thread_locks.setdefault(
+                (self._path, self._offset), threading.Lock())
+        if not self._poll(lambda: thread_lock.acquire(False), deadline):
+            # Another thread is stuck holding the lock, go on unprotected
+            return self
+        self._thread_lock = thread_lock
+        with cls._registry_lock:
+            entry = cls._files.get(self._path)
+            if entry is None:
+                try:
+                    fd = os.open(self._path, os.O_RDWR | os.O_CREAT)
+                except EnvironmentError:
+                    # Can't create the lock file, go on unprotected
+                    return self
+                entry = cls._files[self._path] = [fd, 0]
+            entry[1] += 1
+            self._fd = entry[0]
+
+        def try_lock():
+            with cls._registry_lock:
+                return self._try_lock()
+
+        try:
+            self._locked = self._poll(try_lock, deadline)
+        except EnvironmentError as e:
+            # Locking isn't supported here, go on unprotected
+            self._warn_unlockable(e)
+        return self
+
+    def _warn_unlockable(self, exc):
+        cls = type(self)
+        with cls._registry_lock:
+            if self._path in cls._unlockable_paths:
+                return
+            cls._unlockable_paths.add(self._path)
+        warnings.warn("Cannot lock %r, proceeding without the lock: %s"
+                      % (self._path, exc), NumbaWarning)
+
+    def __exit__(self, *exc_info):
+        cls = type(self)
+        try:
+            if self._fd is not None:
+                with cls._registry_lock:
+                    try:
+                        if self._locked:
+                            self._unlock()
+                            self._locked = False
+                    finally:
+                        entry = cls._files.get(self._path)
+                        if entry is None or entry[0] != self._fd:
+                            # Forked while holding the lock
+                            os.close(self._fd)
+                        else:
+                            entry[1] -= 1
+                            if entry[1] == 0:
+                                del cls._files[self._path]
+                                os.close(entry[0])
+                        self._fd = None
+        finally:
+            if self._thread_lock is not None:
+                self._thread_lock.release()
+                self._thread_lock = None
+
+    if config.IS_WIN32:
+        def _try_lock(self):
+            os.lseek(self._fd, self._offset, os.SEEK_SET)
+            try:
+                msvcrt.locking(self._fd, msvcrt.LK_NBLCK, 1)
+            except EnvironmentError:
+                return False
+            return True
+
+        def _unlock(self):
+            os.lseek(self._fd, self._offset, os.SEEK_SET)
+            msvcrt.locking(self._fd, msvcrt.LK_UNLCK, 1)
+
+    else:
+        def _try_lock(self):
+            try:
+                fcntl.lockf(self._fd, fcntl.LOCK_EX | fcntl.LOCK_NB, 1,
+                            self._offset)
+            except EnvironmentError as e:
+                if e.errno not in (errno.EACCES, errno.EAGAIN):
+                    raise
+                return False
+            return True
+
+        def _unlock(self):
+            fcntl.lockf(self._fd, fcntl.LOCK_UN, 1, self._offset)
+
+
+def _ensure_dir(path):
+    """
+    Create directory *path* and its parents, if it doesn't exist already.
+    """
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+
+
+@contextlib.contextmanager
+def _open_for_write(filepath):
+    """
+    Open *filepath* for writing in a race condition-free way
+    (hopefully).
+    """
+    tmpname = '%s.tmp.%d' % (filepath, os.getpid())
+    try:
+        with open(tmpname, "wb") as f:
+            yield f
+        utils.file_replace(tmpname, filepath)
+    except Exception:
+        # In case of error, remove dangling tmp file
+        try:
+            os.unlink(tmpname)
+        except OSError:
+            pass
+        raise
+
+
+def _is_writable_dir(path):
+    """
+    Whether directory *path* seems writable, or could be created if it
+    doesn't exist yet.  Nothing is written to the filesystem; see
+    _CacheLocator.ensure_cache_path() for the actual check.
+    """
+    while not os.path.isdir(path):
+        parent = os.path.dirname(path)
+        if parent == path:
+            return False
+        path = parent
+    return os.access(path, os.W_OK)
+
+
+def _get_user_cache_dir():
+    """
+    Return the user-wide cache directory for Numba.
+    """
+    if config.IS_WIN32:
+        base = os.environ.get('LOCALAPPDATA') or os.path.expanduser('~')
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser(os.path.join('~', 'Library', 'Caches'))
+    else:
+        base = (os.environ.get('XDG_CACHE_HOME') or
+                os.path.expanduser(os.path.join('~', '.cache')))
+    return os.path.join(base, 'numba')
+
+
+def _get_cache_subpath(modname, py_file):
+    """
+    Return the path, relative to a cache root, of the cache directory for
+    functions of module *modname* defined in *py_file*.  Modules of
+    a package share the same directory, like in ``__pycache__`` layouts.
+    """
+    if not modname or modname == '__main__':
+        # A script: fall back on its absolute location
+        dirname = os.path.dirname(os.path.abspath(py_file))
+        drive, dirname = os.path.splitdrive(dirname)
+        return os.path.join('__main__', dirname.lstrip(os.sep))
+    parts = modname.split('.')
+    if os.path.splitext(os.path.basename(py_file))[0] != '__init__':
+        parts = parts[:-1]
+    return os.path.join(*parts) if parts else ''
+
 
 class _CacheLocator(object):
 
+    # Whether cache files can only be loaded from this locator
+    readonly = False
+
     def get_cache_path(self):
         raise NotImplementedError
 
+    def ensure_cache_path(self):
+        """
+        Create the cache directory if necessary and check that cache
+        files can be written in it, raising EnvironmentError otherwise.
+        """
+        path = self.get_cache_path()
+        _ensure_dir(path)
+        # os.access() can't be trusted everywhere (e.g. network
+        # filesystems or ACLs), so try creating a file
+        with tempfile.TemporaryFile(dir=path):
+            pass
+
     def get_source_stamp(self):
         raise NotImplementedError
 
@@ -472,7 +983,8 @@ class _CacheLocator(object):
 
 class _SourceCacheLocator(_CacheLocator):
     """
-    A locator for functions backed by a regular Python module.
+    A locator for functions backed by a regular Python module, caching
+    in the ``__pycache__`` directory next to the source file.
     """
 
     def __init__(self, py_func, py_file):
@@ -480,9 +992,6 @@ class _SourceCacheLocator(_CacheLocator):
         self._lineno = py_func.__code__.co_firstlineno
 
     def get_cache_path(self):
-        # NOTE: this assumes the __pycache__ directory is writable, which
-        # is false for system installs, but true for conda environments
-        # and local work directories.
         return os.path.join(os.path.dirname(self._py_file), '__pycache__')
 
     def get_source_stamp(self):
@@ -499,9 +1008,70 @@ class _SourceCacheLocator(_CacheLocator):
         if not os.path.exists(py_file):
             # Perhaps a placeholder (e.g. "<ipython-XXX>")
             return
+        self = cls(py_func, py_file)
+        path = self.get_cache_path()
+        if not _is_writable_dir(path):
+            # E.g. a system install or a read-only image: cache files
+            # installed there beforehand (see import_cache_bundle()) can
+            # still be loaded, but new ones are saved elsewhere.
+            if not (os.path.isdir(path) and
+                    os.access(path, os.R_OK | os.X_OK)):
+                return
+            self.readonly = True
+        return self
+
+
+class _CacheRootLocator(_SourceCacheLocator):
+    """
+    A base class for locators of functions backed by a regular Python
+    module, caching in a tree rooted at a given directory.  The tree
+    mirrors the package hierarchy, so that it can be relocated and
+    does not depend on where the source files are installed.
+    """
+
+    def __init__(self, py_func, py_file):
+        _SourceCacheLocator.__init__(self, py_func, py_file)
+        self._subpath = _get_cache_subpath(py_func.__module__, py_file)
+
+    def get_cache_root(self):
+        raise NotImplementedError
+
+    def get_cache_path(self):
+        return os.path.join(self.get_cache_root(), self._subpath)
+
+    @classmethod
+    def from_function(cls, py_func, py_file):
+        if not os.path.exists(py_file):
+            return
         return cls(py_func, py_file)
 
 
+class _UserProvidedCacheLocator(_CacheRootLocator):
+    """
+    A locator caching in the directory given by NUMBA_CACHE_DIR.
+    """
+
+    def get_cache_root(self):
+        return config.CACHE_DIR
+
+    @classmethod
+    def from_function(cls, py_func, py_file):
+        if not config.CACHE_DIR:
+            return
+        return super(_UserProvidedCacheLocator, cls).from_function(py_func,
+                                                                   py_file)
+
+
+class _UserWideCacheLocator(_CacheRootLocator):
+    """
+    A locator caching in a user-wide directory, used as a fallback when
+    the source file's ``__pycache__`` directory isn't writable.
+    """
+
+    def get_cache_root(self):
+        return _get_user_cache_dir()
+
+
 class _IPythonCacheLocator(_CacheLocator):
     """
     A locator for functions entered at the IPython prompt (notebook or other).
@@ -548,6 +1118,189 @@ class _IPythonCacheLocator(_CacheLocator):
         return cls(py_func, py_file)
 
 
+# Types of values which can be folded into a cache key
+_constant_types = (bool, float, complex, str, bytes,
+                   type(None)) + utils.INT_TYPES
+
+
+def _is_constant(value):
+    if isinstance(value, (tuple, frozenset)):
+        return all(_is_constant(v) for v in value)
+    return isinstance(value, _constant_types)
+
+
+def _update_hash(h, *values):
+    """
+    Update hash object *h* with *values*, unambiguously delimited.
+    """
+    for v in values:
+        if not isinstance(v, bytes):
+            v = str(v).encode('utf-8')
+        h.update(struct.pack('<Q', len(v)))
+        h.update(v)
+
+
+def _hash_constant(h, value):
+    """
+    Update hash object *h* with constant *value* (see _is_constant()).
+    Unlike repr(), this doesn't depend on the iteration order of sets,
+    which varies with the string hash seed across processes.
+    """
+    if isinstance(value, tuple):
+        _update_hash(h, 'tuple', len(value))
+        for item in value:
+            _hash_constant(h, item)
+    elif isinstance(value, frozenset):
+        digests = []
+        for item in value:
+            item_hash = hashlib.sha256()
+            _hash_constant(item_hash, item)
+            digests.append(item_hash.digest())
+        _update_hash(h, 'frozenset', len(value), *sorted(digests))
+    else:
+        _update_hash(h, type(value).__name__, repr(value))
+
+
+def _get_closure_constants(py_func):
+    """
+    Return a tuple of the values of *py_func*'s free variables if they
+    are all simple constants (see _constant_types), otherwise None.
+    """
+    values = []
+    for cell in py_func.__closure__ or ():
+        try:
+            value = cell.cell_contents
+        except ValueError:
+            # Empty cell
+            return None
+        if not _is_constant(value):
+            return None
+        values.append(value)
+    return tuple(values)
+
+
+class _UnhashableValue(Exception):
+    """
+    Raised by _ContentHasher for a value whose contents can't be hashed
+    reliably across processes.
+    """
+
+
+class _ContentHasher(object):
+    """
+    Compute a stamp for a Python function from the contents of its code
+    object (bytecode, constants, names, default arguments) and from the
+    global values it refers to, which Numba freezes at compile time.
+    Other dispatchers called by the function are hashed recursively.
+
+    Unlike the source stamp, this is stable across reinstallations of
+    identical code, so cache entries can be reused across deployments.
+    If the function refers to a value which can't be hashed reliably
+    (e.g. an arbitrary object), _UnhashableValue is raised.
+    """
+
+    def __init__(self, py_func):
+        self._py_func = py_func
+
+    def compute(self):
+        h = hashlib.sha256()
+        self._hash_function(h, self._py_func, set())
+        return h.hexdigest()
+
+    def _update(self, h, *values):
+        _update_hash(h, *values)
+
+    def _hash_function(self, h, func, seen):
+        if id(func) in seen:
+            # Recursive call chain
+            self._update(h, 'recursive', func.__name__)
+            return
+        seen.add(id(func))
+        code = get_code_object(func)
+        names = set()
+        self._hash_code(h, code, names)
+        for value in func.__defaults__ or ():
+            self._hash_value(h, value, seen)
+        for cell in func.__closure__ or ():
+            try:
+                value = cell.cell_contents
+            except ValueError:
+                # Empty cell
+                self._update(h, 'empty cell')
+            else:
+                self._hash_value(h, value, seen)
+        globs = func.__globals__
+        for name in sorted(names):
+            try:
+                value = globs[name]
+            except KeyError:
+                # Builtin or unresolved name: the name itself is hashed
+                # as part of the code object.
+                continue
+            self._update(h, 'global', name)
+            self._hash_value(h, value, seen)
+
+    def _hash_code(self, h, code, names):
+        self._update(h, code.co_code, code.co_argcount, code.co_flags,
+                     code.co_names, code.co_varnames, code.co_freevars,
+                     code.co_cellvars)
+        names.update(code.co_names)
+        for const in code.co_consts:
+            if inspect.iscode(const):
+                self._hash_code(h, const, names)
+            elif const is Ellipsis:
+                self._update(h, 'ellipsis')
+            else:
+                # E.g. a frozenset for "x in ('a', 'b')" on Python 3
+                self._hash_value(h, const, set())
+
+    def _hash_items(self, h, kind, items, seen):
+        """
+        Hash the unordered collection *items*, independently of its
+        iteration order.
+        """
+        digests = []
+        for item in items:
+            item_hash = hashlib.sha256()
+            self._hash_value(item_hash, item, seen)
+            digests.append(item_hash.digest())
+        self._update(h, kind, len(digests), *sorted(digests))
+
+    def _hash_value(self, h, value, seen):
+        if isinstance(value, _OverloadedBase):
+            self._update(h, 'dispatcher', type(value).__name__)
+            self._hash_function(h, value.py_func, seen)
+        elif isinstance(value, _constant_types):
+            self._update(h, type(value).__name__, repr(value))
+        elif isinstance(value, (tuple, list)):
+            self._update(h, type(value).__name__, len(value))
+            for item in value:
+                self._hash_value(h, item, seen)
+        elif isinstance(value, (set, frozenset)):
+            self._hash_items(h, type(value).__name__, value, seen)
+        elif isinstance(value, dict):
+            self._hash_items(h, 'dict', value.items(), seen)
+        elif inspect.ismodule(value):
+            self._update(h, 'module', value.__name__)
+        elif (inspect.isfunction(value) or inspect.isclass(value) or
+              inspect.isbuiltin(value)):
+            self._update(h, type(value).__name__, value.__module__,
+                         getattr(value, '__qualname__', value.__name__))
+        elif isinstance(value, np.ufunc):
+            self._update(h, 'ufunc', value.__name__)
+        elif isinstance(value, np.dtype):
+            self._update(h, 'dtype', repr(value))
+        elif isinstance(value, (np.ndarray, np.generic)):
+            if value.dtype.hasobject:
+                raise _UnhashableValue(value)
+            self._update(h, type(value).__name__, repr(value.dtype),
+                         value.shape, value.tobytes())
+        else:
+            # The repr() of arbitrary objects may include their address,
+            # or otherwise not reflect their contents
+            raise _UnhashableValue(value)
+
+
 class FunctionCache(object):
     """
     A per-function compilation cache.  The cache saves data in separate
@@ -556,8 +1309,10 @@ class FunctionCache(object):
     There is one index file per function and Python version
     ("function_name-<lineno>.pyXY.nbi") which contains a mapping of
     signatures and architectures to data files.
-    It is prefixed by a versioning key and a timestamp of the Python source
-    file containing the function.
+    It is prefixed by a versioning key and a freshness stamp: by default
+    a timestamp of the Python source file containing the function, or
+    a hash of the function's contents if NUMBA_CACHE_INVALIDATION is set
+    to "content".
 
     There is one data file ("function_name-<lineno>.pyXY.<number>.nbc")
     per function, function signature, target architecture and Python version.
@@ -567,9 +1322,18 @@ class FunctionCache(object):
     """
 
     _source_stamp = None
-    _locator_classes = [_SourceCacheLocator, _IPythonCacheLocator]
+    _locator_classes = [_UserProvidedCacheLocator,
+                        _SourceCacheLocator,
+                        _UserWideCacheLocator,
+                        _IPythonCacheLocator]
 
-    def __init__(self, py_func):
+    _invalidation_modes = ('stamp', 'content')
+
+    # A single lock file per cache directory, with one byte per lock
+    _lock_name = 'compile.lock'
+    _lock_range = 1 << 24
+
+    def __init__(self, py_func, loop_offset=None):
         try:
             qualname = py_func.__qualname__
         except AttributeError:
@@ -577,34 +1341,66 @@ class FunctionCache(object):
         # Keep the last dotted component, since the package name is already
         # encoded in the directory.
         modname = py_func.__module__.split('.')[-1]
+        self._py_func = py_func
+        self._modname = modname
         self._funcname = qualname.split('.')[-1]
         self._fullname = "%s.%s" % (modname, qualname)
-        self._is_closure = bool(py_func.__closure__)
+        if loop_offset is not None:
+            # The cache of a loop lifted from the function (see LiftedLoop)
+            self._fullname += ".__numba__loop%d__" % (loop_offset,)
+        # Closures can only be cached if their free variables are constants,
+        # which get folded into the cache key.
+        self._closure_constants = _get_closure_constants(py_func)
         self._lineno = py_func.__code__.co_firstlineno
         abiflags = getattr(sys, 'abiflags', '')
 
-        # Find a locator
+        # Find the available locators; the first writable one is used
+        # unless its cache directory turns out not to be writable when
+        # saving.  Read-only locators are only looked up when loading.
         self._source_path = inspect.getfile(py_func)
+        self._locators = []
+        self._readonly_paths = []
         for cls in self._locator_classes:
-            self._locator = cls.from_function(py_func, self._source_path)
-            if self._locator is not None:
-                break
-        else:
+            locator = cls.from_function(py_func, self._source_path)
+            if locator is None:
+                continue
+            if locator.readonly:
+                self._readonly_paths.append(locator.get_cache_path())
+            else:
+                self._locators.append(locator)
+        if not self._locators:
             raise RuntimeError("cannot cache function %r: no locator available "
                                "for file %r" % (qualname, self._source_path))
-        self._cache_path = self._locator.get_cache_path()
+        self._locator = self._locators[0]
+        self._cache_path_checked = False
+
+        invalidation = config.CACHE_INVALIDATION
+        if invalidation not in self._invalidation_modes:
+            raise ValueError("invalid cache invalidation mode %r, "
+                             "expected one of %s"
+                             % (invalidation, self._invalidation_modes))
+        if invalidation == 'content':
+            self._content_hasher = _ContentHasher(py_func)
+        else:
+            self._content_hasher = None
 
         # '<' and '>' can appear in the qualname (e.g. '<locals>') but
         # are forbidden in Windows filenames
         fixed_fullname = self._fullname.replace('<', '').replace('>', '')
+        disambiguator = self._locator.get_disambiguator()
+        if self._closure_constants:
+            closure_hash = hashlib.sha256()
+            _hash_constant(closure_hash, self._closure_constants)
+            disambiguator += '-' + closure_hash.hexdigest()[:10]
         filename_base = (
-            '%s-%s.py%d%d%s' % (fixed_fullname, self._locator.get_disambiguator(),
+            '%s-%s.py%d%d%s' % (fixed_fullname, disambiguator,
                                 sys.version_info[0], sys.version_info[1],
                                 abiflags)
             )
+        self._filename_base = filename_base
         self._index_name = '%s.nbi' % (filename_base,)
-        self._index_path = os.path.join(self._cache_path, self._index_name)
         self._data_name_pattern = '%s.{number:d}.nbc' % (filename_base,)
+        self._set_locator(self._locator)
 
         self.enable()
 
@@ -615,7 +1411,12 @@ class FunctionCache(object):
         self._enabled = True
         # This may be a bit strict but avoids us maintaining a magic number
         self._version = numba.__version__
-        self._source_stamp = self._locator.get_source_stamp()
+        self._unhashable_type = None
+        if self._content_hasher is not None:
+            # Computed on first access, see _ensure_source_stamp()
+            self._source_stamp = None
+        else:
+            self._source_stamp = self._locator.get_source_stamp()
 
     def disable(self):
         self._enabled = False
@@ -623,20 +1424,84 @@ class FunctionCache(object):
     def flush(self):
         self._save_index({})
 
+    def make_lifted_loop_cache(self, loop_offset):
+        """
+        Return a cache for the loop lifted at *loop_offset* from this
+        cache's function.
+        """
+        cache = type(self)(self._py_func, loop_offset=loop_offset)
+        if not self._enabled:
+            cache.disable()
+        return cache
+
+    def _set_locator(self, locator):
+        self._locator = locator
+        self._cache_path = locator.get_cache_path()
+        self._index_path = os.path.join(self._cache_path, self._index_name)
+
+    def _ensure_cache_path(self):
+        """
+        Make sure cache files can be written, falling back on the next
+        available locator if necessary.  This is only checked when first
+        writing, so as to not touch the filesystem when merely decorating
+        or loading.
+        """
+        if self._cache_path_checked:
+            return
+        while True:
+            try:
+                self._locator.ensure_cache_path()
+            except EnvironmentError:
+                index = self._locators.index(self._locator) + 1
+                if index == len(self._locators):
+                    raise
+                self._set_locator(self._locators[index])
+            else:
+                break
+        self._cache_path_checked = True
+
+    def _ensure_source_stamp(self):
+        """
+        Content hashes depend on global values which may be defined
+        after the function, so they are computed on first access rather
+        than when the cache is enabled.  The recursive hash is expensive,
+        so it is then kept for the lifetime of the cache.
+
+        Return whether a stamp is available: it isn't if the function
+        refers to a value which can't be hashed (see _check_cachable()).
+        """
+        if self._source_stamp is None and self._unhashable_type is None:
+            try:
+                self._source_stamp = self._content_hasher.compute()
+            except _UnhashableValue as e:
+                self._unhashable_type = type(e.args[0]).__name__
+        return self._source_stamp is not None
+
     def load_overload(self, sig, target_context):
         """
         Load and recreate the cached CompileResult for the given signature,
         using the *target_context*.
         """
-        if not self._enabled:
+        if not self._enabled or not self._ensure_source_stamp():
             return
-        overloads = self._load_index()
         key = self._index_key(sig, target_context.codegen())
-        data_name = overloads.get(key)
+        for cache_path in [self._cache_path] + self._readonly_paths:
+            cres = self._load_from(cache_path, key, target_context)
+            if cres is not None:
+                return cres
+
+    def _load_from(self, cache_path, key, target_context):
+        """
+        Load the CompileResult for index *key* from the cache files in
+        directory *cache_path*, or return None.
+        """
+        index_path = os.path.join(cache_path, self._index_name)
+        data_name = self._load_index(index_path).get(key)
         if data_name is None:
             return
         try:
-            return self._load_data(data_name, target_context)
+            return self._load_data(os.path.join(cache_path, data_name),
+                                   target_context)
         except EnvironmentError:
             # File could have been removed while the index still refers it.
             return
@@ -649,12 +1514,8 @@ class FunctionCache(object):
             return
         if not self._check_cachable(cres):
             return
-        try:
-            os.mkdir(self._cache_path)
-        except OSError as e:
-            if e.errno != errno.EEXIST:
-                raise
-        overloads = self._load_index()
+        self._ensure_cache_path()
+        overloads = self._load_index(self._index_path)
         key = self._index_key(sig, cres.library.codegen)
         try:
             # If key already exists, we will overwrite the file
@@ -671,17 +1532,38 @@ class FunctionCache(object):
 
         self._save_data(data_name, cres)
 
+    def lock_overload(self, sig, target_context):
+        """
+        Return a context manager holding an inter-process lock for
+        compiling and saving the given signature.
+        """
+        if not self._enabled or config.CACHE_LOCK_TIMEOUT <= 0:
+            return NullCache().lock_overload(sig, target_context)
+        try:
+            self._ensure_cache_path()
+        except EnvironmentError:
+            pass
+        key = (self._filename_base,
+               self._index_key(sig, target_context.codegen()))
+        digest = hashlib.sha256(str(key).encode('utf-8')).hexdigest()
+        offset = int(digest[:8], 16) % self._lock_range
+        return _InterProcessLock(os.path.join(self._cache_path,
+                                              self._lock_name),
+                                 offset, config.CACHE_LOCK_TIMEOUT)
+
     def _check_cachable(self, cres):
         """
         Check cachability of the given compile result.
         """
         cannot_cache = None
-        if self._is_closure:
-            cannot_cache = "as it uses outer variables in a closure"
-        elif cres.lifted:
-            cannot_cache = "as it uses lifted loops"
+        if self._closure_constants is None:
+            cannot_cache = "as it uses non-constant outer variables in a closure"
         elif cres.has_dynamic_globals:
             cannot_cache = "as it uses dynamic globals (such as ctypes pointers)"
+        elif not self._ensure_source_stamp():
+            cannot_cache = ("as it refers to a value which can't be hashed "
+                            "for content invalidation (%s object)"
+                            % (self._unhashable_type,))
         if cannot_cache:
             msg = ('Cannot cache compiled function "%s" %s'
                    % (self._funcname, cannot_cache))
@@ -703,32 +1585,16 @@ class FunctionCache(object):
     def _data_path(self, name):
         return os.path.join(self._cache_path, name)
 
-    @contextlib.contextmanager
     def _open_for_write(self, filepath):
-        """
-        Open *filepath* for writing in a race condition-free way
-        (hopefully).
-        """
-        tmpname = '%s.tmp.%d' % (filepath, os.getpid())
-        try:
-            with open(tmpname, "wb") as f:
-                yield f
-            utils.file_replace(tmpname, filepath)
-        except Exception:
-            # In case of error, remove dangling tmp file
-            try:
-                os.unlink(tmpname)
-            except OSError:
-                pass
-            raise
+        return _open_for_write(filepath)
 
-    def _load_index(self):
+    def _load_index(self, index_path):
         """
-        Load the cache index and return it as a dictionary (possibly
-        empty if cache is empty or obsolete).
+        Load the cache index at *index_path* and return it as a dictionary
+        (possibly empty if cache is empty or obsolete).
         """
         try:
-            with open(self._index_path, "rb") as f:
+            with open(index_path, "rb") as f:
                 version = pickle.load(f)
                 data = f.read()
         except EnvironmentError as e:
@@ -748,11 +1614,10 @@ class FunctionCache(object):
         else:
             return overloads
 
-    def _load_data(self, name, target_context):
-        with open(self._data_path(name), "rb") as f:
+    def _load_data(self, data_path, target_context):
+        with open(data_path, "rb") as f:
             data = f.read()
-        tup = pickle.loads(data)
-        return compiler.CompileResult._rebuild(target_context, *tup)
+        return self._load_result(data, target_context)
 
     def _save_index(self, overloads):
         data = self._source_stamp, overloads
@@ -762,10 +1627,565 @@ class FunctionCache(object):
             f.write(data)
 
     def _save_data(self, name, cres):
-        data = cres._reduce()
-        data = self._dump(data)
+        data = self._dump_result(cres)
         with self._open_for_write(self._data_path(name)) as f:
             f.write(data)
 
     def _dump(self, obj):
         return pickle.dumps(obj, protocol=-1)
+
+    def _dump_result(self, cres):
+        """
+        Serialize the CompileResult *cres*.  The dispatchers of lifted
+        loops are serialized by reference and recreated when loading.
+        """
+        def persistent_id(obj):
+            if isinstance(obj, LiftedLoop):
+                return ('LiftedLoop', obj.loop_offset, obj.flags._values,
+                        obj.locals)
+
+        buf = io.BytesIO()
+        pickler = pickle.Pickler(buf, -1)
+        pickler.persistent_id = persistent_id
+        pickler.dump(cres._reduce())
+        return buf.getvalue()
+
+    def _load_result(self, data, target_context):
+        """
+        Recreate a CompileResult from _dump_result() output *data*.
+        """
+        loops = {}
+
+        def persistent_load(pid):
+            kind, loop_offset, flag_values, locals = pid
+            if kind != 'LiftedLoop':
+                raise pickle.UnpicklingError("unsupported persistent id %r"
+                                             % (pid,))
+            if not loops:
+                loops.update(self._lift_loops(target_context,
+                                              flag_values, locals))
+            return loops[loop_offset]
+
+        unpickler = pickle.Unpickler(io.BytesIO(data))
+        unpickler.persistent_load = persistent_load
+        tup = unpickler.load()
+        return compiler.CompileResult._rebuild(target_context, *tup)
+
+    def _lift_loops(self, target_context, flag_values, locals):
+        """
+        Lift the loops of the cache's function again, as the compiler
+        pipeline does, and return a dict mapping loop offsets to new
+        LiftedLoop dispatchers.  These are cached alongside this cache.
+        """
+        flags = compiler.Flags()
+        for name, value in flag_values.items():
+            flags.set(name, value)
+
+        def dispatcher_factory(loopbc):
+            return LiftedLoop(loopbc, target_context.typing_context,
+                              target_context, locals, flags)
+
+        bc = ByteCode(func=self._py_func)
+        _, loops = looplifting.lift_loop(bc, dispatcher_factory)
+        for loop in loops:
+            loop.enable_caching(self)
+        return dict((loop.loop_offset, loop) for loop in loops)
+
+
+class _CacheArchive(object):
+    """
+    A single-file archive holding the cached overloads of all functions
+    of a module.  The file is made of a header, an index of fixed-size
+    records sorted by key and the pickled data of the indexed entries,
+    followed by a log of entries appended since, each made of a record
+    and its data.  Loading memory-maps the file and finds the entry in
+    the log (the latest record wins) or by binary search in the index,
+    without unpickling the whole index.
+
+    Each index record contains:
+    - the function id and entry key digests (the sort key)
+    - a digest of the freshness stamp, so that stale entries never match
+    - the offset and size of the entry's data
+    - the time the entry was last loaded or saved
+
+    Saving appends the entry to the log.  The archive is compacted, i.e.
+    rewritten atomically without superseded entries and stale entries of
+    the saved function, once the dead space exceeds the live data, once
+    the log grows longer than the sorted index, or if *max_size* is
+    non-zero and the archive would grow larger than *max_size* bytes;
+    in the latter case the least recently loaded entries are evicted,
+    and entries larger than *max_size* on their own are never saved.
+    Saves from several threads or processes are serialized by a lock
+    file next to the archive, so that they don't drop each other's
+    entries.
+    """
+
+    _magic = b'NUMBAARC'
+    _format_version = 2
+    # Magic, format version, number of sorted index records, log offset
+    _header = struct.Struct('<8sIIQ')
+    _record = struct.Struct('<16s16s16sQQd')
+    _key_size = 32
+    _access_time = struct.Struct('<d')
+    # Minimum number of log entries before the log alone triggers
+    # a compaction
+    _min_log_entries = 64
+    # Maximum time in seconds to wait for another writer
+    _lock_timeout = 60
+
+    def __init__(self, path, max_size=0):
+        self._path = path
+        self._max_size = max_size
+
+    def _write_lock(self):
+        """
+        Return a lock to hold while reading and updating the archive.
+        """
+        return _InterProcessLock(self._path + '.lock', 0, self._lock_timeout)
+
+    def __repr__(self):
+        return "<%s path=%r>" % (self.__class__.__name__, self._path)
+
+    def load(self, func_id, entry_key, stamp):
+        """
+        Return the data for the given function id and entry key, or None
+        if not found or not fresh.
+        """
+        try:
+            f = open(self._path, "r+b")
+            access = mmap.ACCESS_WRITE
+        except EnvironmentError as e:
+            if e.errno == errno.ENOENT:
+                return
+            if e.errno not in (errno.EACCES, errno.EPERM, errno.EROFS):
+                raise
+            # A read-only archive (e.g. installed from a bundle)
+            f = open(self._path, "rb")
+            access = mmap.ACCESS_READ
+        with f:
+            try:
+                mm = mmap.mmap(f.fileno(), 0, access=access)
+            except ValueError:
+                # Empty file
+                return
+            try:
+                pos = self._find(mm, func_id + entry_key)
+                if pos is None:
+                    return
+                _, _, rec_stamp, offset, size, _ = \
+                    self._record.unpack_from(mm, pos)
+                if rec_stamp != stamp:
+                    return
+                data = mm[offset:offset + size]
+                if access == mmap.ACCESS_WRITE:
+                    # Record the access time in place, for LRU eviction
+                    self._access_time.pack_into(
+                        mm, pos + self._record.size - self._access_time.size,
+                        time.time())
+                return data
+            finally:
+                mm.close()
+
+    def save(self, func_id, entry_key, stamp, data):
+        """
+        Save *data* for the given function id and entry key.
+        """
+        entry_size = self._header.size + self._record.size + len(data)
+        if self._max_size and entry_size > self._max_size:
+            warnings.warn("Cannot cache an entry of %d bytes in %s: larger "
+                          "than NUMBA_CACHE_MAX_SIZE (%d bytes)"
+                          % (entry_size, self._path, self._max_size),
+                          NumbaWarning)
+            return
+        with self._write_lock():
+            try:
+                f = open(self._path, "r+b")
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                self._write_entries([[func_id, entry_key, stamp, data,
+                                      time.time()]])
+                return
+            with f:
+                try:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+                except ValueError:
+                    # Empty file
+                    mm = b''
+                try:
+                    if self._append_entry(f, mm, func_id, entry_key,
+                                          stamp, data):
+                        return
+                    # Merge with the entries saved by other writers so far
+                    entries = [e for e in self._read_entries(mm)
+                               if e[0] != func_id
+                               or (e[1] != entry_key and e[2] == stamp)]
+                finally:
+                    if not isinstance(mm, bytes):
+                        mm.close()
+            new_entry = [func_id, entry_key, stamp, data, time.time()]
+            if self._max_size:
+                entries = self._evict(entries, new_entry)
+            entries.append(new_entry)
+            self._write_entries(entries)
+
+    def remove(self, func_id):
+        """
+        Remove all entries for the given function id.
+        """
+        with self._write_lock():
+            try:
+                with open(self._path, "rb") as f:
+                    buf = f.read()
+            except EnvironmentError as e:
+                if e.errno != errno.ENOENT:
+                    raise
+                return
+            records, _ = self._read_records(buf)
+            if any(r[0] == func_id for r in records):
+                self._write_entries([e for e in self._read_entries(buf)
+                                     if e[0] != func_id])
+
+    def _append_entry(self, f, buf, func_id, entry_key, stamp, data):
+        """
+        Append a new entry at the end of the log of archive file *f*
+        (whose current data is *buf*), and return True.  Return False
+        if the archive needs compacting instead.
+        """
+        header = self._check_header(buf)
+        if header is None:
+            return False
+        records, log_end = self._read_records(buf)
+        if log_end != len(buf):
+            # Drop the leftovers of an interrupted save
+            return False
+        n, _ = header
+        if len(records) - n >= max(self._min_log_entries, n):
+            return False
+        new_size = log_end + self._record.size + len(data)
+        if self._max_size and new_size > self._max_size:
+            return False
+        # Dead space: superseded records and stale entries of the
+        # saved function, as they would be dropped by a compaction
+        live = {}
+        for r in records:
+            if r[0] != func_id or (r[1] != entry_key and r[2] == stamp):
+                live[r[0] + r[1]] = r
+        live_size = self._record.size + len(data)
+        for r in live.values():
+            live_size += self._record.size + r[4]
+        if new_size - self._header.size > 2 * live_size:
+            return False
+        f.seek(log_end)
+        f.write(self._record.pack(func_id, entry_key, stamp,
+                                  log_end + self._record.size, len(data),
+                                  time.time()) + data)
+        f.flush()
+        return True
+
+    def _evict(self, entries, new_entry):
+        """
+        Return the most recently loaded *entries* that fit in the size
+        budget alongside *new_entry*.
+        """
+        total = (self._header.size + self._record.size +
+                 len(new_entry[3]))
+        kept = []
+        for e in sorted(entries, key=lambda e: e[4], reverse=True):
+            total += self._record.size + len(e[3])
+            if total > self._max_size:
+                break
+            kept.append(e)
+        return kept
+
+    def _check_header(self, buf):
+        """
+        Return the number of sorted index records in archive data *buf*
+        and the position of the log, or None if it's not a valid archive.
+        """
+        if len(buf) < self._header.size:
+            return
+        magic, version, n, log_start = self._header.unpack_from(buf, 0)
+        if magic != self._magic or version != self._format_version:
+            return
+        if (log_start < self._header.size + n * self._record.size
+            or len(buf) < log_start):
+            # Truncated
+            return
+        return n, log_start
+
+    def _iter_log(self, buf):
+        """
+        Yield the positions of the log records in archive data *buf*,
+        then the position where the log ends.  A truncated last entry
+        (e.g. from a crashed writer) ends the log.
+        """
+        header = self._check_header(buf)
+        if header is None:
+            yield len(buf)
+            return
+        _, pos = header
+        while pos + self._record.size <= len(buf):
+            _, _, _, offset, size, _ = self._record.unpack_from(buf, pos)
+            if (offset != pos + self._record.size
+                or offset + size > len(buf)):
+                break
+            yield pos
+            pos = offset + size
+        yield pos
+
+    def _find(self, buf, key):
+        """
+        Return the position of the latest index record for *key*, or None.
+        """
+        log = list(self._iter_log(buf))
+        for pos in reversed(log[:-1]):
+            if buf[pos:pos + self._key_size] == key:
+                return pos
+        lo, hi = 0, (self._check_header(buf) or (0, 0))[0]
+        while lo < hi:
+            mid = (lo + hi) // 2
+            pos = self._header.size + mid * self._record.size
+            k = buf[pos:pos + self._key_size]
+            if k < key:
+                lo = mid + 1
+            elif k > key:
+                hi = mid
+            else:
+                return pos
+
+    def _read_records(self, buf):
+        """
+        Return the index records of archive data *buf*, sorted index
+        first and then in log order, and the position where the log ends.
+        """
+        n, _ = self._check_header(buf) or (0, 0)
+        positions = [self._header.size + i * self._record.size
+                     for i in range(n)]
+        positions.extend(self._iter_log(buf))
+        log_end = positions.pop()
+        return [self._record.unpack_from(buf, pos)
+                for pos in positions], log_end
+
+    def _read_entries(self, buf):
+        """
+        Return the live entries of archive data *buf*, i.e. the latest
+        entry for each key.
+        """
+        entries = {}
+        for func_id, entry_key, stamp, offset, size, atime \
+                in self._read_records(buf)[0]:
+            entries[func_id + entry_key] = [func_id, entry_key, stamp,
+                                            buf[offset:offset + size], atime]
+        return list(entries.values())
+
+    def _write_entries(self, entries):
+        entries = sorted(entries, key=lambda e: e[0] + e[1])
+        offset = self._header.size + len(entries) * self._record.size
+        log_start = offset + sum(len(e[3]) for e in entries)
+        with _open_for_write(self._path) as f:
+            f.write(self._header.pack(self._magic, self._format_version,
+                                      len(entries), log_start))
+            for func_id, entry_key, stamp, data, atime in entries:
+                f.write(self._record.pack(func_id, entry_key, stamp,
+                                          offset, len(data), atime))
+                offset += len(data)
+            for e in entries:
+                f.write(e[3])
+
+
+class ArchiveFunctionCache(FunctionCache):
+    """
+    A per-function compilation cache storing its data in a single archive
+    file per module and Python version ("module_name.pyXY.nba"), shared
+    by all cached functions of the module (see _CacheArchive).
+    The archive size is bounded by NUMBA_CACHE_MAX_SIZE.
+    """
+
+    def __init__(self, py_func, loop_offset=None):
+        FunctionCache.__init__(self, py_func, loop_offset)
+        self._func_id = self._digest(self._filename_base)
+        self._readonly_archives = [self._make_archive(path)
+                                   for path in self._readonly_paths]
+
+    def _set_locator(self, locator):
+        FunctionCache._set_locator(self, locator)
+        self._archive = self._make_archive(self._cache_path)
+
+    def _make_archive(self, cache_path):
+        abiflags = getattr(sys, 'abiflags', '')
+        archive_name = '%s.py%d%d%s.nba' % (self._modname,
+                                            sys.version_info[0],
+                                            sys.version_info[1],
+                                            abiflags)
+        return _CacheArchive(os.path.join(cache_path, archive_name),
+                             config.CACHE_MAX_SIZE)
+
+    def flush(self):
+        self._archive.remove(self._func_id)
+
+    def load_overload(self, sig, target_context):
+        """
+        Load and recreate the cached CompileResult for the given signature,
+        using the *target_context*.
+        """
+        if not self._enabled or not self._ensure_source_stamp():
+            return
+        key = self._entry_key(sig, target_context.codegen())
+        stamp = self._stamp_digest()
+        for archive in [self._archive] + self._readonly_archives:
+            data = archive.load(self._func_id, key, stamp)
+            if data is not None:
+                return self._load_result(data, target_context)
+
+    def save_overload(self, sig, cres):
+        """
+        Save the CompileResult for the given signature in the cache.
+        """
+        if not self._enabled:
+            return
+        if not self._check_cachable(cres):
+            return
+        self._ensure_cache_path()
+        key = self._entry_key(sig, cres.library.codegen)
+        self._archive.save(self._func_id, key, self._stamp_digest(),
+                           self._dump_result(cres))
+
+    def _digest(self, obj):
+        return hashlib.sha256(str(obj).encode('utf-8')).digest()[:16]
+
+    def _entry_key(self, sig, codegen):
+        args, return_type = sigutils.normalize_signature(sig)
+        return self._digest((tuple(str(a) for a in args), str(return_type),
+                             codegen.magic_tuple()))
+
+    def _stamp_digest(self):
+        return self._digest((self._version, self._source_stamp))
+
+
+_cache_classes = {
+    'files': FunctionCache,
+    'archive': ArchiveFunctionCache,
+    }
+
+
+# Cache bundles: a zip file of the cache files of a package, laid out
+# as relative to a cache root (see _get_cache_subpath()).
+
+_cache_file_suffixes = ('.nbi', '.nbc', '.nba')
+
+
+def _get_module_location(name):
+    """
+    Return a (source file, is_package) tuple for module or package *name*,
+    without importing it.
+    """
+    loader = pkgutil.get_loader(name)
+    if loader is None:
+        raise ImportError("cannot find module %r" % (name,))
+    return loader.get_filename(name), loader.is_package(name)
+
+
+def _iter_cache_files(dirname, prefix=''):
+    try:
+        filenames = sorted(os.listdir(dirname))
+    except EnvironmentError as e:
+        if e.errno != errno.ENOENT:
+            raise
+        return
+    for fn in filenames:
+        if fn.startswith(prefix) and fn.endswith(_cache_file_suffixes):
+            yield fn, os.path.join(dirname, fn)
+
+
+def export_cache_bundle(name, bundle_path):
+    """
+    Export all cached overloads of the functions of module or package
+    *name* (including subpackages) into a single bundle file at
+    *bundle_path*.  Cache files are looked up both in the ``__pycache__``
+    directories next to the source files and in the NUMBA_CACHE_DIR and
+    user-wide cache directories.  Return the number of files exported.
+    """
+    filename, is_package = _get_module_location(name)
+    parts = name.split('.')
+    # A list of (source directory, subpath, filename prefix) tuples
+    locations = []
+    if is_package:
+        pkgdir = os.path.dirname(filename)
+        for dirpath, dirnames, filenames in os.walk(pkgdir):
+            dirnames[:] = sorted(d for d in dirnames if d != '__pycache__')
+            rel = os.path.relpath(dirpath, pkgdir)
+            subparts = parts if rel == os.curdir else parts + rel.split(os.sep)
+            locations.append((dirpath, os.path.join(*subparts), ''))
+    else:
+        subpath = os.path.join(*parts[:-1]) if len(parts) > 1 else ''
+        locations.append((os.path.dirname(filename), subpath,
+                          parts[-1] + '.'))
+
+    roots = [_get_user_cache_dir()]
+    if config.CACHE_DIR:
+        roots.append(config.CACHE_DIR)
+    # Map bundle member names to source paths, the most recent file wins
+    members = {}
+
+    def add_member(member, path):
+        if (member not in members or
+            os.path.getmtime(path) >= os.path.getmtime(members[member])):
+            members[member] = path
+
+    for dirpath, subpath, prefix in locations:
+        pycache = os.path.join(dirpath, '__pycache__')
+        for fn, path in _iter_cache_files(pycache, prefix):
+            add_member(os.path.join(subpath, fn), path)
+        for root in roots:
+            for fn, path in _iter_cache_files(os.path.join(root, subpath),
+                                              prefix):
+                add_member(os.path.join(subpath, fn), path)
+
+    with zipfile.ZipFile(bundle_path, 'w', zipfile.ZIP_DEFLATED) as zf:
+        for member in sorted(members):
+            zf.write(members[member], member.replace(os.sep, '/'))
+    return len(members)
+
+
+def import_cache_bundle(bundle_path, cache_dir=None):
+    """
+    Install the cache files of the bundle at *bundle_path*.  If
+    *cache_dir* (or else NUMBA_CACHE_DIR) is given, files are installed
+    below that directory, which must then be used as NUMBA_CACHE_DIR
+    when running the cached functions.  Otherwise, they are installed in
+    the ``__pycache__`` directories of the corresponding source files,
+    where they are loaded from even if those directories are read-only
+    at runtime.  Return the number of files imported.
+    """
+    cache_dir = cache_dir or config.CACHE_DIR
+    with zipfile.ZipFile(bundle_path, 'r') as zf:
+        names = zf.namelist()
+        for member in names:
+            parts = member.split('/')
+            fn = parts.pop()
+            if (not fn.endswith(_cache_file_suffixes) or
+                any(p in ('', os.curdir, os.pardir) for p in parts)):
+                raise ValueError("invalid member %r in cache bundle %r"
+                                 % (member, bundle_path))
+            if cache_dir:
+                dest_dir = os.path.join(cache_dir, *parts)
+            elif parts and parts[0] != '__main__':
+                filename, is_package = _get_module_location(parts[0])
+                dest_dir = os.path.join(
+                    os.path.dirname(os.path.dirname(filename)), *parts)
+                dest_dir = os.path.join(dest_dir, '__pycache__')
+            elif not parts:
+                # Cache file for a top-level module
+                filename, is_package = _get_module_location(
+                    fn.split('.')[0])
+                dest_dir = os.path.join(os.path.dirname(filename),
+                                        '__pycache__')
+            else:
+                raise ValueError("cannot install cache file %r for a "
+                                 "script without a cache directory"
+                                 % (member,))
+            _ensure_dir(dest_dir)
+            with _open_for_write(os.path.join(dest_dir, fn)) as f:
+                f.write(zf.read(member))
+    return len(names)
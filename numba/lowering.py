@@ -231,11 +231,45 @@ class BaseLower(object):
 class Lower(BaseLower):
     GeneratorLower = generators.GeneratorLower
 
+    def lower_function_body(self):
+        from . import parfor, temparrays
+
+        # prange() loops are lowered in place of their header block, and
+        # their other blocks are outlined.
+        loops = parfor.find_parallel_loops(self)
+        self.parallel_loops = dict((self.blocks[loop.header], loop)
+                                   for loop in loops)
+        self.outlined_blocks = set(self.blocks[offset] for loop in loops
+                                   for offset in loop.body)
+        self.temporary_arrays = temparrays.find_temporary_arrays(self)
+        return super(Lower, self).lower_function_body()
+
+    def post_lower(self):
+        from . import temparrays
+
+        temparrays.release_temporary_arrays(self)
+
+    def lower_block(self, block):
+        if block in self.parallel_loops:
+            from . import parfor
+
+            self.loc = block.loc
+            parfor.ParforLower(self, self.parallel_loops[block]).lower_loop()
+        elif block in self.outlined_blocks:
+            self.builder.unreachable()
+        else:
+            super(Lower, self).lower_block(block)
+
     def lower_inst(self, inst):
         self.debug_print(str(inst))
         if isinstance(inst, ir.Assign):
             ty = self.typeof(inst.target.name)
-            val = self.lower_assign(ty, inst)
+            temp = self.temporary_arrays.get(inst.value)
+            if temp is not None:
+                with temp.allocating(self):
+                    val = self.lower_assign(ty, inst)
+            else:
+                val = self.lower_assign(ty, inst)
             self.storevar(val, inst.target.name)
 
         elif isinstance(inst, ir.Branch):
@@ -0,0 +1,240 @@
+"""
+Signature manifests: recording of the signatures compiled by JIT
+functions, and ahead-of-time warmup of JIT functions from such a record.
+"""
+
+from __future__ import print_function, division, absolute_import
+
+import importlib
+import io
+import multiprocessing
+import os
+import threading
+import warnings
+
+from .six.moves import cPickle as pickle
+from . import compiler, config
+from .config import NumbaWarning
+
+
+class SignatureManifest(object):
+    """
+    A file recording the argument types each JIT function was compiled
+    for.  Records are appended, so that several processes can share
+    the same manifest.
+    """
+
+    def __init__(self, path):
+        self._path = path
+        self._lock = threading.Lock()
+        self._recorded = None
+
+    @property
+    def path(self):
+        return self._path
+
+    def record(self, modname, qualname, args):
+        """
+        Record argument types *args* for the function *qualname* in
+        module *modname*, unless already recorded.
+        """
+        entry = (modname, qualname, tuple(args))
+        with self._lock:
+            if self._recorded is None:
+                self._recorded = set(self._iter_records())
+            if entry in self._recorded:
+                return
+            self._recorded.add(entry)
+            data = pickle.dumps(entry, protocol=-1)
+            # A single write in append mode, so that records from
+            # concurrent processes don't get interleaved.
+            with io.open(self._path, 'ab') as f:
+                f.write(data)
+
+    def read(self):
+        """
+        Return a list of ((modname, qualname), [args, ...]) tuples, in
+        recording order.
+        """
+        entries = []
+        sigs_by_func = {}
+        for modname, qualname, args in self._iter_records():
+            key = modname, qualname
+            sigs = sigs_by_func.get(key)
+            if sigs is None:
+                sigs = sigs_by_func[key] = []
+                entries.append((key, sigs))
+            if args not in sigs:
+                sigs.append(args)
+        return entries
+
+    def _iter_records(self):
+        try:
+            f = io.open(self._path, 'rb')
+        except (IOError, OSError):
+            return
+        with f:
+            unpickler = pickle.Unpickler(f)
+            while True:
+                try:
+                    yield unpickler.load()
+                except EOFError:
+                    break
+                except Exception:
+                    # A truncated record, e.g. if a process was killed
+                    # while writing.
+                    break
+
+
+_manifests = {}
+_manifests_lock = threading.Lock()
+
+
+def _get_recording_manifest():
+    """
+    Return the SignatureManifest designated by NUMBA_SIGNATURE_MANIFEST,
+    or None.
+    """
+    path = config.SIGNATURE_MANIFEST
+    if not path:
+        return None
+    path = os.path.abspath(path)
+    with _manifests_lock:
+        manifest = _manifests.get(path)
+        if manifest is None:
+            manifest = _manifests[path] = SignatureManifest(path)
+        return manifest
+
+
+def _get_qualname(py_func):
+    """
+    Return the qualified name of *py_func*, or None if it cannot be
+    looked up from its module.
+    """
+    qualname = getattr(py_func, '__qualname__', py_func.__name__)
+    if '<locals>' in qualname or '<lambda>' in qualname:
+        return None
+    return qualname
+
+
+def record_overload(dispatcher, args):
+    """
+    Called when *dispatcher* gets a new overload for argument types
+    *args*.
+    """
+    manifest = _get_recording_manifest()
+    if manifest is None:
+        return
+    py_func = dispatcher.py_func
+    qualname = _get_qualname(py_func)
+    if qualname is not None and py_func.__module__ is not None:
+        manifest.record(py_func.__module__, qualname, args)
+
+
+def _resolve_dispatcher(modname, qualname):
+    """
+    Find the dispatcher named *qualname* in module *modname*, or
+    return None.
+    """
+    from .dispatcher import Overloaded
+    try:
+        obj = importlib.import_module(modname)
+        for name in qualname.split('.'):
+            obj = getattr(obj, name)
+    except (ImportError, AttributeError):
+        return None
+    if isinstance(obj, Overloaded):
+        return obj
+
+
+def _compile_remote(task):
+    """
+    Compile a signature in a worker process, and return the pickled
+    reduction of the compile result, or None if it cannot be transferred
+    to the parent process.
+    """
+    modname, qualname, args = task
+    dispatcher = _resolve_dispatcher(modname, qualname)
+    if dispatcher is None:
+        return None
+    try:
+        dispatcher.compile(args)
+    except Exception:
+        # Let the parent process report the error
+        return None
+    cres = dispatcher._compileinfos[args]
+    if cres.lifted or cres.interpmode or cres.has_dynamic_globals:
+        return None
+    return pickle.dumps(cres._reduce(), protocol=-1)
+
+
+def _install_overload(dispatcher, args, data):
+    """
+    Add the compile result *data*, as returned by _compile_remote(),
+    to *dispatcher*.  If *data* is None, compile in-process instead.
+    """
+    if data is None:
+        dispatcher.compile(args)
+        return
+    with dispatcher._compile_lock:
+        if args not in dispatcher.overloads:
+            reduced = pickle.loads(data)
+            cres = compiler.CompileResult._rebuild(dispatcher.targetctx,
+                                                   *reduced)
+            dispatcher._add_cached_overload(cres)
+
+
+def warmup(manifest, processes=None):
+    """
+    Compile all signatures recorded in *manifest* (a SignatureManifest
+    or the path to a manifest file, as written when the
+    NUMBA_SIGNATURE_MANIFEST environment variable is set).  Compilation
+    is spread over a pool of *processes* worker processes (by default,
+    one per CPU); pass 0 to compile in the current process.
+
+    The number of installed overloads is returned.  Functions which
+    cannot be found anymore, and signatures which fail compiling, are
+    skipped with a warning.
+    """
+    if not isinstance(manifest, SignatureManifest):
+        manifest = SignatureManifest(manifest)
+
+    tasks = []
+    dispatchers = {}
+    for (modname, qualname), sigs in manifest.read():
+        dispatcher = _resolve_dispatcher(modname, qualname)
+        if dispatcher is None:
+            warnings.warn("Cannot warm up %s.%s: JIT function not found"
+                          % (modname, qualname), NumbaWarning)
+            continue
+        dispatchers[modname, qualname] = dispatcher
+        tasks.extend((modname, qualname, args) for args in sigs
+                     if args not in dispatcher.overloads)
+
+    if not tasks:
+        return 0
+
+    failures = []
+
+    def install(task, data):
+        modname, qualname, args = task
+        try:
+            _install_overload(dispatchers[modname, qualname], args, data)
+        except Exception as e:
+            # Don't let one bad signature prevent warming up the others
+            failures.append(task)
+            warnings.warn("Cannot warm up %s.%s for argument types %s: %s"
+                          % (modname, qualname, args, e), NumbaWarning)
+
+    if processes == 0 or len(tasks) == 1:
+        for task in tasks:
+            install(task, None)
+    else:
+        pool = multiprocessing.Pool(processes)
+        try:
+            for task, data in zip(tasks, pool.imap(_compile_remote, tasks)):
+                install(task, data)
+        finally:
+            pool.close()
+            pool.join()
+    return len(tasks) - len(failures)
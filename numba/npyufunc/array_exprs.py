@@ -5,10 +5,13 @@ from collections import defaultdict
 import sys
 
 from numpy import ufunc
+from llvmlite.llvmpy.core import (Constant, Type, Builder, ICMP_EQ, ICMP_NE,
+                                   ICMP_SLT, LINKAGE_INTERNAL)
 
-from .. import ir, types, rewrites, six
+from .. import cgutils, config, ir, types, rewrites, six
 from ..typing import npydecl
 from ..targets import npyimpl
+from ..targets.imputils import impl_ret_new_ref
 from .dufunc import DUFunc
 
 
@@ -351,5 +354,179 @@ def _lower_array_expr(lowerer, expr):
                              self.outer_sig.return_type)
 
     args = [lowerer.loadvar(name) for name in expr_args]
+    if context.auto_parallel and outer_sig.return_type.ndim > 0:
+        return _lower_parallel_array_expr(context, builder, expr_name,
+                                          outer_sig, args, cres, inner_sig)
     return npyimpl.numpy_ufunc_kernel(
         context, builder, outer_sig, args, ExprKernel, explicit_output=False)
+
+
+def _make_expr_kernel_class(cres, inner_sig, on_error):
+    '''Make a kernel class computing an element of an array expression,
+    calling *on_error(builder, status)* if it fails.
+    '''
+    class ExprKernel(npyimpl._Kernel):
+        def generate(self, *args):
+            arg_zip = zip(args, self.outer_sig.args, inner_sig.args)
+            cast_args = [self.cast(val, inty, outty)
+                         for val, inty, outty in arg_zip]
+            func = self.context.declare_function(self.builder.module,
+                                                 cres.fndesc)
+            status, result = self.context.call_conv.call_function(
+                self.builder, func, inner_sig.return_type, inner_sig.args,
+                cast_args)
+            with cgutils.if_unlikely(self.builder, status.is_error):
+                on_error(self.builder, status)
+            return self.cast(result, inner_sig.return_type,
+                             self.outer_sig.return_type)
+
+    return ExprKernel
+
+
+def _lower_parallel_array_expr(context, builder, expr_name, outer_sig, args,
+                               cres, inner_sig):
+    '''Lower an array expression with the parallel ufunc thread pool,
+    splitting the outer dimension of the output across threads (with
+    @jit(parallel=True)).
+
+    Small outputs are computed serially.  If the expression raised an
+    error in a thread, it is computed again serially so that the error
+    is raised the usual way.
+    '''
+    from . import parallel
+
+    intp_t = context.get_value_type(types.intp)
+    int_t = Type.int()
+    byte_ptr_t = Type.pointer(Type.int(8))
+
+    arguments = [npyimpl._prepare_argument(context, builder, arg, argty)
+                 for arg, argty in zip(args, outer_sig.args)]
+    output = npyimpl._build_array(context, builder, outer_sig.return_type,
+                                  arguments)
+    arguments.append(output)
+    values = list(args) + [output.return_val]
+    argtys = list(outer_sig.args) + [outer_sig.return_type]
+
+    size = Constant.int(intp_t, 1)
+    for dim in output.shape:
+        size = builder.mul(size, dim)
+    threshold = Constant.int(intp_t, config.PARALLEL_SERIAL_THRESHOLD)
+    run_serially = cgutils.alloca_once_value(
+        builder, builder.icmp(ICMP_SLT, size, threshold))
+
+    with cgutils.ifnot(builder, builder.load(run_serially)):
+        kernel = _build_parallel_expr_kernel(context, builder.module,
+                                             expr_name, argtys, cres,
+                                             inner_sig)
+        # Each value is passed by address with a zero step.  The start of
+        # each chunk is passed as an additional pseudo-array at address 0
+        # with a unit step.
+        nargs = len(values) + 1
+        kernel_args = cgutils.alloca_once(builder, byte_ptr_t, size=nargs)
+        kernel_steps = cgutils.alloca_once(builder, intp_t, size=nargs)
+        for i, value in enumerate(values):
+            ptr = cgutils.alloca_once_value(builder, value)
+            builder.store(builder.bitcast(ptr, byte_ptr_t),
+                          builder.gep(kernel_args, [Constant.int(int_t, i)]))
+            builder.store(Constant.int(intp_t, 0),
+                          builder.gep(kernel_steps, [Constant.int(int_t, i)]))
+        last = Constant.int(int_t, nargs - 1)
+        builder.store(Constant.null(byte_ptr_t),
+                      builder.gep(kernel_args, [last]))
+        builder.store(Constant.int(intp_t, 1),
+                      builder.gep(kernel_steps, [last]))
+        kernel_dims = cgutils.alloca_once_value(builder, output.shape[0])
+        failed = cgutils.alloca_once_value(builder, Constant.int(int_t, 0))
+
+        parallel.call_launch_threads(builder)
+        parallel.call_parallel_for(
+            context, builder,
+            [builder.bitcast(kernel, byte_ptr_t), kernel_args,
+             kernel_dims, kernel_steps,
+             builder.bitcast(failed, byte_ptr_t),
+             Constant.int(int_t, nargs), Constant.int(int_t, 1)])
+        builder.store(builder.icmp(ICMP_NE, builder.load(failed),
+                                   Constant.int(int_t, 0)),
+                      run_serially)
+
+    def on_error(builder, status):
+        # Release the output before propagating the error
+        if context.enable_nrt:
+            context.nrt_decref(builder, outer_sig.return_type,
+                               output.return_val)
+        context.call_conv.return_status_propagate(builder, status)
+
+    with builder.if_then(builder.load(run_serially)):
+        npyimpl.build_ufunc_loop(
+            context, builder, arguments,
+            _make_expr_kernel_class(cres, inner_sig, on_error))
+
+    return impl_ret_new_ref(context, builder, outer_sig.return_type,
+                            output.return_val)
+
+
+def _slice_outer_dimension(context, builder, aryty, ary, start, count):
+    '''Return array *ary* restricted to [start, start + count) along its
+    outer dimension, unless it is broadcast along that dimension.
+    '''
+    ary = context.make_array(aryty)(context, builder, value=ary)
+    shape = cgutils.unpack_tuple(builder, ary.shape, aryty.ndim)
+    strides = cgutils.unpack_tuple(builder, ary.strides, aryty.ndim)
+    is_broadcast = builder.icmp(ICMP_EQ, shape[0],
+                                Constant.int(shape[0].type, 1))
+    data = cgutils.pointer_add(builder, ary.data,
+                               builder.mul(start, strides[0]))
+    ary.data = builder.select(is_broadcast, ary.data, data)
+    shape[0] = builder.select(is_broadcast, shape[0], count)
+    ary.shape = cgutils.pack_array(builder, shape)
+    return ary._getvalue()
+
+
+def _build_parallel_expr_kernel(context, module, expr_name, argtys, cres,
+                                inner_sig):
+    '''Build a function computing a chunk of an array expression, with
+    the signature of a ufunc inner loop so that it can be run by the
+    workqueue's parallel_for().  *argtys* are the types of the expression's
+    operands followed by the output type.  Errors are flagged in the
+    int pointed to by the loop's data argument.
+    '''
+    intp_t = context.get_value_type(types.intp)
+    byte_ptr_t = Type.pointer(Type.int(8))
+    fnty = Type.function(Type.void(), [Type.pointer(byte_ptr_t),
+                                       Type.pointer(intp_t),
+                                       Type.pointer(intp_t),
+                                       byte_ptr_t])
+    fn = module.add_function(fnty, name="__numba_parallel%s" % (expr_name,))
+    fn.linkage = LINKAGE_INTERNAL
+    builder = Builder.new(fn.append_basic_block('entry'))
+    kernel_args, kernel_dims, kernel_steps, kernel_data = fn.args
+
+    count = builder.load(kernel_dims)
+    start_ptr = builder.gep(kernel_args,
+                            [Constant.int(Type.int(), len(argtys))])
+    start = builder.ptrtoint(builder.load(start_ptr), intp_t)
+    out_ndim = argtys[-1].ndim
+    arguments = []
+    for i, argty in enumerate(argtys):
+        ptr = builder.load(builder.gep(kernel_args,
+                                       [Constant.int(Type.int(), i)]))
+        ptr = builder.bitcast(ptr,
+                              Type.pointer(context.get_value_type(argty)))
+        value = builder.load(ptr)
+        if isinstance(argty, types.Array) and argty.ndim == out_ndim:
+            value = _slice_outer_dimension(context, builder, argty, value,
+                                           start, count)
+        arguments.append(npyimpl._prepare_argument(context, builder, value,
+                                                   argty))
+    failed = builder.bitcast(kernel_data, Type.pointer(Type.int()))
+
+    def on_error(builder, status):
+        # Threads can't raise: flag the error and stop
+        builder.store(Constant.int(Type.int(), 1), failed)
+        builder.ret_void()
+
+    npyimpl.build_ufunc_loop(
+        context, builder, arguments,
+        _make_expr_kernel_class(cres, inner_sig, on_error))
+    builder.ret_void()
+    return fn
@@ -3,9 +3,8 @@ import inspect
 
 from . import _internal, dufunc
 from .ufuncbuilder import UFuncBuilder, GUFuncBuilder
-from .parallel import ParallelUFuncBuilder
+from .parallel import ParallelUFuncBuilder, ParallelGUFuncBuilder
 
-from numba.cuda.vectorizers import CUDAVectorize, CUDAGUFuncVectorize 
 from numba.targets.registry import TargetRegistry
 
 
@@ -35,7 +34,8 @@ class Vectorize(_BaseVectorize):
 
 
 class GUVectorize(_BaseVectorize):
-    target_registry = TargetRegistry({'cpu': GUFuncBuilder})
+    target_registry = TargetRegistry({'cpu': GUFuncBuilder,
+                                      'parallel': ParallelGUFuncBuilder})
 
     def __new__(cls, func, signature, **kws):
         identity = cls.get_identity(kws)
@@ -137,7 +137,8 @@ def guvectorize(ftylist, signature, **kws):
         and "reorderable".
 
     target: str
-            A string for code generation target.  Defaults to "cpu".
+            A string for code generation target.  Defaults to "cpu";
+            "parallel" distributes the outer loop across threads.
 
     Returns
     --------
@@ -6,25 +6,68 @@ the thread dispatcher.  This thread dispatcher launches threads
 that execute the generated function of UFuncCore.
 UFuncCore is subclassed to specialize for the input/output types.
 The actual workload is invoked inside the function generated by UFuncCore.
-UFuncCore also defines a work-stealing mechanism that allows idle threads
-to steal works from other threads.
+The thread dispatcher itself is implemented in C by the workqueue module.
+The number of threads it uses can be changed at runtime with
+set_num_threads().  Iterations are distributed in chunks according to a
+scheduling policy (see set_schedule()), and idle threads steal work from
+other threads.
+Calls with few iterations run serially on the calling thread, below a
+threshold which can be set per ufunc (see set_serial_threshold()).
+Binary parallel ufuncs with an identity can also be reduced using the
+thread pool (see parallel_reduce()), and parallel_map() calls a nogil
+function on chunks of an array from the thread pool.
 """
 from __future__ import print_function, absolute_import
+import ctypes
 import sys
 import os
-import multiprocessing
+import warnings
+import weakref
 
 import numpy as np
 import llvmlite.llvmpy.core as lc
 import llvmlite.binding as ll
 from numba.npyufunc import ufuncbuilder
-from numba import types, utils
+from numba import cgutils, config, six, types, utils
+from numba.config import NumbaWarning
 
 
-NUM_CPU = max(1, multiprocessing.cpu_count())
+# The size of the thread pool
+NUM_THREADS = max(1, config.NUM_THREADS)
+
+# Scheduling policies, as defined in workqueue.h
+SCHEDULES = {'static': 0, 'dynamic': 1, 'guided': 2}
+
+
+class _UFuncState(object):
+    """
+    The runtime state of a parallel ufunc, kept alive by the ufunc.
+    """
+
+    def __init__(self, targetoptions):
+        # Pop the serial_threshold option from *targetoptions*.  The
+        # threshold is shared by the kernels of all loops, so that it can
+        # be changed after compilation.
+        threshold = targetoptions.pop('serial_threshold', None)
+        if threshold is None:
+            threshold = config.PARALLEL_SERIAL_THRESHOLD
+        self.threshold = ctypes.c_ssize_t(_check_threshold(threshold))
+        # Serial inner loops, as {input dtypes: (output dtype, pointer)}
+        self.serial_loops = {}
 
 
 class ParallelUFuncBuilder(ufuncbuilder.UFuncBuilder):
+    def __init__(self, py_func, identity=None, targetoptions={}):
+        targetoptions = dict(targetoptions)
+        self._state = _UFuncState(targetoptions)
+        super(ParallelUFuncBuilder, self).__init__(py_func, identity,
+                                                   targetoptions)
+
+    def build_ufunc(self):
+        ufunc = super(ParallelUFuncBuilder, self).build_ufunc()
+        _ufunc_states[id(ufunc)] = self._state
+        return ufunc
+
     def build(self, cres, sig):
         _launch_threads()
 
@@ -33,26 +76,83 @@ class ParallelUFuncBuilder(ufuncbuilder.UFuncBuilder):
         signature = cres.signature
         library = cres.library
         llvm_func = library.get_function(cres.fndesc.llvm_func_name)
-        wrapper = build_ufunc_wrapper(library, ctx, llvm_func, signature)
+        innerfunc = ufuncbuilder.build_ufunc_wrapper(library, ctx, llvm_func,
+                                                     signature, objmode=False,
+                                                     env=None, envptr=None)
+        # Array count is input signature plus 1 (due to output array)
+        wrapper = build_ufunc_kernel(library, ctx, innerfunc,
+                                     len(signature.args) + 1, 1,
+                                     ctypes.addressof(self._state.threshold))
+        library.add_ir_module(wrapper.module)
         ptr = library.get_pointer_to_function(wrapper.name)
         # Get dtypes
         dtypenums = [np.dtype(a.name).num for a in signature.args]
         dtypenums.append(np.dtype(signature.return_type.name).num)
-        keepalive = ()
+        # The serial loop is used by parallel_reduce()
+        intypes = tuple(np.dtype(a.name) for a in signature.args)
+        serial_ptr = library.get_pointer_to_function(innerfunc.name)
+        self._state.serial_loops[intypes] = (
+            np.dtype(signature.return_type.name), serial_ptr)
+        # The threshold is read by the kernel
+        keepalive = self._state
         return dtypenums, ptr, keepalive
 
 
-def build_ufunc_wrapper(library, ctx, lfunc, signature):
-    innerfunc = ufuncbuilder.build_ufunc_wrapper(library, ctx, lfunc, signature,
-                                                 objmode=False, env=None,
-                                                 envptr=None)
-    lfunc = build_ufunc_kernel(library, ctx, innerfunc, signature)
-    library.add_ir_module(lfunc.module)
-    return lfunc
+class ParallelGUFuncBuilder(ufuncbuilder.GUFuncBuilder):
+    def __init__(self, py_func, signature, identity=None, targetoptions={}):
+        targetoptions = dict(targetoptions)
+        self._state = _UFuncState(targetoptions)
+        super(ParallelGUFuncBuilder, self).__init__(py_func, signature,
+                                                    identity, targetoptions)
+
+    def build_ufunc(self):
+        ufunc = super(ParallelGUFuncBuilder, self).build_ufunc()
+        _ufunc_states[id(ufunc)] = self._state
+        return ufunc
+
+    def build(self, cres):
+        """
+        Returns (dtype numbers, function ptr, EnvironmentObject)
+        """
+        if cres.objectmode:
+            # Object mode kernels hold the GIL: no point in using threads
+            return super(ParallelGUFuncBuilder, self).build(cres)
+
+        _launch_threads()
+
+        # Build the serial gufunc loop, then wrap it with a parallel
+        # dispatcher over the outer dimension
+        ctx = cres.target_context
+        library = cres.library
+        signature = cres.signature
+        llvm_func = library.get_function(cres.fndesc.llvm_func_name)
+        innerfunc, env = ufuncbuilder.build_gufunc_wrapper(
+            library, ctx, llvm_func, signature, self.sin, self.sout,
+            fndesc=cres.fndesc, env=cres.environment)
+        core_dims = set()
+        for syms in self.sin + self.sout:
+            core_dims.update(syms)
+        wrapper = build_ufunc_kernel(library, ctx, innerfunc,
+                                     len(signature.args), 1 + len(core_dims),
+                                     ctypes.addressof(self._state.threshold))
+        library.add_ir_module(wrapper.module)
+        ptr = library.get_pointer_to_function(wrapper.name)
+
+        # Get dtypes
+        dtypenums = []
+        for a in signature.args:
+            if isinstance(a, types.Array):
+                ty = a.dtype
+            else:
+                ty = a
+            dtypenums.append(np.dtype(ty.name).num)
+        # The threshold is read by the kernel
+        return dtypenums, ptr, (env, self._state)
 
 
-def build_ufunc_kernel(library, ctx, innerfunc, sig):
-    """Wrap the original CPU ufunc with a parallel dispatcher.
+def build_ufunc_kernel(library, ctx, innerfunc, array_count, dim_count,
+                       threshold_addr):
+    """Wrap the original CPU ufunc or gufunc loop with a parallel dispatcher.
 
     Args
     ----
@@ -60,10 +160,17 @@ def build_ufunc_kernel(library, ctx, innerfunc, sig):
         numba's codegen context
 
     innerfunc
-        llvm function of the original CPU ufunc
+        llvm function of the original CPU ufunc or gufunc loop
 
-    sig
-        type signature of the ufunc
+    array_count
+        number of arrays (inputs and outputs) of the loop
+
+    dim_count
+        number of dimensions passed to the loop: 1 for a ufunc, 1 plus the
+        number of core dimensions for a gufunc
+
+    threshold_addr
+        address of the serial threshold (a Py_ssize_t)
 
     Details
     -------
@@ -73,10 +180,10 @@ def build_ufunc_kernel(library, ctx, innerfunc, sig):
     void ufunc_kernel(char **args, npy_intp *dimensions, npy_intp* steps,
                       void* data)
 
-    Divide the work equally across all threads and let the last thread take all
-    the left over.
-
-
+    The work is distributed by the workqueue's parallel_for(), using the
+    number of threads configured at call time (see set_num_threads()),
+    unless the number of iterations is below the serial threshold, in which
+    case the original CPU ufunc is called directly.
     """
     # Declare types and function
     byte_t = lc.Type.int(8)
@@ -100,82 +207,69 @@ def build_ufunc_kernel(library, ctx, innerfunc, sig):
 
     args, dimensions, steps, data = lfunc.args
 
-    # Distribute work
-    total = builder.load(dimensions)
-    ncpu = lc.Constant.int(total.type, NUM_CPU)
-
-    count = builder.udiv(total, ncpu)
-
-    count_list = []
-    remain = total
-
-    for i in range(NUM_CPU):
-        space = builder.alloca(intp_t)
-        count_list.append(space)
-
-        if i == NUM_CPU - 1:
-            # Last thread takes all leftover
-            builder.store(remain, space)
-        else:
-            builder.store(count, space)
-            remain = builder.sub(remain, count)
-
-    # Array count is input signature plus 1 (due to output array)
-    array_count = len(sig.args) + 1
-
-    # Get the increment step for each array
-    steps_list = []
-    for i in range(array_count):
-        ptr = builder.gep(steps, [lc.Constant.int(lc.Type.int(), i)])
-        step = builder.load(ptr)
-        steps_list.append(step)
-
-    # Get the array argument set for each thread
-    args_list = []
-    for i in range(NUM_CPU):
-        space = builder.alloca(byte_ptr_t,
-                               size=lc.Constant.int(lc.Type.int(), array_count))
-        args_list.append(space)
-
-        for j in range(array_count):
-            # For each array, compute subarray pointer
-            dst = builder.gep(space, [lc.Constant.int(lc.Type.int(), j)])
-            src = builder.gep(args, [lc.Constant.int(lc.Type.int(), j)])
-
-            baseptr = builder.load(src)
-            base = builder.ptrtoint(baseptr, intp_t)
-            multiplier = lc.Constant.int(count.type, i)
-            offset = builder.mul(steps_list[j], builder.mul(count, multiplier))
-            addr = builder.inttoptr(builder.add(base, offset), baseptr.type)
-
-            builder.store(addr, dst)
-
-    # Declare external functions
-    add_task_ty = lc.Type.function(lc.Type.void(), [byte_ptr_t] * 5)
-    empty_fnty = lc.Type.function(lc.Type.void(), ())
-    add_task = mod.get_or_insert_function(add_task_ty, name='numba_add_task')
-    synchronize = mod.get_or_insert_function(empty_fnty,
-                                             name='numba_synchronize')
-    ready = mod.get_or_insert_function(empty_fnty, name='numba_ready')
-
-    # Add tasks for queue; one per thread
-    as_void_ptr = lambda arg: builder.bitcast(arg, byte_ptr_t)
-
-    for each_args, each_dims in zip(args_list, count_list):
-        innerargs = [as_void_ptr(x) for x
-                     in [innerfunc, each_args, each_dims, steps, data]]
-
-        builder.call(add_task, innerargs)
-
-    # Signal worker that we are ready
-    builder.call(ready, ())
-    # Wait for workers
-    builder.call(synchronize, ())
+    # Small inputs aren't worth the dispatching overhead
+    threshold_ptr = builder.inttoptr(lc.Constant.int(intp_t, threshold_addr),
+                                     lc.Type.pointer(intp_t))
+    is_small = builder.icmp(lc.ICMP_SLT, builder.load(dimensions),
+                            builder.load(threshold_ptr))
+    with cgutils.if_unlikely(builder, is_small):
+        builder.call(innerfunc, [args, dimensions, steps, data])
+        builder.ret_void()
+
+    # Distribute work and wait for completion
+    fnptr = builder.bitcast(innerfunc, byte_ptr_t)
+    call_parallel_for(ctx, builder,
+                      [fnptr, args, dimensions, steps, data,
+                       lc.Constant.int(lc.Type.int(), array_count),
+                       lc.Constant.int(lc.Type.int(), dim_count)])
     builder.ret_void()
 
     return lfunc
 
 
+def declare_parallel_for(mod, intp_t):
+    """
+    Declare the workqueue's parallel_for() in LLVM module *mod*.
+    """
+    byte_ptr_t = lc.Type.pointer(lc.Type.int(8))
+    fnty = lc.Type.function(lc.Type.void(),
+                            [byte_ptr_t,
+                             lc.Type.pointer(byte_ptr_t),
+                             lc.Type.pointer(intp_t),
+                             lc.Type.pointer(intp_t),
+                             byte_ptr_t,
+                             lc.Type.int(),
+                             lc.Type.int()])
+    return mod.get_or_insert_function(fnty, name='numba_parallel_for')
+
+
+def call_parallel_for(context, builder, args):
+    """
+    Emit a call to the workqueue's parallel_for() with the LLVM values
+    *args*.  The kernel may call functions compiled with non-atomic
+    refcounts, which must update them atomically while the workers run
+    (see BaseContext.nrt_adjust_nogil_count()).
+    """
+    intp_t = context.get_value_type(types.intp)
+    parallel_for = declare_parallel_for(builder.module, intp_t)
+    if context.enable_nrt:
+        context.nrt_adjust_nogil_count(builder, 1)
+    builder.call(parallel_for, args)
+    if context.enable_nrt:
+        context.nrt_adjust_nogil_count(builder, -1)
+
+
+def call_launch_threads(builder):
+    """
+    Emit a call launching the thread pool, unless already done, for code
+    which may be loaded from a cache in a fresh process.
+    """
+    fnty = lc.Type.function(lc.Type.void(), [lc.Type.int()])
+    fn = builder.module.get_or_insert_function(fnty,
+                                               name='numba_launch_threads')
+    builder.call(fn, [lc.Constant.int(lc.Type.int(), NUM_THREADS)])
+
+
 class _ProtectEngineDestroy(object):
     def __init__(self, set_cas, engine):
         self.set_cas = set_cas
@@ -205,7 +299,9 @@ def _make_cas_function():
     ptr, old, repl = fn.args
     bb = fn.append_basic_block('')
     builder = lc.Builder.new(bb)
-    outpack = builder.cmpxchg(ptr, old, repl, ordering='monotonic')
+    # Sequentially consistent, as the CAS also protects the work ranges
+    # shared by threads
+    outpack = builder.cmpxchg(ptr, old, repl, ordering='seq_cst')
     out = builder.extract_value(outpack, 0)
     failed = builder.extract_value(outpack, 1)
     builder.ret(builder.select(failed, old, out))
@@ -229,7 +325,209 @@ def _launch_threads():
     from ctypes import CFUNCTYPE, c_int
 
     launch_threads = CFUNCTYPE(None, c_int)(lib.launch_threads)
-    launch_threads(NUM_CPU)
+    launch_threads(NUM_THREADS)
+
+
+def set_num_threads(n):
+    """
+    Set the number of threads used by parallel ufuncs, which must be
+    between 1 and the size of the thread pool (NUMBA_NUM_THREADS).
+    This takes effect at the next call, including for already compiled
+    ufuncs.
+    """
+    from . import workqueue as lib
+    from ctypes import CFUNCTYPE, c_int
+
+    n = int(n)
+    if not 1 <= n <= NUM_THREADS:
+        raise ValueError("number of threads must be between 1 and %d, "
+                         "got %d" % (NUM_THREADS, n))
+    CFUNCTYPE(None, c_int)(lib.set_num_threads)(n)
+
+
+def set_schedule(schedule, grain_size=0):
+    """
+    Set how parallel ufuncs distribute iterations across threads:
+
+    - 'static': each thread runs an equal share of the iterations;
+    - 'dynamic': threads run chunks of *grain_size* iterations;
+    - 'guided': threads run chunks of decreasing size, down to
+      *grain_size* iterations.
+
+    With the 'dynamic' and 'guided' policies, a thread which has run its
+    share steals iterations from the other threads, which balances uneven
+    per-element costs.  A *grain_size* of 0 means an automatic choice.
+    """
+    from . import workqueue as lib
+    from ctypes import CFUNCTYPE, c_int, c_ssize_t
+
+    try:
+        policy = SCHEDULES[schedule]
+    except KeyError:
+        raise ValueError("invalid schedule %r, should be one of %s"
+                         % (schedule, ', '.join(sorted(SCHEDULES))))
+    grain_size = int(grain_size)
+    if grain_size < 0:
+        raise ValueError("grain size must be positive or zero")
+    CFUNCTYPE(None, c_int, c_ssize_t)(lib.set_schedule)(policy, grain_size)
+    _schedule[:] = [schedule, grain_size]
+
+
+def get_schedule():
+    """
+    Return the (schedule, grain size) tuple used by parallel ufuncs.
+    """
+    return tuple(_schedule)
+
+
+_schedule = []
+
+
+# The states of parallel ufuncs, by ufunc id.  The states are kept alive
+# by their ufunc.
+_ufunc_states = weakref.WeakValueDictionary()
+
+
+def _check_threshold(threshold):
+    threshold = int(threshold)
+    if threshold < 0:
+        raise ValueError("serial threshold must be positive or zero")
+    return threshold
+
+
+def _get_state(ufunc):
+    try:
+        return _ufunc_states[id(ufunc)]
+    except KeyError:
+        raise TypeError("%r is not a parallel ufunc" % (ufunc,))
+
+
+def set_serial_threshold(ufunc, threshold):
+    """
+    Set the number of iterations below which the parallel *ufunc* runs
+    on the calling thread, without dispatching to the thread pool.
+    Zero means always using the thread pool.
+    """
+    _get_state(ufunc).threshold.value = _check_threshold(threshold)
+
+
+def get_serial_threshold(ufunc):
+    """
+    Get the serial threshold of the parallel *ufunc*.
+    """
+    return _get_state(ufunc).threshold.value
+
+
+def parallel_reduce(ufunc, array):
+    """
+    Reduce all elements of *array* with the binary parallel *ufunc*, like
+    ``ufunc.reduce(array, axis=None)``, using the thread pool: each thread
+    reduces a contiguous part of the array, and the partial results are
+    combined pairwise.
+
+    The ufunc must have been built with an identity, and be associative
+    (the grouping of operations differs from a serial reduction, which
+    may change floating-point results slightly).  Otherwise, or if there
+    is no loop for the array's dtype, or the array is smaller than the
+    serial threshold, this falls back on ``ufunc.reduce()``.
+    """
+    from . import workqueue as lib
+    from ctypes import CFUNCTYPE, c_void_p, c_ssize_t, c_int
+
+    state = _get_state(ufunc)
+    array = np.asarray(array)
+    if array.ndim != 1:
+        array = array.ravel()
+    dtype = array.dtype
+    loop = state.serial_loops.get((dtype, dtype))
+    if (ufunc.nin != 2 or ufunc.identity is None or loop is None
+            or loop[0] != dtype or array.size < state.threshold.value):
+        return ufunc.reduce(array)
+
+    partials = np.empty(NUM_THREADS, dtype=dtype)
+    partials.fill(ufunc.identity)
+    reduce_fn = CFUNCTYPE(None, c_void_p, c_void_p, c_ssize_t, c_ssize_t,
+                          c_void_p, c_ssize_t, c_void_p,
+                          c_int)(lib.parallel_reduce)
+    reduce_fn(loop[1], array.ctypes.data, array.size, array.strides[0],
+              partials.ctypes.data, partials.itemsize, None, len(partials))
+    return partials[0]
+
+
+def get_num_threads():
+    """
+    Get the number of threads used by parallel ufuncs.
+    """
+    from . import workqueue as lib
+    from ctypes import CFUNCTYPE, c_int
+
+    n = CFUNCTYPE(c_int)(lib.get_num_threads)()
+    # Before the thread pool is launched
+    return n or NUM_THREADS
+
+
+def parallel_map(func, array, chunks=None):
+    """
+    Split *array* along its first axis into *chunks* views (by default, one
+    per thread, see set_num_threads()), and call *func* on each view from
+    the thread pool.  Return the results concatenated along the first axis
+    if they are all arrays, None if they are all None, otherwise the list
+    of results.  If some calls raise an exception, the exception of the
+    first chunk is re-raised.
+
+    *func* should be a function compiled with ``nogil=True``: other
+    functions hold the GIL, so that the calls can't run concurrently.
+    """
+    from . import workqueue as lib
+    from ctypes import CFUNCTYPE, POINTER, c_void_p, c_ssize_t, c_int
+    from numba.runtime import rtsys
+
+    array = np.asarray(array)
+    if array.ndim == 0:
+        raise ValueError("cannot split a 0-d array")
+    if chunks is None:
+        chunks = get_num_threads()
+    chunks = int(chunks)
+    if chunks < 1:
+        raise ValueError("number of chunks must be at least 1")
+    views = np.array_split(array, max(1, min(chunks, len(array))))
+    results = [None] * len(views)
+    errors = []
+
+    # The kernel runs a range of chunks, whose start is passed as the
+    # address of a pseudo-array at address 0 with a unit step.  ctypes
+    # acquires the GIL when calling it from a worker thread.
+    @CFUNCTYPE(None, POINTER(c_void_p), POINTER(c_ssize_t),
+               POINTER(c_ssize_t), c_void_p)
+    def kernel(args, dims, steps, data):
+        start = args[0] or 0
+        for i in range(start, start + dims[0]):
+            try:
+                results[i] = func(views[i])
+            except BaseException:
+                errors.append((i, sys.exc_info()))
+
+    _launch_threads()
+    parallel_for = CFUNCTYPE(None, c_void_p, c_void_p, c_void_p, c_void_p,
+                             c_void_p, c_int, c_int)(lib.parallel_for)
+    # The GIL is released during the call, and *func* may share meminfos
+    # with functions compiled with non-atomic refcounts
+    rtsys.adjust_nogil_count(1)
+    try:
+        parallel_for(ctypes.cast(kernel, c_void_p),
+                     (c_void_p * 1)(None), (c_ssize_t * 1)(len(views)),
+                     (c_ssize_t * 1)(1), None, 1, 1)
+    finally:
+        rtsys.adjust_nogil_count(-1)
+
+    if errors:
+        errors.sort(key=lambda error: error[0])
+        six.reraise(*errors[0][1])
+    if all(res is None for res in results):
+        return None
+    if all(isinstance(res, np.ndarray) and res.ndim > 0 for res in results):
+        return np.concatenate(results)
+    return results
 
 
 def _init():
@@ -239,6 +537,8 @@ def _init():
     ll.add_symbol('numba_add_task', lib.add_task)
     ll.add_symbol('numba_synchronize', lib.synchronize)
     ll.add_symbol('numba_ready', lib.ready)
+    ll.add_symbol('numba_parallel_for', lib.parallel_for)
+    ll.add_symbol('numba_launch_threads', lib.launch_threads)
 
     set_cas = CFUNCTYPE(None, c_void_p)(lib.set_cas)
 
@@ -247,6 +547,13 @@ def _init():
 
     _keepalive.append(_ProtectEngineDestroy(set_cas, engine))
 
+    try:
+        set_schedule(config.PARALLEL_SCHEDULE, config.PARALLEL_GRAIN_SIZE)
+    except ValueError as e:
+        warnings.warn("invalid NUMBA_PARALLEL_SCHEDULE or "
+                      "NUMBA_PARALLEL_GRAIN_SIZE: %s" % (e,), NumbaWarning)
+        set_schedule('guided')
+
 
 _init()
 
@@ -2,11 +2,25 @@
 Implement parallel vectorize workqueue.
 
 This keeps a set of worker threads running all the time.
-They wait and spin on a task queue for jobs.
+They wait on a task queue for jobs: state changes are first polled for
+a short while, then waited for by blocking on a condition variable, so
+that idle workers don't use any CPU.
+
+parallel_for() splits the outer iterations of a ufunc or gufunc loop into
+one range per thread.  Depending on the scheduling policy, each thread then runs its
+range in a single call (static), or in chunks of a fixed size (dynamic)
+or of decreasing size (guided); in the latter cases a thread which has
+exhausted its range steals half of the largest remaining range.
+
+parallel_reduce() reduces a 1-d array with a binary ufunc loop: each
+thread reduces a contiguous range, then the partial results are combined
+pairwise.
 
 **WARNING**
 This module is not thread-safe.  Adding task to queue is not protected from
-race condition.
+race condition.  parallel_for() and parallel_reduce() may however be called
+from several threads, or from within a task: only one call at a time uses
+the thread pool, the others run serially.
 */
 
 #ifdef _MSC_VER
@@ -21,34 +35,23 @@ race condition.
     #define NUMBA_PTHREAD
 #endif
 
+#include "../_pymodule.h"
 #include <string.h>
 #include <stdio.h>
 #include "workqueue.h"
-#include "../_pymodule.h"
 
 static cas_function_t *cas = NULL;
 
-void cas_wait(volatile int *ptr, const int old, const int repl) {
-    int out = repl;
-    int timeout = 1;   /* starting from 1us nap */
-    static const int MAX_WAIT_TIME = 20 * 1000; /* max wait is 20ms */
-
-    while (1) {
-        if (cas) { /* protect against CAS function being released by LLVM during
-                      interpreter teardown. */
-            out = cas(ptr, old, repl);
-            if (out == old) return;
-        }
+/* Number of polling iterations before blocking in queue_transition() */
+#define SPIN_COUNT 2000
 
-        take_a_nap(timeout);
-
-        /* Exponentially increase the wait time until the max has reached*/
-        timeout <<= 1;
-        if (timeout >= MAX_WAIT_TIME) {
-            timeout = MAX_WAIT_TIME;
-        }
-    }
-}
+#if defined(__GNUC__) && (defined(__i386__) || defined(__x86_64__))
+    #define cpu_relax() __builtin_ia32_pause()
+#elif defined(_MSC_VER)
+    #define cpu_relax() YieldProcessor()
+#else
+    #define cpu_relax()
+#endif
 
 /* As the thread-pool isn't inherited by children,
    free the task-queue, too. */
@@ -83,6 +86,27 @@ void take_a_nap(int usec) {
     usleep(usec);
 }
 
+void parking_init(parking_t *parking) {
+    pthread_mutex_init(&parking->mutex, NULL);
+    pthread_cond_init(&parking->cond, NULL);
+}
+
+void parking_lock(parking_t *parking) {
+    pthread_mutex_lock(&parking->mutex);
+}
+
+void parking_unlock(parking_t *parking) {
+    pthread_mutex_unlock(&parking->mutex);
+}
+
+void parking_wait(parking_t *parking) {
+    pthread_cond_wait(&parking->cond, &parking->mutex);
+}
+
+void parking_wake_all(parking_t *parking) {
+    pthread_cond_broadcast(&parking->cond);
+}
+
 
 #endif
 
@@ -135,6 +159,27 @@ void take_a_nap(int usec) {
     Sleep(0);
 }
 
+void parking_init(parking_t *parking) {
+    InitializeCriticalSection(&parking->mutex);
+    InitializeConditionVariable(&parking->cond);
+}
+
+void parking_lock(parking_t *parking) {
+    EnterCriticalSection(&parking->mutex);
+}
+
+void parking_unlock(parking_t *parking) {
+    LeaveCriticalSection(&parking->mutex);
+}
+
+void parking_wait(parking_t *parking) {
+    SleepConditionVariableCS(&parking->cond, &parking->mutex, INFINITE);
+}
+
+void parking_wake_all(parking_t *parking) {
+    WakeAllConditionVariable(&parking->cond);
+}
+
 
 #endif
 
@@ -143,20 +188,71 @@ typedef struct Task{
     void *args, *dims, *steps, *data;
 } Task;
 
-typedef struct {
+struct Queue {
     volatile int lock;
     Task task;
-} Queue;
+    /* Waiters for a state change of `lock` block on this */
+    parking_t parking;
+};
 
 
 static Queue *queues = NULL;
 static int queue_count;
 static int queue_pivot = 0;
+/* Number of tasks added since the last synchronize() */
+static int task_count = 0;
+/* Number of threads used by parallel_for(), 0 meaning all of them */
+static int num_threads = 0;
+/* Scheduling policy and chunk size (0 for automatic) of parallel_for() */
+static int schedule = SCHEDULE_GUIDED;
+static Py_intptr_t grain_size = 0;
+/* Set while a parallel_for() or parallel_reduce() call owns the queues */
+static volatile int pool_busy = 0;
 
 void set_cas(void *ptr) {
     cas = ptr;
 }
 
+static int try_transition(Queue *queue, int old, int repl) {
+    /* The CAS function may be released by LLVM during interpreter
+       teardown */
+    return cas != NULL && cas(&queue->lock, old, repl) == old;
+}
+
+void queue_transition(Queue *queue, int old, int repl) {
+    int spins;
+
+    for (spins = 0; spins < SPIN_COUNT; ++spins) {
+        if (try_transition(queue, old, repl))
+            goto done;
+        cpu_relax();
+    }
+    /* Checking under the lock ensures the wake-up isn't missed */
+    parking_lock(&queue->parking);
+    while (!try_transition(queue, old, repl)) {
+        parking_wait(&queue->parking);
+    }
+    parking_unlock(&queue->parking);
+
+done:
+    /* Wake up the other side, which may be waiting for this state */
+    parking_lock(&queue->parking);
+    parking_wake_all(&queue->parking);
+    parking_unlock(&queue->parking);
+}
+
+/* Take ownership of the queues for a parallel call.  Fails if another
+   call is in progress, either concurrently in another thread or in a
+   nested call from a worker (e.g. a prange() loop inside a parallel ufunc).
+   The caller must then run serially. */
+static int acquire_pool(void) {
+    return queues != NULL && cas != NULL && cas(&pool_busy, 0, 1) == 0;
+}
+
+static void release_pool(void) {
+    cas(&pool_busy, 1, 0);
+}
+
 void add_task(void *fn, void *args, void *dims, void *steps, void *data) {
     void (*func)(void *args, void *dims, void *steps, void *data) = fn;
 
@@ -173,7 +269,9 @@ void add_task(void *fn, void *args, void *dims, void *steps, void *data) {
     if ( ++queue_pivot == queue_count ) {
         queue_pivot = 0;
     }
-
+    if (task_count < queue_count) {
+        ++task_count;
+    }
 }
 
 static
@@ -182,12 +280,12 @@ void thread_worker(void *arg) {
     Task *task;
 
     while (1) {
-        cas_wait(&queue->lock, READY, RUNNING);
+        queue_transition(queue, READY, RUNNING);
 
         task = &queue->task;
         task->func(task->args, task->dims, task->steps, task->data);
 
-        cas_wait(&queue->lock, RUNNING, DONE);
+        queue_transition(queue, RUNNING, DONE);
     }
 }
 
@@ -203,6 +301,7 @@ void launch_threads(int count) {
        queue_count = count;
 
        for (i = 0; i < count; ++i) {
+            parking_init(&queues[i].parking);
             numba_new_thread(thread_worker, &queues[i]);
        }
     }
@@ -210,15 +309,314 @@ void launch_threads(int count) {
 
 void synchronize(void) {
     int i;
-    for (i = 0; i < queue_count; ++i) {
-        cas_wait(&queues[i].lock, DONE, IDLE);
+    for (i = 0; i < task_count; ++i) {
+        queue_transition(&queues[i], DONE, IDLE);
     }
+    task_count = 0;
+    queue_pivot = 0;
 }
 
 void ready(void) {
     int i;
-    for (i = 0; i < queue_count; ++i) {
-        cas_wait(&queues[i].lock, IDLE, READY);
+    for (i = 0; i < task_count; ++i) {
+        queue_transition(&queues[i], IDLE, READY);
+    }
+}
+
+void set_num_threads(int count) {
+    num_threads = count;
+}
+
+int get_num_threads(void) {
+    if (num_threads > 0 && (queues == NULL || num_threads < queue_count))
+        return num_threads;
+    return queues != NULL ? queue_count : 0;
+}
+
+void set_schedule(int policy, Py_intptr_t grain) {
+    schedule = policy;
+    grain_size = grain;
+}
+
+/* The remaining iterations [start, end) of one thread */
+typedef struct {
+    volatile int lock;
+    volatile Py_intptr_t start, end;
+} WorkRange;
+
+/* The state of a parallel_for() call, shared by all threads */
+typedef struct {
+    ufunc_kernel_t *fn;
+    char **args;
+    Py_intptr_t *steps;
+    void *data;
+    int array_count;
+    int dim_count;
+    int nthreads;
+    int policy;
+    Py_intptr_t grain;
+    WorkRange *ranges;
+    /* Per-thread scratch space for the arguments and dimensions of
+       a chunk */
+    char **chunk_args;
+    Py_intptr_t *chunk_dims;
+} ParallelFor;
+
+static void range_lock(WorkRange *range) {
+    int spins = 0;
+    while (cas(&range->lock, 0, 1) != 0) {
+        /* Critical sections are very short: yield rarely */
+        if (++spins % 1000 == 0)
+            take_a_nap(1);
+    }
+}
+
+static void range_unlock(WorkRange *range) {
+    cas(&range->lock, 1, 0);
+}
+
+/* Take the next chunk from the thread's own range.  Return its length,
+   or 0 if the range is exhausted. */
+static Py_intptr_t take_chunk(ParallelFor *pf, WorkRange *range,
+                              Py_intptr_t *start) {
+    Py_intptr_t remaining, n;
+
+    range_lock(range);
+    remaining = range->end - range->start;
+    switch (pf->policy) {
+    case SCHEDULE_STATIC:
+        n = remaining;
+        break;
+    case SCHEDULE_GUIDED:
+        /* Large chunks first, then smaller ones to balance the end */
+        n = remaining / 2;
+        if (n < pf->grain)
+            n = pf->grain;
+        break;
+    default:
+        n = pf->grain;
+    }
+    if (n > remaining)
+        n = remaining;
+    *start = range->start;
+    range->start += n;
+    range_unlock(range);
+    return n;
+}
+
+/* Steal the second half of the largest remaining range of another thread
+   into the range of thread `thief`.  Return 0 if no work is left. */
+static int steal_work(ParallelFor *pf, int thief) {
+    WorkRange *own = &pf->ranges[thief];
+    while (1) {
+        WorkRange *victim = NULL;
+        Py_intptr_t best = 0, remaining, mid, end;
+        int i;
+        /* Unlocked reads: only a hint to choose the victim */
+        for (i = 0; i < pf->nthreads; ++i) {
+            remaining = pf->ranges[i].end - pf->ranges[i].start;
+            if (i != thief && remaining > best) {
+                best = remaining;
+                victim = &pf->ranges[i];
+            }
+        }
+        if (victim == NULL)
+            return 0;
+
+        range_lock(victim);
+        remaining = victim->end - victim->start;
+        if (remaining <= 0) {
+            /* Somebody was faster, try again */
+            range_unlock(victim);
+            continue;
+        }
+        end = victim->end;
+        mid = end - (remaining + 1) / 2;
+        victim->end = mid;
+        range_unlock(victim);
+
+        range_lock(own);
+        own->start = mid;
+        own->end = end;
+        range_unlock(own);
+        return 1;
+    }
+}
+
+/* The task run by each thread of a parallel_for() */
+static void run_chunks(void *state, void *index, void *unused1,
+                       void *unused2) {
+    ParallelFor *pf = (ParallelFor *) state;
+    int thread = (int) (Py_intptr_t) index;
+    WorkRange *own = &pf->ranges[thread];
+    char **chunk_args = pf->chunk_args + thread * pf->array_count;
+    Py_intptr_t *chunk_dims = pf->chunk_dims + thread * pf->dim_count;
+    Py_intptr_t start;
+    int j;
+
+    while (1) {
+        Py_intptr_t n = take_chunk(pf, own, &start);
+        if (n == 0) {
+            if (pf->policy == SCHEDULE_STATIC || !steal_work(pf, thread))
+                break;
+            continue;
+        }
+        for (j = 0; j < pf->array_count; ++j) {
+            chunk_args[j] = pf->args[j] + pf->steps[j] * start;
+        }
+        chunk_dims[0] = n;
+        pf->fn(chunk_args, chunk_dims, pf->steps, pf->data);
+    }
+}
+
+void parallel_for(void *fn, char **args, Py_intptr_t *dimensions,
+                  Py_intptr_t *steps, void *data, int array_count,
+                  int dim_count) {
+    int nthreads = get_num_threads();
+    Py_intptr_t total = dimensions[0];
+    Py_intptr_t count;
+    ParallelFor pf;
+    int i, j;
+
+    if (nthreads > total)
+        nthreads = (int) total;
+    if (nthreads <= 1 || !acquire_pool()) {
+        /* Not worth dispatching to the thread pool, or already in use */
+        ((ufunc_kernel_t *) fn)(args, dimensions, steps, data);
+        return;
+    }
+
+    pf.ranges = malloc(sizeof(WorkRange) * nthreads);
+    pf.chunk_args = malloc(sizeof(char *) * nthreads * array_count);
+    pf.chunk_dims = malloc(sizeof(Py_intptr_t) * nthreads * dim_count);
+    if (pf.ranges == NULL || pf.chunk_args == NULL || pf.chunk_dims == NULL) {
+        /* Fall back on serial execution */
+        free(pf.ranges);
+        free(pf.chunk_args);
+        free(pf.chunk_dims);
+        release_pool();
+        ((ufunc_kernel_t *) fn)(args, dimensions, steps, data);
+        return;
+    }
+    pf.fn = (ufunc_kernel_t *) fn;
+    pf.args = args;
+    pf.steps = steps;
+    pf.data = data;
+    pf.array_count = array_count;
+    pf.dim_count = dim_count;
+    pf.nthreads = nthreads;
+    pf.policy = schedule;
+    pf.grain = grain_size;
+    if (pf.grain <= 0) {
+        /* Enough chunks per thread to balance uneven workloads */
+        pf.grain = total / (nthreads * 16);
+        if (pf.grain < 1)
+            pf.grain = 1;
+    }
+
+    /* Start from equal ranges, the last thread taking the left over */
+    count = total / nthreads;
+    for (i = 0; i < nthreads; ++i) {
+        pf.ranges[i].lock = 0;
+        pf.ranges[i].start = count * i;
+        pf.ranges[i].end = (i == nthreads - 1) ? total : count * (i + 1);
+        /* The core dimensions are the same for all chunks */
+        for (j = 1; j < dim_count; ++j) {
+            pf.chunk_dims[i * dim_count + j] = dimensions[j];
+        }
+    }
+    for (i = 0; i < nthreads; ++i) {
+        add_task(run_chunks, &pf, (void *) (Py_intptr_t) i, NULL, NULL);
+    }
+    /* Signal workers that we are ready, then wait for them */
+    ready();
+    synchronize();
+    release_pool();
+
+    free(pf.ranges);
+    free(pf.chunk_args);
+    free(pf.chunk_dims);
+}
+
+/* The state of a parallel_reduce() call, shared by all threads */
+typedef struct {
+    ufunc_kernel_t *fn;
+    char *in;
+    Py_intptr_t count;
+    Py_intptr_t step;
+    char *partials;
+    Py_intptr_t itemsize;
+    void *data;
+    int nthreads;
+} ParallelReduce;
+
+/* Accumulate `count` elements of `in` (with stride `step`) into `acc` */
+static void reduce_into(ufunc_kernel_t *fn, char *acc, char *in,
+                        Py_intptr_t count, Py_intptr_t step, void *data) {
+    /* Same convention as Numpy's reductions: the output aliases the first
+       input, and both have a zero stride */
+    char *args[3];
+    Py_intptr_t steps[3];
+
+    args[0] = acc;
+    args[1] = in;
+    args[2] = acc;
+    steps[0] = 0;
+    steps[1] = step;
+    steps[2] = 0;
+    fn(args, &count, steps, data);
+}
+
+/* The task run by each thread of a parallel_reduce() */
+static void reduce_range(void *state, void *index, void *unused1,
+                         void *unused2) {
+    ParallelReduce *pr = (ParallelReduce *) state;
+    int thread = (int) (Py_intptr_t) index;
+    /* Contiguous, deterministic ranges for reproducible results */
+    Py_intptr_t start = pr->count * thread / pr->nthreads;
+    Py_intptr_t end = pr->count * (thread + 1) / pr->nthreads;
+
+    reduce_into(pr->fn, pr->partials + thread * pr->itemsize,
+                pr->in + start * pr->step, end - start, pr->step, pr->data);
+}
+
+void parallel_reduce(void *fn, char *in, Py_intptr_t count, Py_intptr_t step,
+                     char *partials, Py_intptr_t itemsize, void *data,
+                     int nparts) {
+    ParallelReduce pr;
+    int nthreads = get_num_threads();
+    int i, stride;
+
+    if (nthreads > nparts)
+        nthreads = nparts;
+    if (nthreads > count)
+        nthreads = (int) count;
+    if (nthreads <= 1 || !acquire_pool()) {
+        reduce_into((ufunc_kernel_t *) fn, partials, in, count, step, data);
+        return;
+    }
+
+    pr.fn = (ufunc_kernel_t *) fn;
+    pr.in = in;
+    pr.count = count;
+    pr.step = step;
+    pr.partials = partials;
+    pr.itemsize = itemsize;
+    pr.data = data;
+    pr.nthreads = nthreads;
+    for (i = 0; i < nthreads; ++i) {
+        add_task(reduce_range, &pr, (void *) (Py_intptr_t) i, NULL, NULL);
+    }
+    ready();
+    synchronize();
+    release_pool();
+
+    /* Tree combine of the partial results */
+    for (stride = 1; stride < nthreads; stride *= 2) {
+        for (i = 0; i + stride < nthreads; i += 2 * stride) {
+            reduce_into(pr.fn, partials + i * itemsize,
+                        partials + (i + stride) * itemsize, 1, 0, data);
+        }
     }
 }
 
@@ -226,6 +624,7 @@ static void reset_after_fork(void)
 {
   free(queues);
   queues = NULL;
+  pool_busy = 0;
 }
 
 MOD_INIT(workqueue) {
@@ -244,6 +643,16 @@ MOD_INIT(workqueue) {
                            PyLong_FromVoidPtr(&ready));
     PyObject_SetAttrString(m, "add_task",
                            PyLong_FromVoidPtr(&add_task));
+    PyObject_SetAttrString(m, "parallel_for",
+                           PyLong_FromVoidPtr(&parallel_for));
+    PyObject_SetAttrString(m, "parallel_reduce",
+                           PyLong_FromVoidPtr(&parallel_reduce));
+    PyObject_SetAttrString(m, "set_num_threads",
+                           PyLong_FromVoidPtr(&set_num_threads));
+    PyObject_SetAttrString(m, "get_num_threads",
+                           PyLong_FromVoidPtr(&get_num_threads));
+    PyObject_SetAttrString(m, "set_schedule",
+                           PyLong_FromVoidPtr(&set_schedule));
 
     return MOD_SUCCESS_VAL(m);
 }
@@ -1,5 +1,9 @@
 typedef struct opaque_thread * thread_pointer;
 
+/* The signature of a ufunc inner loop */
+typedef void ufunc_kernel_t(char **args, Py_intptr_t *dimensions,
+                            Py_intptr_t *steps, void *data);
+
 enum QUEUE_STATE {
     /*
     The queue has 4 states:
@@ -27,12 +31,38 @@ It is generated from parallel.py by LLVM to get a portable CAS function.
 typedef int cas_function_t(volatile int *ptr, int old, int val);
 
 /*
-Do CAS until successful.
-Spin until the value in `ptr` changes from `old` to `repl`.
-Takes a 1us nap in after each CAS failure.
+A mutex and condition variable, to block threads waiting for a queue
+state change.
+*/
+#ifdef _MSC_VER
+typedef struct {
+    CRITICAL_SECTION mutex;
+    CONDITION_VARIABLE cond;
+} parking_t;
+#else
+typedef struct {
+    pthread_mutex_t mutex;
+    pthread_cond_t cond;
+} parking_t;
+#endif
+
+static void parking_init(parking_t *parking);
+static void parking_lock(parking_t *parking);
+static void parking_unlock(parking_t *parking);
+/* Wait until woken up; the lock must be held */
+static void parking_wait(parking_t *parking);
+static void parking_wake_all(parking_t *parking);
+
+typedef struct Queue Queue;
+
+/*
+Do CAS on the queue state until successful, i.e. wait until the state
+changes from `old`, then set it to `repl`, and wake up the threads
+waiting on the queue.
+Polls for a short time, then blocks until woken up.
 */
 static
-void cas_wait(volatile int *ptr, const int old, const int repl);
+void queue_transition(Queue *queue, int old, int repl);
 
 /* Launch new thread */
 static
@@ -66,3 +96,47 @@ void synchronize(void);
 /* Signal worker threads that tasks are added and it is ready to run */
 static
 void ready(void);
+
+/* Set the number of threads used by parallel_for(), at most the number of
+launched threads.  Zero means all of them.
+*/
+static
+void set_num_threads(int count);
+
+/* Get the number of threads used by parallel_for() */
+static
+int get_num_threads(void);
+
+/* Scheduling policies of parallel_for() */
+enum SCHEDULE_POLICY {
+    SCHEDULE_STATIC = 0, SCHEDULE_DYNAMIC, SCHEDULE_GUIDED
+};
+
+/* Set the scheduling policy and the chunk size (in iterations, 0 for an
+automatic choice) of parallel_for().
+*/
+static
+void set_schedule(int policy, Py_intptr_t grain);
+
+/* Run the ufunc inner loop `fn` over the outer dimension, split across
+get_num_threads() threads according to the scheduling policy, and wait
+for completion.
+`array_count` is the number of arrays in `args` (i.e. of outer steps at the
+start of `steps`), and `dim_count` the number of entries in `dimensions`,
+more than 1 for the core dimensions of a generalized ufunc.
+*/
+static
+void parallel_for(void *fn, char **args, Py_intptr_t *dimensions,
+                  Py_intptr_t *steps, void *data, int array_count,
+                  int dim_count);
+
+/* Reduce the `count` elements of 1-d array `in` (with stride `step`) using
+the binary ufunc inner loop `fn`.  Each of up to `nparts` threads reduces a
+contiguous range into `partials`, an array of `nparts` elements of size
+`itemsize` initialized to the ufunc identity, then the partial results are
+combined pairwise into the first element of `partials`.
+*/
+static
+void parallel_reduce(void *fn, char *in, Py_intptr_t count, Py_intptr_t step,
+                     char *partials, Py_intptr_t itemsize, void *data,
+                     int nparts);
@@ -7,7 +7,8 @@ import subprocess
 
 
 def make_parser():
-    parser = argparse.ArgumentParser()
+    parser = argparse.ArgumentParser(
+        epilog='Run "numba --cache -h" for managing cache bundles')
     parser.add_argument('--annotate', help='Annotate source',
                         action='store_true')
     parser.add_argument('--dump-llvm', action="store_true",
@@ -26,7 +27,50 @@ def make_parser():
     return parser
 
 
+def make_cache_parser():
+    parser = argparse.ArgumentParser(
+        prog='numba --cache',
+        description='Manage bundles of on-disk cached compiled functions')
+    subparsers = parser.add_subparsers(dest='command')
+    subparsers.required = True
+
+    export_parser = subparsers.add_parser(
+        'export', help='Export the cached functions of a package '
+                       'into a bundle file')
+    export_parser.add_argument('package', help='Package or module name')
+    export_parser.add_argument('bundle', help='Bundle filename')
+
+    import_parser = subparsers.add_parser(
+        'import', help='Install the cached functions of a bundle file')
+    import_parser.add_argument('bundle', help='Bundle filename')
+    import_parser.add_argument('--cache-dir',
+                               help='Install into this cache directory '
+                                    '(default: NUMBA_CACHE_DIR or the '
+                                    'packages\' __pycache__ directories)')
+    return parser
+
+
+def cache_main(argv):
+    parser = make_cache_parser()
+    args = parser.parse_args(argv)
+
+    from numba import dispatcher
+
+    if args.command == 'export':
+        n = dispatcher.export_cache_bundle(args.package, args.bundle)
+        print("Exported %d cache files to %s" % (n, args.bundle))
+    else:
+        n = dispatcher.import_cache_bundle(args.bundle, args.cache_dir)
+        print("Imported %d cache files from %s" % (n, args.bundle))
+
+
 def main():
+    # An option rather than a plain subcommand, so as not to shadow
+    # running a script named "cache"
+    if sys.argv[1:2] == ['--cache']:
+        cache_main(sys.argv[2:])
+        return
+
     parser = make_parser()
     args = parser.parse_args()
 
@@ -0,0 +1,521 @@
+"""
+Lowering of prange() loops in nopython mode.
+
+The body of a prange() loop is outlined into a separate function running
+a range of iterations, which the workqueue's parallel_for() calls on
+chunks of the iteration space from the thread pool.
+
+Variables which are only read in the loop are shared with the enclosing
+function.  Variables assigned in the loop are private to each iteration,
+except scalar variables only updated with an in-place operator
+(e.g. ``s += x``), which are reductions: each chunk accumulates into a
+private copy, which is then combined into the shared variable.
+"""
+from __future__ import print_function, division, absolute_import
+
+from llvmlite.llvmpy.core import (Constant, Type, Builder, ICMP_NE, ICMP_SGT,
+                                  ICMP_SLT, LINKAGE_INTERNAL)
+
+from . import cgutils, ir, types, utils
+from .errors import LoweringError
+from .lowering import Lower
+from .special import prange
+from .targets import rangeobj
+from .targets.callconv import excinfo_ptr_t
+from .typing import signature
+
+
+# The in-place operators supported for reductions, and their identity
+_REDUCTION_IDENTITIES = {'+=': 0, '*=': 1}
+
+# The arguments of an outlined loop body: the loop context, the first
+# iteration and the number of iterations
+_BODY_ARGTYPES = (types.voidptr, types.intp, types.intp)
+
+# The loop context passed to the outlined body is an array of pointers:
+# to the error code, the reduction lock, the exception info, the start
+# and step of the range, then to the shared and reduction variables.
+_CODE_SLOT = 0
+_LOCK_SLOT = 1
+_EXCINFO_SLOT = 2
+_START_SLOT = 3
+_STEP_SLOT = 4
+_VARS_SLOT = 5
+
+
+class ParallelLoop(object):
+    """
+    A prange() loop of the function being lowered.
+    """
+
+    def __init__(self, header, body, entry, exit, iterator, index):
+        # Offset of the loop header (the FOR_ITER block)
+        self.header = header
+        # Offsets of the other blocks of the loop
+        self.body = body
+        # Offsets of the first block of the loop body, and of the exit block
+        self.entry = entry
+        self.exit = exit
+        # The range iterator, and the variable receiving the index
+        self.iterator = iterator
+        self.index = index
+        # Variables read from the enclosing function
+        self.shared = []
+        # {variable name: in-place operator} for reduction variables
+        self.reductions = {}
+        # Variables private to each iteration
+        self.private = set()
+
+
+def find_parallel_loops(lower):
+    """
+    Return the list of ParallelLoop objects for the prange() loops of the
+    function being lowered by *lower*.  prange() loops nested inside
+    another one run serially.
+    """
+    context = lower.context
+    interp = lower.interp
+    if (not context.parallel_loops or context.aot_mode
+            or interp.generator_info is not None):
+        return []
+
+    candidates = {}
+    for header, loop in interp.cfa.graph.loops().items():
+        iterator = _get_prange_iterator(interp, interp.blocks[header])
+        if iterator is not None:
+            candidates[header] = (loop, iterator)
+
+    loops = []
+    for header, (loop, iterator) in sorted(candidates.items()):
+        nested = any(header in other.body
+                     for other_header, (other, _) in candidates.items()
+                     if other_header != header)
+        if not nested:
+            loops.append(_analyze_loop(lower, loop, iterator))
+    return loops
+
+
+def _get_prange_iterator(interp, block):
+    """
+    If *block* is the header of a loop over prange(), return the name of
+    the range iterator variable, otherwise None.
+    """
+    for stmt in block.body:
+        if (isinstance(stmt, ir.Assign) and isinstance(stmt.value, ir.Expr)
+                and stmt.value.op == 'iternext'):
+            iterator = stmt.value.value
+            break
+    else:
+        return None
+    try:
+        getiter = interp.get_definition(iterator)
+        if not (isinstance(getiter, ir.Expr) and getiter.op == 'getiter'):
+            return None
+        call = interp.get_definition(getiter.value)
+        if not (isinstance(call, ir.Expr) and call.op == 'call'):
+            return None
+        func = interp.get_definition(call.func)
+        if isinstance(func, ir.Expr) and func.op == 'getattr':
+            # e.g. numba.prange()
+            module = interp.get_definition(func.value)
+            if not isinstance(module, (ir.Global, ir.FreeVar)):
+                return None
+            func = getattr(module.value, func.attr, None)
+        elif isinstance(func, (ir.Global, ir.FreeVar)):
+            func = func.value
+        else:
+            return None
+    except KeyError:
+        return None
+    return iterator.name if func is prange else None
+
+
+def _analyze_loop(lower, loop, iterator):
+    """
+    Check that the prange() *loop* can be outlined, and classify its
+    variables.
+    """
+    interp = lower.interp
+    blocks = interp.blocks
+    header = blocks[loop.header]
+    branch = header.terminator
+    loc = branch.loc
+    index = [stmt.target.name for stmt in header.body
+             if isinstance(stmt, ir.Assign) and isinstance(stmt.value, ir.Expr)
+             and stmt.value.op == 'pair_first']
+    # Blocks ending in a raise statement have no successors, so they are
+    # exits of the natural loop: they are outlined with the loop body.
+    raising = set(offset for offset in loop.exits
+                  if isinstance(blocks[offset].terminator, ir.Raise))
+    if loop.exits - raising != set([branch.falsebr]):
+        raise LoweringError("cannot exit a prange() loop with break or "
+                            "return", loc)
+
+    body = sorted((loop.body | raising) - set([loop.header]))
+    assigned = set()
+    used = set()
+    for offset in body:
+        for stmt in blocks[offset].body:
+            if isinstance(stmt, ir.Del):
+                continue
+            if isinstance(stmt, ir.Assign):
+                assigned.add(stmt.target.name)
+            used.update(var.name for var in stmt.list_vars())
+
+    # Variables assigned before the loop, and used after it
+    assigned_before = set()
+    used_after = set()
+    for offset, block in blocks.items():
+        if offset in body or offset == loop.header:
+            continue
+        for stmt in block.body:
+            if offset < loop.header and isinstance(stmt, ir.Assign):
+                assigned_before.add(stmt.target.name)
+            elif offset > loop.header and not isinstance(stmt, ir.Del):
+                used_after.update(var.name for var in stmt.list_vars())
+
+    ploop = ParallelLoop(header=loop.header, body=body, entry=branch.truebr,
+                         exit=branch.falsebr, iterator=iterator,
+                         index=index[0])
+    for name in sorted(assigned):
+        fn = _match_reduction(interp, blocks, body, name)
+        if (fn is not None and name in assigned_before and
+                isinstance(lower.typeof(name), (types.Integer, types.Float))):
+            ploop.reductions[name] = fn
+        elif name in assigned_before or name in used_after:
+            ops = ', '.join(sorted(_REDUCTION_IDENTITIES))
+            raise LoweringError("variable '%s' is assigned in a prange() "
+                                "loop and used outside of it, which is only "
+                                "supported for scalar reductions with %s"
+                                % (name, ops), loc)
+        else:
+            ploop.private.add(name)
+    ploop.shared = sorted(used - assigned - set([ploop.index]))
+    return ploop
+
+
+def _match_reduction(interp, blocks, body, name):
+    """
+    If variable *name* is only used as the target of an in-place operator
+    in the loop *body*, return the operator, otherwise None.
+    """
+    fn = None
+    for offset in body:
+        for stmt in blocks[offset].body:
+            if isinstance(stmt, ir.Del):
+                continue
+            if name not in [var.name for var in stmt.list_vars()]:
+                continue
+            if not isinstance(stmt, ir.Assign):
+                return None
+            if stmt.target.name == name:
+                # name = $result, with $result = inplace_binop(name, ...)
+                if not isinstance(stmt.value, ir.Var):
+                    return None
+                try:
+                    expr = interp.get_definition(stmt.value)
+                except KeyError:
+                    return None
+            else:
+                expr = stmt.value
+            if not (isinstance(expr, ir.Expr) and expr.op == 'inplace_binop'
+                    and expr.lhs.name == name and expr.rhs.name != name
+                    and expr.fn in _REDUCTION_IDENTITIES):
+                return None
+            if fn is not None and expr.fn != fn:
+                return None
+            fn = expr.fn
+    return fn
+
+
+class ParforLower(object):
+    """
+    Lower a prange() loop in place of its header block, in the function
+    being lowered by *lower*.
+    """
+
+    def __init__(self, lower, loop):
+        self.lower = lower
+        self.context = lower.context
+        self.loop = loop
+
+    def lower_loop(self):
+        """
+        Run the loop's iterations on the thread pool, propagate the first
+        error raised by an iteration, then jump to the loop exit.
+        """
+        from .npyufunc import parallel
+
+        lower = self.lower
+        context = self.context
+        builder = lower.builder
+        loop = self.loop
+        int_t = Type.int()
+        intp_t = context.get_value_type(types.intp)
+        byte_ptr_t = Type.pointer(Type.int(8))
+
+        itty = lower.typeof(loop.iterator)
+        indexty = lower.typeof(loop.index)
+        it = rangeobj.make_range_iterator(itty)(
+            context, builder, value=lower.loadvar(loop.iterator))
+        count = builder.load(it.count)
+
+        code = cgutils.alloca_once_value(builder, Constant.int(int_t, 0))
+        lock = cgutils.alloca_once_value(builder, Constant.int(int_t, 0))
+        excinfo = cgutils.alloca_once(builder, excinfo_ptr_t)
+        slots = [code, lock, excinfo,
+                 cgutils.alloca_once_value(builder, builder.load(it.iter)),
+                 cgutils.alloca_once_value(builder, it.step)]
+        for name in loop.shared + sorted(loop.reductions):
+            if name not in lower.varmap:
+                lower.varmap[name] = lower.alloca(name, lower.typeof(name))
+            slots.append(lower.getvar(name))
+        loop_ctx = cgutils.alloca_once(builder, byte_ptr_t, size=len(slots))
+        for i, ptr in enumerate(slots):
+            builder.store(builder.bitcast(ptr, byte_ptr_t),
+                          builder.gep(loop_ctx, [Constant.int(int_t, i)]))
+
+        with cgutils.if_likely(builder,
+                               builder.icmp(ICMP_SGT, count,
+                                            Constant.int(count.type, 0))):
+            kernel = self.build_kernel(self.build_body())
+            # The first iteration of each chunk is passed as the address
+            # of a pseudo-array at address 0 with a unit step.
+            kernel_args = cgutils.alloca_once_value(builder,
+                                                    Constant.null(byte_ptr_t))
+            kernel_dims = cgutils.alloca_once_value(
+                builder, context.cast(builder, count, indexty, types.intp))
+            kernel_steps = cgutils.alloca_once_value(builder,
+                                                     Constant.int(intp_t, 1))
+            parallel.call_launch_threads(builder)
+            parallel.call_parallel_for(
+                context, builder,
+                [builder.bitcast(kernel, byte_ptr_t), kernel_args,
+                 kernel_dims, kernel_steps,
+                 builder.bitcast(loop_ctx, byte_ptr_t),
+                 Constant.int(int_t, 1), Constant.int(int_t, 1)])
+
+            retcode = builder.load(code)
+            with cgutils.if_unlikely(builder,
+                                     builder.icmp(ICMP_NE, retcode,
+                                                  Constant.int(int_t, 0))):
+                status = lower.call_conv._get_return_status(
+                    builder, retcode, builder.load(excinfo))
+                lower.call_conv.return_status_propagate(builder, status)
+
+        builder.branch(lower.blkmap[loop.exit])
+
+    def build_body(self):
+        """
+        Outline the loop body into a function with Numba's calling
+        convention.
+        """
+        lower = self.lower
+        fnty = lower.call_conv.get_function_type(types.none, _BODY_ARGTYPES)
+        name = "%s.prange%d" % (lower.fndesc.llvm_func_name, self.loop.header)
+        fn = lower.module.add_function(fnty, name=name)
+        fn.linkage = LINKAGE_INTERNAL
+        body = BodyLower(lower, self.loop, fn)
+        body.lower_body()
+        if body.has_dynamic_globals:
+            lower.has_dynamic_globals = True
+        return fn
+
+    def build_kernel(self, body_fn):
+        """
+        Build a function calling *body_fn* on a chunk of iterations, with
+        the signature of a ufunc inner loop so that it can be run by the
+        workqueue's parallel_for().  The first error is recorded in the
+        loop context.
+        """
+        context = self.context
+        module = self.lower.module
+        int_t = Type.int()
+        intp_t = context.get_value_type(types.intp)
+        byte_ptr_t = Type.pointer(Type.int(8))
+        fnty = Type.function(Type.void(), [Type.pointer(byte_ptr_t),
+                                           Type.pointer(intp_t),
+                                           Type.pointer(intp_t),
+                                           byte_ptr_t])
+        fn = module.add_function(fnty, name="%s.kernel" % (body_fn.name,))
+        fn.linkage = LINKAGE_INTERNAL
+        builder = Builder.new(fn.append_basic_block('entry'))
+        kernel_args, kernel_dims, kernel_steps, kernel_data = fn.args
+
+        first = builder.ptrtoint(builder.load(kernel_args), intp_t)
+        count = builder.load(kernel_dims)
+        status, _ = context.call_conv.call_function(
+            builder, body_fn, types.none, _BODY_ARGTYPES,
+            [kernel_data, first, count])
+        with cgutils.if_unlikely(builder, status.is_error):
+            loop_ctx = builder.bitcast(kernel_data, Type.pointer(byte_ptr_t))
+            code = _load_slot(builder, loop_ctx, _CODE_SLOT, int_t)
+            res = builder.cmpxchg(code, Constant.int(int_t, 0), status.code,
+                                  ordering='seq_cst')
+            with builder.if_then(builder.extract_value(res, 1)):
+                excinfo = _load_slot(builder, loop_ctx, _EXCINFO_SLOT,
+                                     excinfo_ptr_t)
+                builder.store(status.excinfoptr, excinfo)
+        builder.ret_void()
+        return fn
+
+
+def _load_slot(builder, loop_ctx, index, lltype):
+    """
+    Load the pointer to *lltype* at *index* in the loop context.
+    """
+    ptr = builder.load(builder.gep(loop_ctx, [Constant.int(Type.int(), index)]))
+    return builder.bitcast(ptr, Type.pointer(lltype))
+
+
+class BodyLower(Lower):
+    """
+    Lower the body of a prange() loop into *function*, running the
+    iterations [first, first + count) of the loop.
+    """
+
+    def __init__(self, parent, loop, function):
+        # Share the state of the enclosing function's lowering, except
+        # for the variables and blocks.  Refcounts are updated atomically
+        # as the loop body runs concurrently on the thread pool.
+        self.context = parent.context.subtarget(atomic_refct=True)
+        self.library = parent.library
+        self.fndesc = parent.fndesc
+        self.interp = parent.interp
+        self.call_conv = parent.call_conv
+        self.generator_info = None
+        self.module = parent.module
+        self.env = parent.env
+        self.blocks = utils.SortedMap((offset, parent.blocks[offset])
+                                      for offset in loop.body)
+        self.blkmap = {}
+        self.varmap = {}
+        self.firstblk = loop.entry
+        self.loc = -1
+        self.pyapi = None
+        self.function = function
+        self.loop = loop
+        # Nested prange() loops run serially
+        self.parallel_loops = {}
+        self.outlined_blocks = set()
+        # Arrays created in the loop body are allocated normally
+        self.temporary_arrays = {}
+        self.owned_vars = (loop.private | set(loop.reductions)
+                           | set([loop.index]))
+
+    def lower_body(self):
+        context = self.context
+        loop = self.loop
+        fn = self.function
+        int_t = Type.int()
+        byte_ptr_t = Type.pointer(Type.int(8))
+
+        self.entry_block = fn.append_basic_block('entry')
+        self.builder = builder = Builder.new(self.entry_block)
+        self.call_helper = self.call_conv.init_call_helper(builder)
+        arginfo = context.get_arg_packer(_BODY_ARGTYPES)
+        loop_ctx, first, count = arginfo.from_arguments(
+            builder, self.call_conv.get_arguments(fn))
+        loop_ctx = builder.bitcast(loop_ctx, Type.pointer(byte_ptr_t))
+
+        indexty = self.typeof(loop.index)
+        llindex = context.get_value_type(indexty)
+        start = builder.load(_load_slot(builder, loop_ctx, _START_SLOT,
+                                        llindex))
+        step = builder.load(_load_slot(builder, loop_ctx, _STEP_SLOT,
+                                       llindex))
+        code = _load_slot(builder, loop_ctx, _CODE_SLOT, int_t)
+        self.varmap[loop.index] = cgutils.alloca_once(builder, llindex,
+                                                      name=loop.index)
+
+        slot = _VARS_SLOT
+        for name in loop.shared:
+            lltype = context.get_value_type(self.typeof(name))
+            self.varmap[name] = _load_slot(builder, loop_ctx, slot, lltype)
+            slot += 1
+        # Each chunk accumulates into private copies of the reduction
+        # variables
+        targets = {}
+        for name in sorted(loop.reductions):
+            ty = self.typeof(name)
+            targets[name] = _load_slot(builder, loop_ctx, slot,
+                                       context.get_value_type(ty))
+            identity = _REDUCTION_IDENTITIES[loop.reductions[name]]
+            self.varmap[name] = cgutils.alloca_once_value(
+                builder, context.get_constant(ty, identity))
+            slot += 1
+
+        bb_cond = fn.append_basic_block('prange.cond')
+        bb_iter = fn.append_basic_block('prange.iter')
+        bb_latch = fn.append_basic_block('prange.latch')
+        bb_exit = fn.append_basic_block('prange.exit')
+        for offset in self.blocks:
+            self.blkmap[offset] = fn.append_basic_block("B%s" % offset)
+        # Jumps to the loop header start the next iteration
+        self.blkmap[loop.header] = bb_latch
+
+        cur = cgutils.alloca_once_value(builder, first)
+        stop = builder.add(first, count)
+        builder.branch(bb_cond)
+
+        # Stop early if another chunk failed
+        builder.position_at_end(bb_cond)
+        more = builder.icmp(ICMP_SLT, builder.load(cur), stop)
+        failed = builder.icmp(ICMP_NE, builder.load(code),
+                              Constant.int(int_t, 0))
+        builder.cbranch(builder.and_(more, builder.not_(failed)), bb_iter,
+                        bb_exit)
+
+        builder.position_at_end(bb_iter)
+        index = context.cast(builder, builder.load(cur), types.intp, indexty)
+        builder.store(builder.add(start, builder.mul(index, step)),
+                      self.varmap[loop.index])
+        builder.branch(self.blkmap[loop.entry])
+
+        for offset, block in self.blocks.items():
+            self.builder.position_at_end(self.blkmap[offset])
+            self.lower_block(block)
+
+        builder.position_at_end(bb_latch)
+        builder.store(builder.add(builder.load(cur),
+                                  Constant.int(cur.type.pointee, 1)), cur)
+        builder.branch(bb_cond)
+
+        builder.position_at_end(bb_exit)
+        if targets:
+            self.combine_reductions(_load_slot(builder, loop_ctx, _LOCK_SLOT,
+                                               int_t), targets)
+        self.call_conv.return_native_none(builder)
+
+    def combine_reductions(self, lock, targets):
+        """
+        Combine the private reduction variables into the shared *targets*
+        (a dict of pointers by variable name), under a spinlock.
+        """
+        context = self.context
+        builder = self.builder
+        zero = Constant.int(lock.type.pointee, 0)
+        one = Constant.int(lock.type.pointee, 1)
+        bb_spin = builder.append_basic_block('prange.lock')
+        bb_locked = builder.append_basic_block('prange.locked')
+        builder.branch(bb_spin)
+        builder.position_at_end(bb_spin)
+        res = builder.cmpxchg(lock, zero, one, ordering='seq_cst')
+        builder.cbranch(builder.extract_value(res, 1), bb_locked, bb_spin)
+
+        builder.position_at_end(bb_locked)
+        for name, target in sorted(targets.items()):
+            ty = self.typeof(name)
+            # Numbers are immutable: use the copying operator
+            op = self.loop.reductions[name].rstrip('=')
+            impl = context.get_function(op, signature(ty, ty, ty))
+            builder.store(impl(builder, (builder.load(target),
+                                         self.loadvar(name))),
+                          target)
+        builder.atomic_rmw('xchg', lock, zero, 'seq_cst')
+
+    def lower_inst(self, inst):
+        if isinstance(inst, ir.Del) and inst.value not in self.owned_vars:
+            # Shared variables are owned by the enclosing function
+            return
+        super(BodyLower, self).lower_inst(inst)
@@ -9,6 +9,16 @@ memsys_shutdown(PyObject *self, PyObject *args) {
     Py_RETURN_NONE;
 }
 
+static PyObject *
+memsys_adjust_nogil_count(PyObject *self, PyObject *args) {
+    int delta;
+    if (!PyArg_ParseTuple(args, "i", &delta)) {
+        return NULL;
+    }
+    NRT_MemSys_adjust_nogil_count(delta);
+    Py_RETURN_NONE;
+}
+
 static PyObject *
 memsys_use_cpython_allocator(PyObject *self, PyObject *args) {
     NRT_MemSys_set_allocator(PyMem_RawMalloc,
@@ -17,6 +27,16 @@ memsys_use_cpython_allocator(PyObject *self, PyObject *args) {
     Py_RETURN_NONE;
 }
 
+static PyObject *
+memsys_use_pool_allocator(PyObject *self, PyObject *args) {
+    if (NRT_MemSys_use_pool_allocator()) {
+        PyErr_SetString(PyExc_RuntimeError,
+                        "could not initialize the NRT pool allocator");
+        return NULL;
+    }
+    Py_RETURN_NONE;
+}
+
 static PyObject *
 memsys_set_atomic_inc_dec(PyObject *self, PyObject *args) {
     PyObject *addr_inc_obj, *addr_dec_obj;
@@ -65,6 +85,67 @@ memsys_get_stats_mi_free(PyObject *self, PyObject *args) {
     return PyLong_FromSize_t(NRT_MemSys_get_stats_mi_free());
 }
 
+static PyObject *
+memsys_get_stats_pool_hit(PyObject *self, PyObject *args) {
+    return PyLong_FromSize_t(NRT_MemSys_get_stats_pool_hit());
+}
+
+static PyObject *
+memsys_get_stats_pool_miss(PyObject *self, PyObject *args) {
+    return PyLong_FromSize_t(NRT_MemSys_get_stats_pool_miss());
+}
+
+/*
+ * Return the allocation profiles as a list of
+ * (name, count, bytes, live_bytes, peak_bytes) tuples.
+ */
+static PyObject *
+memsys_get_profile(PyObject *self, PyObject *args) {
+    NRT_ProfileEntry *entries = NULL;
+    PyObject *res;
+    size_t i, n, total;
+
+    /* Entries are copied out before building the Python objects, as
+       the latter may release NRT memory and need the profiler's lock. */
+    n = NRT_MemSys_get_profile(NULL, 0);
+    do {
+        PyMem_Free(entries);
+        entries = PyMem_Malloc((n + 1) * sizeof(NRT_ProfileEntry));
+        if (entries == NULL)
+            return PyErr_NoMemory();
+        total = NRT_MemSys_get_profile(entries, n + 1);
+        if (total <= n + 1)
+            break;
+        n = total;
+    } while (1);
+
+    res = PyList_New(total);
+    if (res == NULL)
+        goto done;
+    for (i = 0; i < total; i++) {
+        NRT_ProfileEntry *e = &entries[i];
+        PyObject *tup = Py_BuildValue("snnnn", e->name,
+                                      (Py_ssize_t) e->count,
+                                      (Py_ssize_t) e->bytes,
+                                      (Py_ssize_t) e->live_bytes,
+                                      (Py_ssize_t) e->peak_bytes);
+        if (tup == NULL) {
+            Py_CLEAR(res);
+            goto done;
+        }
+        PyList_SET_ITEM(res, i, tup);
+    }
+done:
+    PyMem_Free(entries);
+    return res;
+}
+
+static PyObject *
+memsys_reset_profile(PyObject *self, PyObject *args) {
+    NRT_MemSys_reset_profile();
+    Py_RETURN_NONE;
+}
+
 
 /*
  * Create a new MemInfo with a owner PyObject
@@ -118,13 +199,19 @@ static PyMethodDef ext_methods[] = {
 #define declmethod(func) { #func , ( PyCFunction )func , METH_VARARGS , NULL }
 #define declmethod_noargs(func) { #func , ( PyCFunction )func , METH_NOARGS, NULL }
     declmethod_noargs(memsys_use_cpython_allocator),
+    declmethod_noargs(memsys_use_pool_allocator),
     declmethod_noargs(memsys_shutdown),
     declmethod(memsys_set_atomic_inc_dec),
     declmethod(memsys_set_atomic_cas),
+    declmethod(memsys_adjust_nogil_count),
     declmethod_noargs(memsys_get_stats_alloc),
     declmethod_noargs(memsys_get_stats_free),
     declmethod_noargs(memsys_get_stats_mi_alloc),
     declmethod_noargs(memsys_get_stats_mi_free),
+    declmethod_noargs(memsys_get_stats_pool_hit),
+    declmethod_noargs(memsys_get_stats_pool_miss),
+    declmethod_noargs(memsys_get_profile),
+    declmethod_noargs(memsys_reset_profile),
     declmethod(meminfo_new),
     declmethod(meminfo_alloc),
     declmethod(meminfo_alloc_safe),
@@ -163,6 +250,9 @@ declmethod(MemInfo_alloc_safe_aligned);
 declmethod(MemInfo_call_dtor);
 declmethod(MemInfo_varsize_alloc);
 declmethod(MemInfo_varsize_realloc);
+declmethod(MemInfo_profile);
+
+_declpointer("MemSys_nogil_count", &NRT_MemSys_nogil_count);
 
 
 #undef declmethod
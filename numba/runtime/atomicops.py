@@ -19,6 +19,7 @@ _meminfo_struct_type = ir.LiteralStructType([
     _pointer_type,  # void *dtor_info
     _pointer_type,  # void *data
     _word_type,     # size_t size
+    _pointer_type,  # nrt_profile_record *profile
     ])
 
 
@@ -40,12 +41,12 @@ def _define_nrt_meminfo_data(module):
     builder.ret(data_ptr)
 
 
-def _define_nrt_incref(module, atomic_incr):
+def _define_nrt_incref(module, atomic_incr, name="NRT_incref"):
     """
-    Implement NRT_incref in the module
+    Implement NRT_incref (or *name*) in the module
     """
     fn_incref = module.get_or_insert_function(incref_decref_ty,
-                                              name="NRT_incref")
+                                              name=name)
     builder = ir.IRBuilder(fn_incref.append_basic_block())
     [ptr] = fn_incref.args
     is_null = builder.icmp_unsigned("==", ptr, cgutils.get_null_value(ptr.type))
@@ -59,14 +60,15 @@ def _define_nrt_incref(module, atomic_incr):
     builder.ret_void()
 
 
-def _define_nrt_decref(module, atomic_decr):
+def _define_nrt_decref(module, atomic_decr, name="NRT_decref"):
     """
-    Implement NRT_decref in the module
+    Implement NRT_decref (or *name*) in the module
     """
     fn_decref = module.get_or_insert_function(incref_decref_ty,
-                                              name="NRT_decref")
-    calldtor = module.add_function(ir.FunctionType(ir.VoidType(), [_pointer_type]),
-                                   name="NRT_MemInfo_call_dtor")
+                                              name=name)
+    calldtor = module.get_or_insert_function(
+        ir.FunctionType(ir.VoidType(), [_pointer_type]),
+        name="NRT_MemInfo_call_dtor")
 
     builder = ir.IRBuilder(fn_decref.append_basic_block())
     [ptr] = fn_decref.args
@@ -119,6 +121,35 @@ def _define_atomic_inc_dec(module, op, ordering):
     return fn_atomic
 
 
+def _define_nonatomic_inc_dec(module, op, atomic_fn):
+    """Define a llvm function for non-atomic increment/decrement to the
+    given module, with the same signature as the function *atomic_fn*
+    defined by _define_atomic_inc_dec().  *atomic_fn* is called instead
+    when some threads run compiled code with the GIL released (see
+    NRT_MemSys_nogil_count in nrt.h), as they may share the meminfo.
+    """
+    ftype = ir.FunctionType(_word_type, [_word_type.as_pointer()])
+    fn_nonatomic = ir.Function(module, ftype,
+                               name="nrt_nonatomic_{0}".format(op))
+    nogil_count = ir.GlobalVariable(module, _word_type,
+                                    "NRT_MemSys_nogil_count")
+
+    [ptr] = fn_nonatomic.args
+    bb = fn_nonatomic.append_basic_block()
+    builder = ir.IRBuilder(bb)
+    ONE = ir.Constant(_word_type, 1)
+    threaded = builder.icmp_unsigned("!=", builder.load(nogil_count),
+                                     ir.Constant(_word_type, 0))
+    with cgutils.if_unlikely(builder, threaded):
+        builder.ret(builder.call(atomic_fn, [ptr]))
+    oldval = builder.load(ptr)
+    newval = getattr(builder, op)(oldval, ONE)
+    builder.store(newval, ptr)
+    builder.ret(newval)
+
+    return fn_nonatomic
+
+
 def _define_atomic_cas(module, ordering):
     """Define a llvm function for atomic compare-and-swap.
     The generated function is a direct wrapper of the LLVM cmpxchg with the
@@ -161,9 +192,14 @@ def create_nrt_module(ctx):
     atomic_dec = _define_atomic_inc_dec(ir_mod, "sub", ordering='monotonic')
     _define_atomic_cas(ir_mod, ordering='monotonic')
 
+    nonatomic_inc = _define_nonatomic_inc_dec(ir_mod, "add", atomic_inc)
+    nonatomic_dec = _define_nonatomic_inc_dec(ir_mod, "sub", atomic_dec)
+
     _define_nrt_meminfo_data(ir_mod)
     _define_nrt_incref(ir_mod, atomic_inc)
     _define_nrt_decref(ir_mod, atomic_dec)
+    _define_nrt_incref(ir_mod, nonatomic_inc, name="NRT_incref_nonatomic")
+    _define_nrt_decref(ir_mod, nonatomic_dec, name="NRT_decref_nonatomic")
 
     return ir_mod, library
 
@@ -181,9 +217,16 @@ def compile_nrt_functions(ctx):
     return library
 
 
-_regex_incref = re.compile(r'\s*call void @NRT_incref\((.*)\)')
-_regex_decref = re.compile(r'\s*call void @NRT_decref\((.*)\)')
+_regex_incref = re.compile(r'\s*call void @NRT_incref(?:_nonatomic)?\((.*)\)')
+_regex_decref = re.compile(r'\s*call void @NRT_decref(?:_nonatomic)?\((.*)\)')
 _regex_bb = re.compile(r'([-a-zA-Z$._][-a-zA-Z$._0-9]*:)|^define')
+_regex_null_refct = re.compile(
+    r'\s*call void @NRT_(incref|decref)(?:_nonatomic)?\(i8\* null\)')
+_regex_label_ref = re.compile(r'label %([-a-zA-Z$._0-9]+|"[^"]*")')
+_regex_ret = re.compile(r'\s*ret\b')
+
+# Set this to False to only prune refct pairs within each basic block.
+_prune_across_blocks = True
 
 
 def remove_redundant_nrt_refct(ll_module):
@@ -194,6 +237,9 @@ def remove_redundant_nrt_refct(ll_module):
     Decref calls are moved after the last incref call in the block to avoid
     temporarily decref'ing to zero (which can happen due to hidden decref from
     alias).
+
+    Pairs in different blocks are then removed when the incref and the decref
+    always execute in lockstep and no other decref can happen between them.
     """
     # Note: As soon as we have better utility in analyzing materialized LLVM
     #       module in llvmlite, we can redo this without so much string
@@ -218,10 +264,15 @@ def remove_redundant_nrt_refct(ll_module):
                 yield False, [line]
 
     def _process_function(func_lines):
-        out = []
+        chunks = []
         for is_bb, bb_lines in _extract_basic_blocks(func_lines):
             if is_bb and bb_lines:
                 bb_lines = _process_basic_block(bb_lines)
+            chunks.append((is_bb, bb_lines))
+        if _prune_across_blocks:
+            _prune_refct_ops_across_blocks(chunks)
+        out = []
+        for _, bb_lines in chunks:
             out += bb_lines
         return out
 
@@ -245,6 +296,7 @@ def remove_redundant_nrt_refct(ll_module):
         yield False, [func_lines[-1]]
 
     def _process_basic_block(bb_lines):
+        bb_lines = _remove_null_refct_ops(bb_lines)
         bb_lines = _move_and_group_decref_after_all_increfs(bb_lines)
         bb_lines = _prune_redundant_refct_ops(bb_lines)
         return bb_lines
@@ -284,6 +336,107 @@ def remove_redundant_nrt_refct(ll_module):
         return [ln for num, ln in enumerate(bb_lines)
                 if num not in to_remove]
 
+    def _remove_null_refct_ops(bb_lines):
+        # NRT_incref and NRT_decref do nothing on a NULL pointer
+        return [ln for ln in bb_lines
+                if _regex_null_refct.match(ln) is None]
+
+    def _prune_refct_ops_across_blocks(chunks):
+        # Rebuild the CFG of the function from its basic blocks
+        names = []
+        bodies = {}
+        label = None
+        for is_bb, bb_lines in chunks[1:-1]:
+            if not is_bb:
+                label = _regex_bb.match(bb_lines[0]).group(1)[:-1]
+            elif bb_lines:
+                if label in bodies:
+                    return
+                names.append(label)
+                bodies[label] = bb_lines
+                label = None
+        if len(names) < 2:
+            return
+
+        succs = {}
+        exits = set()
+        for name in names:
+            succs[name] = set()
+            for ln in bodies[name]:
+                succs[name].update(_regex_label_ref.findall(ln))
+                if _regex_ret.match(ln) is not None:
+                    exits.add(name)
+            if not succs[name] <= set(bodies):
+                # Unnamed or quoted block labels are not understood
+                # by _regex_bb: give up on this function.
+                return
+
+        reach_cache = {}
+
+        def reach(starts, stop):
+            # The blocks reachable from *starts* without going
+            # through *stop*
+            key = (tuple(sorted(starts)), stop)
+            if key not in reach_cache:
+                seen = set()
+                todo = [b for b in starts if b != stop]
+                while todo:
+                    b = todo.pop()
+                    if b not in seen:
+                        seen.add(b)
+                        todo.extend(s for s in succs[b] if s != stop)
+                reach_cache[key] = seen
+            return reach_cache[key]
+
+        def has_decref(lines):
+            return any(_regex_decref.match(ln) is not None
+                       for ln in lines)
+
+        def in_lockstep(a, b):
+            # The incref block *a* must dominate the decref block *b*,
+            # every path leaving *a* must reach *b* before leaving the
+            # function or coming back to *a*, and every path leaving *b*
+            # must come back to *a* before reaching *b* again.  Then both
+            # blocks always execute the same number of times, alternately.
+            if b in reach([names[0]], a):
+                return False
+            if a in exits or not succs[a]:
+                return False
+            between = reach(succs[a], b)
+            if a in between or between & exits:
+                return False
+            if b in reach(succs[b], a):
+                return False
+            return not any(has_decref(bodies[c]) for c in between)
+
+        def find_pair():
+            increfs = defaultdict(dict)
+            decrefs = defaultdict(dict)
+            for name in names:
+                for num, incref_var, decref_var in _examine_refct_op(
+                        bodies[name]):
+                    if incref_var:
+                        # Keep the last incref in the block
+                        increfs[incref_var][name] = num
+                    elif decref_var:
+                        # Keep the first decref in the block
+                        decrefs[decref_var].setdefault(name, num)
+            for var, inc_blocks in increfs.items():
+                for a, inc_num in inc_blocks.items():
+                    for b, dec_num in decrefs[var].items():
+                        if (a != b
+                                and not has_decref(bodies[a][inc_num + 1:])
+                                and not has_decref(bodies[b][:dec_num])
+                                and in_lockstep(a, b)):
+                            return (a, inc_num), (b, dec_num)
+            return None
+
+        pair = find_pair()
+        while pair is not None:
+            for name, num in pair:
+                del bodies[name][num]
+            pair = find_pair()
+
     def _move_and_group_decref_after_all_increfs(bb_lines):
         # find last incref
         last_incref_pos = 0
@@ -313,9 +466,14 @@ def remove_redundant_nrt_refct(ll_module):
 
 
     # Early escape if NRT_incref is not used
-    try:
-        ll_module.get_function('NRT_incref')
-    except NameError:
+    for name in ('NRT_incref', 'NRT_incref_nonatomic'):
+        try:
+            ll_module.get_function(name)
+        except NameError:
+            pass
+        else:
+            break
+    else:
         return ll_module
 
     processed = []
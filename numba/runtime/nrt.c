@@ -3,6 +3,14 @@
 #include "nrt.h"
 #include "assert.h"
 
+#ifdef _MSC_VER
+    #include <windows.h>
+    #define NRT_WINTHREAD
+#else
+    #include <pthread.h>
+    #define NRT_PTHREAD
+#endif
+
 #if !defined MIN
 #define MIN(a, b) ((a) < (b)) ? (a) : (b)
 #endif
@@ -12,6 +20,8 @@ typedef int (*atomic_meminfo_cas_func)(void **ptr, void *cmp,
                                        void *repl, void **oldptr);
 
 
+struct nrt_profile_record;
+
 /* NOTE: if changing the layout, please update numba.runtime.atomicops */
 struct MemInfo {
     size_t            refct;
@@ -19,6 +29,9 @@ struct MemInfo {
     void              *dtor_info;
     void              *data;
     size_t            size;    /* only used for NRT allocated memory */
+    /* The allocation profile of the function which allocated this MemInfo,
+       if any (see NRT_MemInfo_profile()) */
+    struct nrt_profile_record *profile;
 };
 
 
@@ -37,6 +50,37 @@ static void nrt_fatal_error(const char *msg)
     abort();
 }
 
+#ifdef NRT_PTHREAD
+typedef pthread_mutex_t nrt_lock_t;
+
+static int nrt_lock_init(nrt_lock_t *lock) {
+    return pthread_mutex_init(lock, NULL) == 0;
+}
+
+static void nrt_lock_acquire(nrt_lock_t *lock) {
+    pthread_mutex_lock(lock);
+}
+
+static void nrt_lock_release(nrt_lock_t *lock) {
+    pthread_mutex_unlock(lock);
+}
+#else
+typedef CRITICAL_SECTION nrt_lock_t;
+
+static int nrt_lock_init(nrt_lock_t *lock) {
+    InitializeCriticalSection(lock);
+    return 1;
+}
+
+static void nrt_lock_acquire(nrt_lock_t *lock) {
+    EnterCriticalSection(lock);
+}
+
+static void nrt_lock_release(nrt_lock_t *lock) {
+    LeaveCriticalSection(lock);
+}
+#endif
+
 /*
  * Global resources.
  */
@@ -50,6 +94,7 @@ struct MemSys {
     int shutting;
     /* Stats */
     size_t stats_alloc, stats_free, stats_mi_alloc, stats_mi_free;
+    size_t stats_pool_miss;
     /* System allocation functions */
     struct {
         NRT_malloc_func malloc;
@@ -61,12 +106,17 @@ struct MemSys {
 /* The Memory System object */
 static NRT_MemSys TheMSys;
 
+size_t NRT_MemSys_nogil_count = 0;
+
+static void nrt_profile_init(void);
+
 void NRT_MemSys_init(void) {
     memset(&TheMSys, 0, sizeof(NRT_MemSys));
     /* Bind to libc allocator */
     TheMSys.allocator.malloc = malloc;
     TheMSys.allocator.realloc = realloc;
     TheMSys.allocator.free = free;
+    nrt_profile_init();
 }
 
 void NRT_MemSys_shutdown(void) {
@@ -102,6 +152,20 @@ void NRT_MemSys_set_atomic_inc_dec(NRT_atomic_inc_dec_func inc,
     TheMSys.atomic_dec = dec;
 }
 
+void NRT_MemSys_adjust_nogil_count(int delta) {
+    NRT_atomic_inc_dec_func func;
+    if (TheMSys.atomic_inc == NULL) {
+        /* The atomic operations aren't installed yet, so no compiled
+           code can be using the counter */
+        NRT_MemSys_nogil_count += delta;
+        return;
+    }
+    func = delta > 0 ? TheMSys.atomic_inc : TheMSys.atomic_dec;
+    for (; delta != 0; delta += delta > 0 ? -1 : 1) {
+        func(&NRT_MemSys_nogil_count);
+    }
+}
+
 void NRT_MemSys_set_atomic_cas(NRT_atomic_cas_func cas) {
     TheMSys.atomic_cas = (atomic_meminfo_cas_func) cas;
 }
@@ -122,6 +186,10 @@ size_t NRT_MemSys_get_stats_mi_free() {
     return TheMSys.stats_mi_free;
 }
 
+size_t NRT_MemSys_get_stats_pool_miss() {
+    return TheMSys.stats_pool_miss;
+}
+
 static
 size_t nrt_testing_atomic_inc(size_t *ptr){
     /* non atomic */
@@ -164,6 +232,485 @@ void NRT_MemSys_set_atomic_cas_stub(void) {
 }
 
 
+/*
+ * Size-class pool allocator.
+ *
+ * Small blocks are rounded up to a power-of-two size class and recycled
+ * through per-thread free lists, so that temporaries freed and allocated
+ * again in a loop don't go to the system allocator each time.  Each thread
+ * caches a bounded number of bytes per size class; the excess is moved to
+ * a depot shared by all threads, and beyond that released to the system
+ * allocator.  A thread's cache is moved to the depot when the thread exits.
+ * Blocks larger than the largest size class are passed through to the
+ * system allocator.
+ */
+
+/* Size classes are 32 bytes, 64 bytes... up to 64 kB */
+#define NRT_POOL_MIN_SHIFT 5
+#define NRT_POOL_NCLASSES 12
+#define NRT_POOL_LARGE ((size_t) -1)
+#define NRT_POOL_CLASS_SIZE(cls) ((size_t) 1 << (NRT_POOL_MIN_SHIFT + (cls)))
+
+/* Number of bytes cached per size class by each thread, and by the depot */
+#define NRT_POOL_THREAD_BYTES (256 * 1024)
+#define NRT_POOL_DEPOT_BYTES (4 * NRT_POOL_THREAD_BYTES)
+
+/* Header in front of each block (two words, to keep the payload aligned
+   like the system allocator's) */
+typedef struct {
+    size_t size_class;
+    size_t unused;
+} nrt_pool_header;
+
+/* A cached block is linked through its header */
+typedef struct nrt_pool_block {
+    struct nrt_pool_block *next;
+} nrt_pool_block;
+
+typedef struct {
+    nrt_pool_block *head;
+    size_t count;
+} nrt_pool_list;
+
+typedef struct nrt_pool_cache {
+    nrt_pool_list lists[NRT_POOL_NCLASSES];
+    /* Allocations served by this cache, counted without atomic operations
+       so as not to slow down the fast path (the total is therefore only
+       approximate while other threads are allocating) */
+    size_t hits;
+    /* All thread caches are linked together, for the stats */
+    struct nrt_pool_cache *prev, *next;
+} nrt_pool_cache;
+
+#ifdef NRT_PTHREAD
+typedef pthread_key_t nrt_pool_key_t;
+#else
+typedef DWORD nrt_pool_key_t;
+#endif
+
+static struct {
+    /* The underlying system allocator */
+    NRT_malloc_func malloc;
+    NRT_realloc_func realloc;
+    NRT_free_func free;
+    /* The depot and the list of thread caches, protected by the lock */
+    nrt_pool_list depot[NRT_POOL_NCLASSES];
+    nrt_pool_cache *caches;
+    /* Hits of the caches of exited threads */
+    size_t exited_hits;
+    nrt_lock_t lock;
+    /* Thread-local key for the thread's nrt_pool_cache */
+    nrt_pool_key_t cache_key;
+    int initialized;
+} ThePool;
+
+static void nrt_pool_thread_exit(void *cache);
+
+static void nrt_pool_lock(void) {
+    nrt_lock_acquire(&ThePool.lock);
+}
+
+static void nrt_pool_unlock(void) {
+    nrt_lock_release(&ThePool.lock);
+}
+
+#ifdef NRT_PTHREAD
+
+static nrt_pool_cache *nrt_pool_get_thread_cache(void) {
+    return (nrt_pool_cache *) pthread_getspecific(ThePool.cache_key);
+}
+
+static int nrt_pool_set_thread_cache(nrt_pool_cache *cache) {
+    return pthread_setspecific(ThePool.cache_key, cache) == 0;
+}
+
+static int nrt_pool_init_threading(void) {
+    if (!nrt_lock_init(&ThePool.lock))
+        return 0;
+    if (pthread_key_create(&ThePool.cache_key, nrt_pool_thread_exit))
+        return 0;
+    /* Don't let a child process inherit a depot locked by another thread */
+    pthread_atfork(nrt_pool_lock, nrt_pool_unlock, nrt_pool_unlock);
+    return 1;
+}
+
+#else
+
+static nrt_pool_cache *nrt_pool_get_thread_cache(void) {
+    return (nrt_pool_cache *) FlsGetValue(ThePool.cache_key);
+}
+
+static int nrt_pool_set_thread_cache(nrt_pool_cache *cache) {
+    return FlsSetValue(ThePool.cache_key, cache) != 0;
+}
+
+static void WINAPI nrt_pool_fls_callback(void *cache) {
+    nrt_pool_thread_exit(cache);
+}
+
+static int nrt_pool_init_threading(void) {
+    nrt_lock_init(&ThePool.lock);
+    ThePool.cache_key = FlsAlloc(nrt_pool_fls_callback);
+    return ThePool.cache_key != FLS_OUT_OF_INDEXES;
+}
+
+#endif
+
+static size_t nrt_pool_size_class(size_t size) {
+    size_t cls;
+    for (cls = 0; cls < NRT_POOL_NCLASSES; cls++) {
+        if (size <= NRT_POOL_CLASS_SIZE(cls))
+            return cls;
+    }
+    return NRT_POOL_LARGE;
+}
+
+/* Number of blocks a thread caches for size class *cls* */
+static size_t nrt_pool_thread_limit(size_t cls) {
+    size_t limit = NRT_POOL_THREAD_BYTES / NRT_POOL_CLASS_SIZE(cls);
+    return limit < 4 ? 4 : limit;
+}
+
+/* Return the calling thread's cache, creating it if necessary.
+   NULL is returned if it couldn't be created. */
+static nrt_pool_cache *nrt_pool_thread_cache(void) {
+    nrt_pool_cache *cache = nrt_pool_get_thread_cache();
+    if (cache == NULL) {
+        cache = ThePool.malloc(sizeof(nrt_pool_cache));
+        if (cache == NULL)
+            return NULL;
+        memset(cache, 0, sizeof(nrt_pool_cache));
+        if (!nrt_pool_set_thread_cache(cache)) {
+            ThePool.free(cache);
+            return NULL;
+        }
+        nrt_pool_lock();
+        cache->next = ThePool.caches;
+        if (cache->next != NULL)
+            cache->next->prev = cache;
+        ThePool.caches = cache;
+        nrt_pool_unlock();
+    }
+    return cache;
+}
+
+static nrt_pool_block *nrt_pool_list_pop(nrt_pool_list *list) {
+    nrt_pool_block *block = list->head;
+    if (block != NULL) {
+        list->head = block->next;
+        list->count--;
+    }
+    return block;
+}
+
+static void nrt_pool_list_push(nrt_pool_list *list, nrt_pool_block *block) {
+    block->next = list->head;
+    list->head = block;
+    list->count++;
+}
+
+/* Move the blocks of *list* beyond the first *keep* ones to the depot,
+   releasing those which don't fit in it to the system allocator. */
+static void nrt_pool_spill(nrt_pool_list *list, size_t keep, size_t cls) {
+    nrt_pool_list *depot = &ThePool.depot[cls];
+    size_t depot_limit = NRT_POOL_DEPOT_BYTES / NRT_POOL_CLASS_SIZE(cls);
+    nrt_pool_list excess = { NULL, 0 };
+    nrt_pool_block *block;
+
+    nrt_pool_lock();
+    while (list->count > keep) {
+        block = nrt_pool_list_pop(list);
+        if (depot->count < depot_limit)
+            nrt_pool_list_push(depot, block);
+        else
+            nrt_pool_list_push(&excess, block);
+    }
+    nrt_pool_unlock();
+    while ((block = nrt_pool_list_pop(&excess)) != NULL)
+        ThePool.free(block);
+}
+
+/* Fill half of *list*'s capacity from the depot */
+static void nrt_pool_refill(nrt_pool_list *list, size_t cls) {
+    nrt_pool_list *depot = &ThePool.depot[cls];
+    size_t n = nrt_pool_thread_limit(cls) / 2;
+
+    nrt_pool_lock();
+    while (n-- > 0 && depot->head != NULL)
+        nrt_pool_list_push(list, nrt_pool_list_pop(depot));
+    nrt_pool_unlock();
+}
+
+static void nrt_pool_thread_exit(void *arg) {
+    nrt_pool_cache *cache = (nrt_pool_cache *) arg;
+    size_t cls;
+    if (cache == NULL)
+        return;
+    for (cls = 0; cls < NRT_POOL_NCLASSES; cls++)
+        nrt_pool_spill(&cache->lists[cls], 0, cls);
+    nrt_pool_lock();
+    if (cache->prev != NULL)
+        cache->prev->next = cache->next;
+    else
+        ThePool.caches = cache->next;
+    if (cache->next != NULL)
+        cache->next->prev = cache->prev;
+    ThePool.exited_hits += cache->hits;
+    nrt_pool_unlock();
+    ThePool.free(cache);
+}
+
+static void *nrt_pool_malloc(size_t size) {
+    size_t cls = nrt_pool_size_class(size);
+    nrt_pool_header *header = NULL;
+    nrt_pool_cache *cache;
+
+    if (cls == NRT_POOL_LARGE) {
+        if (size > (size_t) -1 - sizeof(nrt_pool_header))
+            return NULL;
+    }
+    else {
+        cache = nrt_pool_thread_cache();
+        if (cache != NULL) {
+            if (cache->lists[cls].head == NULL)
+                nrt_pool_refill(&cache->lists[cls], cls);
+            header = (nrt_pool_header *) nrt_pool_list_pop(&cache->lists[cls]);
+        }
+        if (header != NULL) {
+            cache->hits++;
+            header->size_class = cls;
+            return header + 1;
+        }
+        size = NRT_POOL_CLASS_SIZE(cls);
+    }
+    TheMSys.atomic_inc(&TheMSys.stats_pool_miss);
+    header = ThePool.malloc(sizeof(nrt_pool_header) + size);
+    if (header == NULL)
+        return NULL;
+    header->size_class = cls;
+    return header + 1;
+}
+
+static void nrt_pool_free(void *ptr) {
+    nrt_pool_header *header;
+    nrt_pool_cache *cache;
+    nrt_pool_list *list;
+    size_t cls;
+
+    if (ptr == NULL)
+        return;
+    header = (nrt_pool_header *) ptr - 1;
+    cls = header->size_class;
+    if (cls != NRT_POOL_LARGE) {
+        cache = nrt_pool_thread_cache();
+        if (cache != NULL) {
+            list = &cache->lists[cls];
+            if (list->count >= nrt_pool_thread_limit(cls))
+                nrt_pool_spill(list, list->count / 2, cls);
+            nrt_pool_list_push(list, (nrt_pool_block *) header);
+            return;
+        }
+    }
+    ThePool.free(header);
+}
+
+static void *nrt_pool_realloc(void *ptr, size_t size) {
+    nrt_pool_header *header;
+    size_t cls, copy_size;
+    void *new_ptr;
+
+    if (ptr == NULL)
+        return nrt_pool_malloc(size);
+    header = (nrt_pool_header *) ptr - 1;
+    cls = header->size_class;
+    if (cls == NRT_POOL_LARGE) {
+        if (nrt_pool_size_class(size) == NRT_POOL_LARGE) {
+            if (size > (size_t) -1 - sizeof(nrt_pool_header))
+                return NULL;
+            header = ThePool.realloc(header, sizeof(nrt_pool_header) + size);
+            return header == NULL ? NULL : header + 1;
+        }
+        /* Shrinking to a size class */
+        copy_size = size;
+    }
+    else {
+        if (size <= NRT_POOL_CLASS_SIZE(cls))
+            return ptr;
+        /* Growing to a larger size class */
+        copy_size = NRT_POOL_CLASS_SIZE(cls);
+    }
+    new_ptr = nrt_pool_malloc(size);
+    if (new_ptr == NULL)
+        return NULL;
+    memcpy(new_ptr, ptr, copy_size);
+    nrt_pool_free(ptr);
+    return new_ptr;
+}
+
+size_t NRT_MemSys_get_stats_pool_hit(void) {
+    nrt_pool_cache *cache;
+    size_t hits;
+    if (!ThePool.initialized)
+        return 0;
+    nrt_pool_lock();
+    hits = ThePool.exited_hits;
+    for (cache = ThePool.caches; cache != NULL; cache = cache->next)
+        hits += cache->hits;
+    nrt_pool_unlock();
+    return hits;
+}
+
+int NRT_MemSys_use_pool_allocator(void) {
+    if (TheMSys.allocator.malloc == nrt_pool_malloc)
+        return 0;
+    if (!ThePool.initialized) {
+        if (!nrt_pool_init_threading())
+            return -1;
+        ThePool.initialized = 1;
+    }
+    /* The pool gets its blocks from the current allocator */
+    ThePool.malloc = TheMSys.allocator.malloc;
+    ThePool.realloc = TheMSys.allocator.realloc;
+    ThePool.free = TheMSys.allocator.free;
+    NRT_MemSys_set_allocator(nrt_pool_malloc, nrt_pool_realloc,
+                             nrt_pool_free);
+    return 0;
+}
+
+
+/*
+ * Allocation profiler.
+ *
+ * When compiled with NUMBA_NRT_PROFILE, functions call NRT_MemInfo_profile()
+ * with their (mangled) name after each allocation.  The allocation is then
+ * recorded in the profile of that function, and the MemInfo remembers the
+ * profile so that the live bytes can be updated when it is resized or
+ * destroyed.  Profiles are looked up by the address of the name, which is
+ * a constant in the compiled code; the name is copied, as the code may be
+ * unloaded while its allocations live on.  Profiles are never freed.
+ */
+
+#define NRT_PROFILE_BUCKETS 1024
+
+typedef struct nrt_profile_record {
+    struct nrt_profile_record *next;
+    const char *key;
+    NRT_ProfileEntry entry;
+} nrt_profile_record;
+
+static struct {
+    nrt_profile_record *buckets[NRT_PROFILE_BUCKETS];
+    size_t nrecords;
+    nrt_lock_t lock;
+    int initialized;
+} TheProfile;
+
+static void nrt_profile_init(void) {
+    if (!TheProfile.initialized) {
+        if (!nrt_lock_init(&TheProfile.lock))
+            nrt_fatal_error("cannot initialize the allocation profiler");
+        TheProfile.initialized = 1;
+    }
+}
+
+/* Return the profile for *func_name*, creating it if necessary.
+   The profile lock must be held. */
+static nrt_profile_record *nrt_profile_lookup(const char *func_name) {
+    size_t h = ((size_t) func_name >> 3) % NRT_PROFILE_BUCKETS;
+    nrt_profile_record *rec;
+    char *name;
+
+    for (rec = TheProfile.buckets[h]; rec != NULL; rec = rec->next) {
+        /* The address may have been reused by another function */
+        if (rec->key == func_name && !strcmp(rec->entry.name, func_name))
+            return rec;
+    }
+    rec = malloc(sizeof(nrt_profile_record));
+    name = malloc(strlen(func_name) + 1);
+    if (rec == NULL || name == NULL) {
+        free(rec);
+        free(name);
+        return NULL;
+    }
+    strcpy(name, func_name);
+    memset(rec, 0, sizeof(nrt_profile_record));
+    rec->key = func_name;
+    rec->entry.name = name;
+    rec->next = TheProfile.buckets[h];
+    TheProfile.buckets[h] = rec;
+    TheProfile.nrecords++;
+    return rec;
+}
+
+/* Account for *size* newly allocated bytes.
+   The profile lock must be held. */
+static void nrt_profile_add(nrt_profile_record *rec, size_t size) {
+    rec->entry.bytes += size;
+    rec->entry.live_bytes += size;
+    if (rec->entry.live_bytes > rec->entry.peak_bytes)
+        rec->entry.peak_bytes = rec->entry.live_bytes;
+}
+
+void NRT_MemInfo_profile(NRT_MemInfo *mi, const char *func_name) {
+    nrt_profile_record *rec;
+    if (mi == NULL || mi->profile != NULL)
+        return;
+    nrt_lock_acquire(&TheProfile.lock);
+    rec = nrt_profile_lookup(func_name);
+    if (rec != NULL) {
+        rec->entry.count++;
+        nrt_profile_add(rec, mi->size);
+        mi->profile = rec;
+    }
+    nrt_lock_release(&TheProfile.lock);
+}
+
+static void nrt_profile_resize(NRT_MemInfo *mi, size_t new_size) {
+    nrt_lock_acquire(&TheProfile.lock);
+    if (new_size > mi->size)
+        nrt_profile_add(mi->profile, new_size - mi->size);
+    else
+        mi->profile->entry.live_bytes -= mi->size - new_size;
+    nrt_lock_release(&TheProfile.lock);
+}
+
+static void nrt_profile_release(NRT_MemInfo *mi) {
+    nrt_lock_acquire(&TheProfile.lock);
+    mi->profile->entry.live_bytes -= mi->size;
+    nrt_lock_release(&TheProfile.lock);
+}
+
+size_t NRT_MemSys_get_profile(NRT_ProfileEntry *entries, size_t n) {
+    nrt_profile_record *rec;
+    size_t h, i = 0, total;
+    nrt_lock_acquire(&TheProfile.lock);
+    for (h = 0; h < NRT_PROFILE_BUCKETS; h++) {
+        for (rec = TheProfile.buckets[h]; rec != NULL; rec = rec->next) {
+            if (i < n)
+                entries[i++] = rec->entry;
+        }
+    }
+    total = TheProfile.nrecords;
+    nrt_lock_release(&TheProfile.lock);
+    return total;
+}
+
+void NRT_MemSys_reset_profile(void) {
+    nrt_profile_record *rec;
+    size_t h;
+    nrt_lock_acquire(&TheProfile.lock);
+    for (h = 0; h < NRT_PROFILE_BUCKETS; h++) {
+        for (rec = TheProfile.buckets[h]; rec != NULL; rec = rec->next) {
+            /* Live allocations will be released later */
+            rec->entry.count = 0;
+            rec->entry.bytes = 0;
+            rec->entry.peak_bytes = rec->entry.live_bytes;
+        }
+    }
+    nrt_lock_release(&TheProfile.lock);
+}
+
+
 /*
  * The MemInfo structure.
  */
@@ -176,6 +723,7 @@ void NRT_MemInfo_init(NRT_MemInfo *mi,void *data, size_t size,
     mi->dtor_info = dtor_info;
     mi->data = data;
     mi->size = size;
+    mi->profile = NULL;
     /* Update stats */
     TheMSys.atomic_inc(&TheMSys.stats_mi_alloc);
 }
@@ -271,6 +819,8 @@ NRT_MemInfo *NRT_MemInfo_alloc_safe_aligned(size_t size, unsigned align) {
 }
 
 void NRT_MemInfo_destroy(NRT_MemInfo *mi) {
+    if (mi->profile != NULL)
+        nrt_profile_release(mi);
     NRT_Free(mi);
     TheMSys.atomic_inc(&TheMSys.stats_mi_free);
 }
@@ -347,6 +897,8 @@ void *NRT_MemInfo_varsize_realloc(NRT_MemInfo *mi, size_t size)
     mi->data = NRT_Reallocate(mi->data, size);
     if (mi->data == NULL)
         return NULL;
+    if (mi->profile != NULL)
+        nrt_profile_resize(mi, size);
     mi->size = size;
     NRT_Debug(nrt_debug_print("NRT_MemInfo_varsize_realloc %p size=%zu "
                               "-> data=%p\n", mi, size, mi->data));
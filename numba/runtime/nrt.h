@@ -27,6 +27,15 @@ typedef int (*NRT_atomic_cas_func)(void * volatile *ptr, void *cmp, void *repl,
 typedef struct MemInfo NRT_MemInfo;
 typedef struct MemSys NRT_MemSys;
 
+/* The allocation profile of a compiled function */
+typedef struct {
+    const char *name;       /* the function's mangled name */
+    size_t count;           /* number of allocations */
+    size_t bytes;           /* total number of bytes allocated */
+    size_t live_bytes;      /* number of bytes currently allocated */
+    size_t peak_bytes;      /* maximum of live_bytes */
+} NRT_ProfileEntry;
+
 typedef void *(*NRT_malloc_func)(size_t size);
 typedef void *(*NRT_realloc_func)(void *ptr, size_t new_size);
 typedef void (*NRT_free_func)(void *ptr);
@@ -48,6 +57,14 @@ void NRT_MemSys_shutdown(void);
 VISIBILITY_HIDDEN
 void NRT_MemSys_set_allocator(NRT_malloc_func, NRT_realloc_func, NRT_free_func);
 
+/*
+ * Install a size-class pool allocator on top of the current system
+ * allocation functions.  Returns 0 on success, -1 if the pool's locking
+ * or thread-local storage couldn't be set up.
+ */
+VISIBILITY_HIDDEN
+int NRT_MemSys_use_pool_allocator(void);
+
 /*
  * Register the atomic increment and decrement functions
  */
@@ -74,6 +91,21 @@ void NRT_MemSys_set_atomic_inc_dec_stub(void);
 VISIBILITY_HIDDEN
 void NRT_MemSys_set_atomic_cas_stub(void);
 
+/*
+ * The number of threads running compiled code with the GIL released,
+ * or concurrently with the thread holding it (e.g. parallel_for()
+ * workers).  While it is non-zero, functions compiled with non-atomic
+ * refcounts update them atomically.  Only modified atomically.
+ */
+VISIBILITY_HIDDEN
+extern size_t NRT_MemSys_nogil_count;
+
+/*
+ * Atomically add *delta* to NRT_MemSys_nogil_count.
+ */
+VISIBILITY_HIDDEN
+void NRT_MemSys_adjust_nogil_count(int delta);
+
 /*
  * The following functions get internal statistics of the memory subsystem.
  */
@@ -85,6 +117,23 @@ VISIBILITY_HIDDEN
 size_t NRT_MemSys_get_stats_mi_alloc(void);
 VISIBILITY_HIDDEN
 size_t NRT_MemSys_get_stats_mi_free(void);
+VISIBILITY_HIDDEN
+size_t NRT_MemSys_get_stats_pool_hit(void);
+VISIBILITY_HIDDEN
+size_t NRT_MemSys_get_stats_pool_miss(void);
+
+/*
+ * Copy up to *n* allocation profiles into *entries*, and return the total
+ * number of profiles.  The names stay valid until the process exits.
+ */
+VISIBILITY_HIDDEN
+size_t NRT_MemSys_get_profile(NRT_ProfileEntry *entries, size_t n);
+
+/*
+ * Reset the allocation counts and peaks of all profiles.
+ */
+VISIBILITY_HIDDEN
+void NRT_MemSys_reset_profile(void);
 
 /* Memory Info API */
 
@@ -141,6 +190,14 @@ NRT_MemInfo *NRT_MemInfo_alloc_safe_aligned(size_t size, unsigned align);
 VISIBILITY_HIDDEN
 void NRT_MemInfo_destroy(NRT_MemInfo *mi);
 
+/*
+ * Record the allocation of MemInfo *mi* in the allocation profile of
+ * the compiled function named *func_name*.  The name must be a constant
+ * string: it is also used to look up the profile by address.
+ */
+VISIBILITY_HIDDEN
+void NRT_MemInfo_profile(NRT_MemInfo *mi, const char *func_name);
+
 /*
  * Acquire a reference to a MemInfo
  */
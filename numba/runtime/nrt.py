@@ -1,14 +1,20 @@
 from __future__ import print_function, absolute_import, division
 
 from collections import namedtuple
+import sys
 
 from . import atomicops
 from llvmlite import binding as ll
 
+from numba import config
 from numba.utils import finalize as _finalize
 from . import _nrt_python as _nrt
 
-_nrt_mstats = namedtuple("nrt_mstats", ["alloc", "free", "mi_alloc", "mi_free"])
+_nrt_mstats = namedtuple("nrt_mstats", ["alloc", "free", "mi_alloc", "mi_free",
+                                       "pool_hit", "pool_miss"])
+
+_nrt_profile = namedtuple("nrt_profile", ["count", "bytes", "live_bytes",
+                                          "peak_bytes"])
 
 
 class _Runtime(object):
@@ -84,15 +90,75 @@ class _Runtime(object):
             mi = _nrt.meminfo_alloc(size)
         return MemInfo(mi)
 
+    def adjust_nogil_count(self, delta):
+        """
+        Atomically add *delta* to the number of threads running compiled
+        code concurrently with the thread holding the GIL.  While it is
+        non-zero, functions compiled with non-atomic refcounts update them
+        atomically (see NRT_MemSys_nogil_count in "nrt.h").
+        """
+        _nrt.memsys_adjust_nogil_count(delta)
+
     def get_allocation_stats(self):
         """
         Returns a namedtuple of (alloc, free, mi_alloc, mi_free) for count of
-        each memory operations.
+        each memory operations, along with (pool_hit, pool_miss) for the
+        count of allocations served by the pool allocator's caches and by
+        the system allocator, if the pool allocator is enabled
+        (see NUMBA_NRT_POOL_ALLOCATOR).
         """
         return _nrt_mstats(alloc=_nrt.memsys_get_stats_alloc(),
                            free=_nrt.memsys_get_stats_free(),
                            mi_alloc=_nrt.memsys_get_stats_mi_alloc(),
-                           mi_free=_nrt.memsys_get_stats_mi_free())
+                           mi_free=_nrt.memsys_get_stats_mi_free(),
+                           pool_hit=_nrt.memsys_get_stats_pool_hit(),
+                           pool_miss=_nrt.memsys_get_stats_pool_miss())
+
+    def get_allocation_profile(self):
+        """
+        Returns a dict mapping the (mangled) names of compiled functions to
+        a namedtuple of (count, bytes, live_bytes, peak_bytes): the number of
+        allocations made by the function, the number of bytes allocated, the
+        number of those bytes still allocated, and the maximum of the latter.
+        Only functions compiled while NUMBA_NRT_PROFILE is enabled are
+        profiled.
+        """
+        profile = {}
+        for name, count, nbytes, live, peak in _nrt.memsys_get_profile():
+            # The same function may have been compiled several times
+            # (e.g. in different libraries): merge its profiles.
+            if name in profile:
+                prev = profile[name]
+                count += prev.count
+                nbytes += prev.bytes
+                live += prev.live_bytes
+                peak += prev.peak_bytes
+            profile[name] = _nrt_profile(count, nbytes, live, peak)
+        return profile
+
+    def reset_allocation_profile(self):
+        """
+        Reset the counts of the allocation profile.  The peak is reset
+        to the number of bytes currently allocated.
+        """
+        _nrt.memsys_reset_profile()
+
+    def dump_allocation_profile(self, file=None):
+        """
+        Print the allocation profile as a table to *file* (by default
+        sys.stdout), the functions allocating the most bytes first.
+        """
+        file = file or sys.stdout
+        profile = sorted(self.get_allocation_profile().items(),
+                         key=lambda item: item[1].bytes, reverse=True)
+        print("%10s %14s %14s %14s  %s"
+              % ("count", "bytes", "live bytes", "peak bytes", "function"),
+              file=file)
+        for name, prof in profile:
+            print("%10d %14d %14d %14d  %s"
+                  % (prof.count, prof.bytes, prof.live_bytes, prof.peak_bytes,
+                     name),
+                  file=file)
 
 
 # Alias to _nrt_python._MemInfo
@@ -100,6 +166,8 @@ MemInfo = _nrt._MemInfo
 
 # Create runtime
 _nrt.memsys_use_cpython_allocator()
+if config.NRT_POOL_ALLOCATOR:
+    _nrt.memsys_use_pool_allocator()
 rtsys = _Runtime()
 
 # Install finalizer
@@ -3,4 +3,14 @@ from __future__ import print_function, division, absolute_import
 from .typing.typeof import typeof
 
 
-__all__ = ['typeof']
+def prange(*args):
+    """
+    Provides a 1D parallel iterator that generates a sequence of integers,
+    taking the same arguments as range().  In nopython mode, the iterations
+    of a ``for`` loop over prange() are distributed across threads.
+    Otherwise, prange() is the same as range().
+    """
+    return range(*args)
+
+
+__all__ = ['typeof', 'prange']
@@ -2521,11 +2521,18 @@ def _empty_nd_impl(context, builder, arrtype, shapes):
                 arrtype.layout))
 
     allocsize = builder.mul(itemsize, arrlen)
-    # NOTE: AVX prefer 32-byte alignment
-    meminfo = context.nrt_meminfo_alloc_aligned(builder, size=allocsize,
-                                                align=32)
-
-    data = context.nrt_meminfo_data(builder, meminfo)
+    allocation = None
+    if context.array_allocator is not None:
+        # A temporary array (see numba.temparrays)
+        allocation = context.array_allocator.allocate(context, builder,
+                                                      arrtype, allocsize)
+    if allocation is not None:
+        meminfo, data = allocation
+    else:
+        # NOTE: AVX prefer 32-byte alignment
+        meminfo = context.nrt_meminfo_alloc_aligned(builder, size=allocsize,
+                                                    align=32)
+        data = context.nrt_meminfo_data(builder, meminfo)
 
     intp_t = context.get_value_type(types.intp)
     shape_array = cgutils.pack_array(builder, shapes, ty=intp_t)
@@ -2546,6 +2553,16 @@ def _zero_fill_array(context, builder, ary):
     """
     cgutils.memset(builder, ary.data, builder.mul(ary.itemsize, ary.nitems), 0)
 
+def _one_fill_array(context, builder, arrtype, ary):
+    """
+    Fill an array with ones.  The array must be contiguous.
+    """
+    one = context.cast(builder, context.get_constant(types.intp, 1),
+                       types.intp, arrtype.dtype)
+    with cgutils.for_range(builder, ary.nitems) as loop:
+        ptr = builder.gep(ary.data, [loop.index])
+        store_item(context, builder, arrtype, one, ptr)
+
 
 def _parse_empty_args(context, builder, sig, args):
     """
@@ -2679,57 +2696,21 @@ if numpy_version >= (1, 8):
 
 @builtin
 @implement(numpy.ones, types.Any)
-def numpy_ones_nd(context, builder, sig, args):
-
-    def ones(shape):
-        arr = numpy.empty(shape)
-        for idx in numpy.ndindex(arr.shape):
-            arr[idx] = 1
-        return arr
-
-    valty = sig.return_type.dtype
-    res = context.compile_internal(builder, ones, sig, args,
-                                   locals={'c': valty})
-    return impl_ret_new_ref(context, builder, sig.return_type, res)
-
-@builtin
 @implement(numpy.ones, types.Any, types.Kind(types.DTypeSpec))
-def numpy_ones_dtype_nd(context, builder, sig, args):
-
-    def ones(shape, dtype):
-        arr = numpy.empty(shape, dtype)
-        for idx in numpy.ndindex(arr.shape):
-            arr[idx] = 1
-        return arr
-
-    res = context.compile_internal(builder, ones, sig, args)
-    return impl_ret_new_ref(context, builder, sig.return_type, res)
+def numpy_ones_nd(context, builder, sig, args):
+    arrtype, shapes = _parse_empty_args(context, builder, sig, args)
+    ary = _empty_nd_impl(context, builder, arrtype, shapes)
+    _one_fill_array(context, builder, arrtype, ary)
+    return impl_ret_new_ref(context, builder, sig.return_type, ary._getvalue())
 
 @builtin
 @implement(numpy.ones_like, types.Kind(types.Array))
-def numpy_ones_like_nd(context, builder, sig, args):
-
-    def ones_like(arr):
-        arr = numpy.empty_like(arr)
-        for idx in numpy.ndindex(arr.shape):
-            arr[idx] = 1
-        return arr
-
-    res = context.compile_internal(builder, ones_like, sig, args)
-    return impl_ret_new_ref(context, builder, sig.return_type, res)
-
-@builtin
 @implement(numpy.ones_like, types.Kind(types.Array), types.Kind(types.DTypeSpec))
-def numpy_ones_like_dtype_nd(context, builder, sig, args):
-
-    def ones_like(arr, dtype):
-        arr = numpy.empty_like(arr, dtype)
-        for idx in numpy.ndindex(arr.shape):
-            arr[idx] = 1
-        return arr
-
-    res = context.compile_internal(builder, ones_like, sig, args)
-    return impl_ret_new_ref(context, builder, sig.return_type, res)
+def numpy_ones_like_nd(context, builder, sig, args):
+    arrtype, shapes = _parse_empty_like_args(context, builder, sig, args)
+    ary = _empty_nd_impl(context, builder, arrtype, shapes)
+    _one_fill_array(context, builder, arrtype, ary)
+    return impl_ret_new_ref(context, builder, sig.return_type, ary._getvalue())
 
 
 @builtin
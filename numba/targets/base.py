@@ -3,6 +3,7 @@ from __future__ import print_function
 from collections import namedtuple, defaultdict
 import copy
 import sys
+import threading
 from types import MethodType
 
 import numpy
@@ -12,7 +13,7 @@ import llvmlite.llvmpy.core as lc
 from llvmlite.llvmpy.core import Type, Constant, LLVMException
 import llvmlite.binding as ll
 
-from numba import types, utils, cgutils, typing
+from numba import config, types, utils, cgutils, typing
 from numba import _dynfunc, _helperlib
 from numba.pythonapi import PythonAPI
 from numba.targets.imputils import (user_function, user_generator,
@@ -155,9 +156,26 @@ class BaseContext(object):
     # NRT
     enable_nrt = False
 
+    # Whether NRT refcount operations are atomic
+    atomic_refct = True
+
+    # Run array expressions in parallel
+    auto_parallel = False
+
+    # Run prange() loops on the thread pool
+    parallel_loops = False
+
     # PYCC
     aot_mode = False
 
+    # The function whose allocation profile records the allocations of
+    # the internal subroutine being compiled (see NUMBA_NRT_PROFILE)
+    profile_name = None
+
+    # Allocator of the array created by the expression being lowered
+    # (a numba.temparrays.TemporaryArray instance)
+    array_allocator = None
+
     # Error model for various operations (only FP exceptions currently)
     error_model = None
 
@@ -166,6 +184,10 @@ class BaseContext(object):
         self.address_size = utils.MACHINE_BITS
         self.typing_context = typing_context
 
+        # Dispatchers may be compiled concurrently from several threads,
+        # so insertions into the tables below are done under this lock.
+        # Lookups don't need it, but mustn't insert entries implicitly.
+        self._lock = threading.RLock()
         self.defns = defaultdict(Overloads)
         self.attrs = defaultdict(Overloads)
         self.generators = {}
@@ -174,6 +196,7 @@ class BaseContext(object):
         self.install_registry(builtin_registry)
 
         self.cached_internal_func = {}
+        self._internal_func_locks = {}
 
         self.data_model_manager = datamodel.default_manager
 
@@ -202,6 +225,7 @@ class BaseContext(object):
         if obj.codegen() is not self.codegen():
             # We can't share functions accross different codegens
             obj.cached_internal_func = {}
+            obj._internal_func_locks = {}
         return obj
 
     def install_registry(self, registry):
@@ -209,40 +233,57 @@ class BaseContext(object):
         Install a *registry* (a imputils.Registry instance) of function
         and attribute implementations.
         """
-        self.insert_func_defn(registry.functions)
-        self.insert_attr_defn(registry.attributes)
+        with self._lock:
+            self.insert_func_defn(registry.functions)
+            self.insert_attr_defn(registry.attributes)
 
     def insert_func_defn(self, defns):
-        for impl, func_sigs in defns:
-            for func, sig in func_sigs:
-                self.defns[func].append(impl, sig)
+        with self._lock:
+            for impl, func_sigs in defns:
+                for func, sig in func_sigs:
+                    self.defns[func].append(impl, sig)
 
     def insert_attr_defn(self, defns):
-        for impl in defns:
-            self.attrs[impl.attr].append(impl, impl.signature)
+        with self._lock:
+            for impl in defns:
+                self.attrs[impl.attr].append(impl, impl.signature)
 
     def insert_user_function(self, func, fndesc, libs=()):
         impl = user_function(fndesc, libs)
-        self.defns[func].append(impl, impl.signature)
+        with self._lock:
+            self.defns[func].append(impl, impl.signature)
 
     def add_user_function(self, func, fndesc, libs=()):
-        if func not in self.defns:
-            msg = "{func} is not a registered user function"
-            raise KeyError(msg.format(func=func))
         impl = user_function(fndesc, libs)
-        self.defns[func].append(impl, impl.signature)
+        with self._lock:
+            if func not in self.defns:
+                msg = "{func} is not a registered user function"
+                raise KeyError(msg.format(func=func))
+            self.defns[func].append(impl, impl.signature)
 
     def insert_generator(self, genty, gendesc, libs=()):
         assert isinstance(genty, types.Generator)
         impl = user_generator(gendesc, libs)
-        self.generators[genty] = gendesc, impl
+        with self._lock:
+            self.generators[genty] = gendesc, impl
 
     def remove_user_function(self, func):
         """
         Remove user function *func*.
         KeyError is raised if the function isn't known to us.
         """
-        del self.defns[func]
+        with self._lock:
+            del self.defns[func]
+
+    def _get_overloads(self, table, key):
+        """
+        Return the Overloads registered for *key* in *table* (either
+        self.defns or self.attrs), without inserting a new entry.
+        """
+        overloads = table.get(key)
+        if overloads is None:
+            overloads = Overloads()
+        return overloads
 
     def get_external_function_type(self, fndesc):
         argtypes = [self.get_argument_type(aty)
@@ -453,21 +494,21 @@ class BaseContext(object):
             key = fn.template.key
 
             if isinstance(key, MethodType):
-                overloads = self.defns[key.im_func]
+                overloads = self._get_overloads(self.defns, key.im_func)
 
             elif sig.recvr:
                 sig = typing.signature(sig.return_type,
                                        *((sig.recvr,) + sig.args))
-                overloads = self.defns[key]
+                overloads = self._get_overloads(self.defns, key)
             else:
-                overloads = self.defns[key]
+                overloads = self._get_overloads(self.defns, key)
 
         elif isinstance(fn, types.Dispatcher):
             key = fn.overloaded.get_overload(sig.args)
-            overloads = self.defns[key]
+            overloads = self._get_overloads(self.defns, key)
         else:
             key = fn
-            overloads = self.defns[key]
+            overloads = self._get_overloads(self.defns, key)
         try:
             return _wrap_impl(overloads.find(sig), self, sig)
         except NotImplementedError:
@@ -550,13 +591,13 @@ class BaseContext(object):
             return None
 
         # Lookup specific attribute implementation for this type
-        overloads = self.attrs[attr]
+        overloads = self._get_overloads(self.attrs, attr)
         try:
             return overloads.find(typing.signature(types.Any, typ))
         except NotImplementedError:
             pass
         # Lookup generic getattr implementation for this type
-        overloads = self.attrs[None]
+        overloads = self._get_overloads(self.attrs, None)
         try:
             return overloads.find(typing.signature(types.Any, typ))
         except NotImplementedError:
@@ -871,12 +912,31 @@ class BaseContext(object):
             # XXX This obviously won't work if a cell's value is
             # unhashable.
             cache_key += tuple(c.cell_contents for c in impl.__closure__)
+        context = self
+        if config.NRT_PROFILE:
+            # Attribute the subroutine's allocations to the outermost
+            # function calling it
+            profile_name = self.profile_name or builder.function.name
+            cache_key += (profile_name,)
+            context = self.subtarget(profile_name=profile_name)
         ty = self.cached_internal_func.get(cache_key)
-        if ty is None:
-            cres = self.compile_only_no_cache(builder, impl, sig,
-                                              locals=locals)
-            ty = types.NumbaFunction(cres.fndesc, sig)
-            self.cached_internal_func[cache_key] = ty
+        if ty is not None:
+            return ty
+        # Only one thread compiles a given subroutine; other threads
+        # needing it wait for the result, while unrelated subroutines
+        # can be compiled concurrently.
+        with self._lock:
+            key_lock = self._internal_func_locks.setdefault(cache_key,
+                                                            threading.RLock())
+        with key_lock:
+            ty = self.cached_internal_func.get(cache_key)
+            if ty is None:
+                cres = context.compile_only_no_cache(builder, impl, sig,
+                                                     locals=locals)
+                ty = types.NumbaFunction(cres.fndesc, sig)
+                self.cached_internal_func[cache_key] = ty
+        with self._lock:
+            self._internal_func_locks.pop(cache_key, None)
         return ty
 
     def compile_internal(self, builder, impl, sig, args, locals={}):
@@ -1030,7 +1090,7 @@ class BaseContext(object):
                                    [self.get_value_type(types.intp)])
         fn = mod.get_or_insert_function(fnty, name="NRT_MemInfo_alloc_safe")
         fn.return_value.add_attribute("noalias")
-        return builder.call(fn, [size])
+        return self._nrt_profile_alloc(builder, builder.call(fn, [size]))
 
     def nrt_meminfo_alloc_aligned(self, builder, size, align):
         """
@@ -1053,7 +1113,8 @@ class BaseContext(object):
             align = self.get_constant(types.uint32, align)
         else:
             assert align.type == u32, "align must be a uint32"
-        return builder.call(fn, [size, align])
+        return self._nrt_profile_alloc(builder,
+                                       builder.call(fn, [size, align]))
 
     def nrt_meminfo_varsize_alloc(self, builder, size):
         """
@@ -1070,7 +1131,23 @@ class BaseContext(object):
                                    [self.get_value_type(types.intp)])
         fn = mod.get_or_insert_function(fnty, name="NRT_MemInfo_varsize_alloc")
         fn.return_value.add_attribute("noalias")
-        return builder.call(fn, [size])
+        return self._nrt_profile_alloc(builder, builder.call(fn, [size]))
+
+    def _nrt_profile_alloc(self, builder, meminfo):
+        """
+        If NUMBA_NRT_PROFILE is enabled, record the allocation of *meminfo*
+        in the allocation profile of the function being lowered.
+        *meminfo* is returned, for convenience.
+        """
+        if config.NRT_PROFILE:
+            mod = builder.module
+            fnty = llvmir.FunctionType(llvmir.VoidType(),
+                                       [void_ptr, void_ptr])
+            fn = mod.get_or_insert_function(fnty, name="NRT_MemInfo_profile")
+            name = self.insert_const_string(
+                mod, self.profile_name or builder.function.name)
+            builder.call(fn, [meminfo, name])
+        return meminfo
 
     def nrt_meminfo_varsize_realloc(self, builder, meminfo, size):
         """
@@ -1101,6 +1178,17 @@ class BaseContext(object):
                                         name="NRT_MemInfo_data_fast")
         return builder.call(fn, [meminfo])
 
+    def nrt_meminfo_refcount(self, builder, meminfo):
+        """
+        Given a MemInfo pointer, return its reference count (without
+        synchronization).
+        """
+        if not self.enable_nrt:
+            raise Exception("Require NRT")
+        intp_t = self.get_value_type(types.intp)
+        # The reference count is the first member of the MemInfo
+        return builder.load(builder.bitcast(meminfo, intp_t.as_pointer()))
+
     def _call_nrt_incref_decref(self, builder, root_type, typ, value, funcname):
         if not self.enable_nrt:
             raise Exception("Require NRT")
@@ -1129,13 +1217,29 @@ class BaseContext(object):
         """
         Recursively incref the given *value* and its members.
         """
-        self._call_nrt_incref_decref(builder, typ, typ, value, "NRT_incref")
+        funcname = "NRT_incref" if self.atomic_refct else "NRT_incref_nonatomic"
+        self._call_nrt_incref_decref(builder, typ, typ, value, funcname)
 
     def nrt_decref(self, builder, typ, value):
         """
         Recursively decref the given *value* and its members.
         """
-        self._call_nrt_incref_decref(builder, typ, typ, value, "NRT_decref")
+        funcname = "NRT_decref" if self.atomic_refct else "NRT_decref_nonatomic"
+        self._call_nrt_incref_decref(builder, typ, typ, value, funcname)
+
+    def nrt_adjust_nogil_count(self, builder, delta):
+        """
+        Add *delta* to the number of threads running compiled code with
+        the GIL released, or concurrently with the thread holding it.
+        While it is non-zero, functions compiled with non-atomic refcounts
+        update them atomically.
+        """
+        if not self.enable_nrt:
+            raise Exception("Require NRT")
+        intp_t = self.get_value_type(types.intp)
+        count = self.get_c_value(builder, intp_t, "NRT_MemSys_nogil_count")
+        builder.atomic_rmw('add', count, Constant.int(intp_t, delta),
+                           ordering='monotonic')
 
 
 class _wrap_impl(object):
@@ -2,6 +2,7 @@ from __future__ import print_function, division, absolute_import
 
 import functools
 import sys
+import threading
 import weakref
 
 import llvmlite.llvmpy.core as lc
@@ -20,6 +21,25 @@ def _is_x86(triple):
     return arch in _x86arch
 
 
+# LLVM isn't thread-safe (all modules share the global LLVM context) while
+# llvmlite releases the GIL when calling into it, so all operations on LLVM
+# modules and execution engines are serialized by this lock.  The Python
+# side of compilation (bytecode analysis, type inference, lowering to
+# llvmlite.ir) can still run concurrently.
+_llvm_lock = threading.RLock()
+
+
+def _llvm_locked(meth):
+    """
+    Decorate *meth* so that it runs with the LLVM lock held.
+    """
+    @functools.wraps(meth)
+    def wrapper(*args, **kwargs):
+        with _llvm_lock:
+            return meth(*args, **kwargs)
+    return wrapper
+
+
 def dump(header, body):
     print(header.center(80, '-'))
     print(body)
@@ -40,9 +60,10 @@ class CodeLibrary(object):
         self._codegen = codegen
         self._name = name
         self._linking_libraries = set()
-        self._final_module = ll.parse_assembly(
-            str(self._codegen._create_empty_module(self._name)))
-        self._final_module.name = self._name
+        with _llvm_lock:
+            self._final_module = ll.parse_assembly(
+                str(self._codegen._create_empty_module(self._name)))
+            self._final_module.name = self._name
         # Remember this on the module, for the object cache hooks
         self._final_module.__library = weakref.proxy(self)
         self._shared_module = None
@@ -136,6 +157,7 @@ class CodeLibrary(object):
         library._ensure_finalized()
         self._linking_libraries.add(library)
 
+    @_llvm_locked
     def add_ir_module(self, ir_module):
         """
         Add a LLVM IR module's contents to this library.
@@ -147,12 +169,14 @@ class CodeLibrary(object):
         ll_module.verify()
         self.add_llvm_module(ll_module)
 
+    @_llvm_locked
     def add_llvm_module(self, ll_module):
         self._optimize_functions(ll_module)
         # TODO: we shouldn't need to recreate the LLVM module object
         ll_module = remove_redundant_nrt_refct(ll_module)
         self._final_module.link_in(ll_module)
 
+    @_llvm_locked
     def finalize(self):
         """
         Finalize the library.  After this call, nothing can be added anymore.
@@ -216,12 +240,14 @@ class CodeLibrary(object):
     def get_function(self, name):
         return self._final_module.get_function(name)
 
+    @_llvm_locked
     def get_llvm_str(self):
         """
         Get the human-readable form of the LLVM module.
         """
         return str(self._final_module)
 
+    @_llvm_locked
     def get_asm_str(self):
         """
         Get the human-readable assembly.
@@ -305,6 +331,7 @@ class CodeLibrary(object):
             self._compiled_object = None
             return buf
 
+    @_llvm_locked
     def serialize_using_bitcode(self):
         """
         Serialize this library using its bitcode as the cached representation.
@@ -322,6 +349,7 @@ class CodeLibrary(object):
         return (self._name, 'object', self._get_compiled_object())
 
     @classmethod
+    @_llvm_locked
     def _unserialize(cls, codegen, state):
         name, kind, data = state
         self = codegen.create_library(name)
@@ -342,6 +370,7 @@ class CodeLibrary(object):
 
 class AOTCodeLibrary(CodeLibrary):
 
+    @_llvm_locked
     def emit_native_object(self):
         """
         Return this library as a native object (a bytestring) -- for example
@@ -352,6 +381,7 @@ class AOTCodeLibrary(CodeLibrary):
         self._ensure_finalized()
         return self._codegen._tm.emit_object(self._final_module)
 
+    @_llvm_locked
     def emit_bitcode(self):
         """
         Return this library as LLVM bitcode (a bytestring).
@@ -367,6 +397,7 @@ class AOTCodeLibrary(CodeLibrary):
 
 class JITCodeLibrary(CodeLibrary):
 
+    @_llvm_locked
     def get_pointer_to_function(self, name):
         """
         Generate native code for function named *name* and return a pointer
@@ -386,10 +417,11 @@ class BaseCPUCodegen(object):
     def __init__(self, module_name):
         self._libraries = set()
         self._data_layout = None
-        self._llvm_module = ll.parse_assembly(
-            str(self._create_empty_module(module_name)))
-        self._llvm_module.name = "global_codegen_module"
-        self._init(self._llvm_module)
+        with _llvm_lock:
+            self._llvm_module = ll.parse_assembly(
+                str(self._create_empty_module(module_name)))
+            self._llvm_module.name = "global_codegen_module"
+            self._init(self._llvm_module)
 
     def _init(self, llvm_module):
         assert list(llvm_module.global_variables) == [], "Module isn't empty"
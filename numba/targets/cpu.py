@@ -34,6 +34,8 @@ class CPUContext(BaseContext):
     """
     Changes BaseContext calling convention
     """
+    parallel_loops = True
+
     # Overrides
     def create_module(self, name):
         return self._internal_codegen._create_empty_module(name)
@@ -176,8 +178,14 @@ class CPUTargetOptions(TargetOptions):
         "boundcheck": bool,
         "_nrt": bool,
         "no_rewrites": bool,
+        "parallel": bool,
+        "nonatomic_refct": bool,
     }
 
+    def set_flags(self, flags):
+        self.values.setdefault("nonatomic_refct", bool(config.NRT_NONATOMIC))
+        super(CPUTargetOptions, self).set_flags(flags)
+
 
 # ----------------------------------------------------------------------------
 # Internal
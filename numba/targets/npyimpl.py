@@ -288,6 +288,17 @@ def numpy_ufunc_kernel(context, builder, sig, args, kernel_class,
         # Incref the output
         context.nrt_incref(builder, sig.return_type, args[-1])
 
+    build_ufunc_loop(context, builder, arguments, kernel_class)
+    out = arguments[-1].return_val
+    return impl_ret_new_ref(context, builder, sig.return_type, out)
+
+
+def build_ufunc_loop(context, builder, arguments, kernel_class):
+    """
+    Generate the loop nest computing the output from the inputs, given
+    *arguments*, the helpers (see _prepare_argument()) of the inputs
+    followed by the output.
+    """
     inputs = arguments[0:-1]
     output = arguments[-1]
 
@@ -309,8 +320,6 @@ def numpy_ufunc_kernel(context, builder, sig, args, kernel_class,
 
         val_out = kernel.generate(*vals_in)
         output.store_data(loop_indices, val_out)
-    out = arguments[-1].return_val
-    return impl_ret_new_ref(context, builder, sig.return_type, out)
 
 
 # Kernels are the code to be executed inside the multidimensional loop.
@@ -58,6 +58,12 @@ class TargetOptions(object):
         if kws.pop('no_rewrites', False):
             flags.set('no_rewrites')
 
+        if kws.pop('parallel', False):
+            flags.set('auto_parallel')
+
+        if kws.pop('nonatomic_refct', False):
+            flags.set('nonatomic_refct')
+
         flags.set("enable_pyobject_looplift")
 
         if kws:
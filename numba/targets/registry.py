@@ -41,3 +41,12 @@ class TargetRegistry(utils.UniqueDict):
 
 target_registry = TargetRegistry()
 target_registry['cpu'] = CPUOverloaded
+
+
+def _init_cuda_jit():
+    from numba.cuda.initialize import init_jit
+    return init_jit()
+
+# numba.cuda is only imported when the target is first used
+target_registry.ondemand['gpu'] = _init_cuda_jit
+target_registry.ondemand['cuda'] = _init_cuda_jit
@@ -0,0 +1,476 @@
+"""
+Allocation of temporary arrays in nopython mode.
+
+An escape analysis over the typed IR finds the arrays created by the
+function being lowered which never leave it: they aren't returned,
+stored into another object or passed to a function which could keep
+a reference to them.  Such temporary arrays are allocated:
+
+- on the stack, if their shape is a compile-time constant, they are
+  small enough, and no array from a previous execution of the same
+  allocation site (e.g. at the previous iteration of a loop) can still
+  be alive when the site runs again;
+
+- otherwise, if created inside a loop, in a heap buffer which is kept
+  from one iteration to the next: the buffer is reused if it has the
+  right size and the previous array has been released (i.e. the function
+  holds the only reference to the buffer), and released when the
+  function returns.
+
+Stack arrays have a NULL MemInfo, which the NRT ignores.  The allocation
+happens in arrayobj._empty_nd_impl(), which asks the target context's
+`array_allocator` for the data of the array being created.
+"""
+from __future__ import print_function, division, absolute_import
+
+from contextlib import contextmanager
+
+import numpy as np
+from llvmlite.ir.instructions import Ret
+from llvmlite.llvmpy.core import Constant, Type
+
+from . import cgutils, config, ir, types, typing, utils
+from .runtime.atomicops import incref_decref_ty
+
+
+# The functions creating a new array, given its shape and dtype
+_SHAPE_ALLOCATORS = (np.empty, np.zeros, np.ones)
+# The functions creating a new array from another one
+_LIKE_ALLOCATORS = (np.empty_like, np.zeros_like, np.ones_like)
+
+
+class TemporaryArray(object):
+    """
+    A non-escaping array allocation site of the function being lowered:
+    the assignment of *expr* to a variable.
+    """
+
+    def __init__(self, expr, nitems):
+        self.expr = expr
+        # The number of items if the array is allocated on the stack,
+        # otherwise None (its heap buffer is reused across iterations)
+        self.nitems = nitems
+        # The slots holding the reused MemInfo and its data size
+        self.meminfo_slot = None
+        self.size_slot = None
+        # The function lowering the allocation, while it is being lowered
+        self._function = None
+
+    @property
+    def on_stack(self):
+        return self.nitems is not None
+
+    @contextmanager
+    def allocating(self, lower):
+        """
+        A context manager routing the allocation of the array created
+        while lowering the assignment to this object.
+        """
+        context = lower.context
+        self._function = lower.function
+        lower.context = context.subtarget(array_allocator=self)
+        try:
+            yield
+        finally:
+            lower.context = context
+            self._function = None
+
+    def allocate(self, context, builder, arrtype, size):
+        """
+        Allocate the data of an array of type *arrtype*, of *size* bytes.
+        A (meminfo, data pointer) tuple is returned, or None if the
+        array isn't the temporary array (e.g. it is created by a function
+        called from the expression), which is then allocated normally.
+        """
+        if builder.function is not self._function:
+            return None
+        # Only the first array created by the expression is its result
+        self._function = None
+        if self.on_stack:
+            return self._allocate_on_stack(context, builder, arrtype)
+        else:
+            return self._reuse_buffer(context, builder, size)
+
+    def _allocate_on_stack(self, context, builder, arrtype):
+        datatype = context.get_data_type(arrtype.dtype)
+        data = cgutils.alloca_once(builder, Type.array(datatype, self.nitems))
+        meminfo = Constant.null(Type.pointer(Type.int(8)))
+        return meminfo, builder.bitcast(data, meminfo.type)
+
+    def _reuse_buffer(self, context, builder, size):
+        voidptr = Type.pointer(Type.int(8))
+        if self.meminfo_slot is None:
+            self.meminfo_slot = cgutils.alloca_once(builder, voidptr,
+                                                    zfill=True)
+            self.size_slot = cgutils.alloca_once(builder, size.type,
+                                                 zfill=True)
+        old = builder.load(self.meminfo_slot)
+        # The previous array is released if the slot holds the only
+        # reference to its MemInfo
+        reuse = cgutils.alloca_once_value(builder, cgutils.false_bit)
+        same_size = builder.icmp_unsigned('==', builder.load(self.size_slot),
+                                          size)
+        with builder.if_then(builder.and_(cgutils.is_not_null(builder, old),
+                                          same_size)):
+            refcount = context.nrt_meminfo_refcount(builder, old)
+            builder.store(builder.icmp_unsigned(
+                '==', refcount, Constant.int(refcount.type, 1)), reuse)
+
+        with cgutils.ifnot(builder, builder.load(reuse)):
+            _call_nrt(builder, "NRT_decref", old)
+            new = context.nrt_meminfo_alloc_aligned(builder, size=size,
+                                                    align=32)
+            builder.store(new, self.meminfo_slot)
+            builder.store(size, self.size_slot)
+        meminfo = builder.load(self.meminfo_slot)
+        # The array owns a new reference
+        _call_nrt(builder, "NRT_incref", meminfo)
+        return meminfo, context.nrt_meminfo_data(builder, meminfo)
+
+    def release(self, builder):
+        """
+        Release the reused buffer, if any.
+        """
+        if self.meminfo_slot is not None:
+            _call_nrt(builder, "NRT_decref", builder.load(self.meminfo_slot))
+
+
+def _call_nrt(builder, name, meminfo):
+    fn = builder.module.get_or_insert_function(incref_decref_ty, name=name)
+    builder.call(fn, [meminfo])
+
+
+def release_temporary_arrays(lower):
+    """
+    Release the buffers reused by the temporary arrays of the function
+    being lowered by *lower*, before each return.  This must be called
+    once the function is lowered.
+    """
+    temps = [temp for temp in lower.temporary_arrays.values()
+             if temp.meminfo_slot is not None]
+    if not temps:
+        return
+    builder = lower.builder
+    old_block = builder.basic_block
+    for block in lower.function.blocks:
+        if isinstance(block.terminator, Ret):
+            builder.position_before(block.terminator)
+            for temp in temps:
+                temp.release(builder)
+    builder.position_at_end(old_block)
+
+
+def find_temporary_arrays(lower):
+    """
+    Return a {ir.Expr: TemporaryArray} dict of the non-escaping array
+    allocations of the function being lowered by *lower*, except those
+    in *lower.outlined_blocks*.
+    """
+    context = lower.context
+    interp = lower.interp
+    if (not config.OPT_TEMP_ARRAYS or not context.enable_nrt
+            or interp.generator_info is not None):
+        return {}
+    analysis = _EscapeAnalysis(lower.blocks, lower.fndesc.typemap)
+    analysis.run()
+
+    cfg = interp.cfa.graph
+    live_vars = _LiveVariables(lower.blocks, cfg)
+    temps = {}
+    for offset, block in lower.blocks.items():
+        if block in lower.outlined_blocks:
+            continue
+        for stmt in block.body:
+            if not isinstance(stmt, ir.Assign):
+                continue
+            expr = stmt.value
+            site = analysis.sites.get(expr)
+            if site is None or site in analysis.escaping:
+                continue
+            arrtype = lower.typeof(stmt.target.name)
+            nitems = _get_constant_size(analysis, expr, arrtype,
+                                        lower.fndesc.calltypes[expr])
+            if nitems is not None:
+                itemsize = context.get_abi_sizeof(
+                    context.get_data_type(arrtype.dtype))
+                # A previous array from the same site mustn't be alive
+                aliases = analysis.aliases[site] - set([stmt.target.name])
+                if (nitems * itemsize <= config.TEMP_ARRAY_STACK_LIMIT
+                        and not aliases & live_vars.at(offset, stmt)):
+                    temps[expr] = TemporaryArray(expr, nitems)
+                    continue
+            if cfg.in_loops(offset):
+                temps[expr] = TemporaryArray(expr, None)
+    return temps
+
+
+def _get_constant_size(analysis, expr, arrtype, sig):
+    """
+    Return the number of items of the array created by *expr*, a call
+    with signature *sig*, if it is known at compile time, otherwise None.
+    """
+    if not isinstance(arrtype, types.Array) or arrtype.layout != 'C':
+        return None
+    if (expr.op != 'call' or isinstance(expr.func, ir.Intrinsic)
+            or expr.vararg):
+        return None
+    fnty = analysis.typemap[expr.func.name]
+    if (not isinstance(fnty, types.Function)
+            or isinstance(fnty, types.BoundFunction)
+            or fnty.template.key not in _SHAPE_ALLOCATORS):
+        return None
+    if expr.kws:
+        # e.g. np.zeros(3, dtype=np.int32)
+        if sig.pysig is None:
+            return None
+        args = typing.fold_arguments(sig.pysig, expr.args, dict(expr.kws),
+                                     lambda index, param, var: var,
+                                     lambda index, param, default: None,
+                                     lambda index, param, vars: None)
+    else:
+        args = expr.args
+    if not args or not isinstance(args[0], ir.Var):
+        return None
+    constants = (ir.Const, ir.Global, ir.FreeVar)
+    shape = analysis.get_definition(args[0])
+    if isinstance(shape, ir.Expr) and shape.op == 'build_tuple':
+        defs = [analysis.get_definition(item) for item in shape.items]
+        if not all(isinstance(d, constants) for d in defs):
+            return None
+        dims = [d.value for d in defs]
+    elif isinstance(shape, constants):
+        dims = shape.value
+        if not isinstance(dims, tuple):
+            dims = (dims,)
+    else:
+        return None
+    nitems = 1
+    for dim in dims:
+        if (not isinstance(dim, utils.INT_TYPES)
+                or isinstance(dim, bool) or dim < 0):
+            return None
+        nitems *= dim
+    return nitems
+
+
+def _may_hold_reference(ty):
+    """
+    Whether a value of type *ty* may hold a reference to an array.
+    """
+    if isinstance(ty, types.BoundFunction):
+        # Bound to its "this" object
+        return True
+    if isinstance(ty, (types.Number, types.Boolean, types.NPDatetime,
+                       types.NPTimedelta, types.Dummy)):
+        return False
+    if isinstance(ty, types.BaseTuple):
+        return any(_may_hold_reference(t) for t in ty)
+    return True
+
+
+def _is_numpy_function(key):
+    """
+    Whether *key*, the typing key of a function, is a Numpy function or
+    ufunc (neither of which keep references to their arguments).
+    """
+    if isinstance(key, np.ufunc):
+        return True
+    name = getattr(key, '__name__', None)
+    return name is not None and getattr(np, name, None) is key
+
+
+def _is_builtin_function(key):
+    name = getattr(key, '__name__', None)
+    return name is not None and getattr(utils.builtins, name, None) is key
+
+
+class _EscapeAnalysis(object):
+    """
+    Find the array allocation sites of a function, the variables which
+    may refer to each of them (directly or through a view, a tuple...),
+    and the sites whose arrays may escape the function.
+
+    The analysis is flow-insensitive: any variable assigned an alias of
+    a site anywhere is an alias of that site.
+    """
+
+    def __init__(self, blocks, typemap):
+        self.blocks = blocks
+        self.typemap = typemap
+        # { ir.Expr: site } for the allocation sites
+        self.sites = {}
+        # { site: set of variable names }
+        self.aliases = {}
+        # The set of escaping sites
+        self.escaping = set()
+        # { variable name: [definitions] }
+        self.definitions = {}
+
+    def get_definition(self, value):
+        """
+        Like Interpreter.get_definition(), but on the lowered blocks.
+        """
+        while isinstance(value, ir.Var):
+            defs = self.definitions.get(value.name, ())
+            if len(defs) != 1:
+                return None
+            value = defs[0]
+        return value
+
+    def run(self):
+        # Edges of the alias graph: (target name, source names)
+        edges = []
+        # Variables whose values escape
+        escaping_vars = set()
+
+        for block in self.blocks.values():
+            for stmt in block.body:
+                if isinstance(stmt, ir.Assign):
+                    self.definitions.setdefault(stmt.target.name,
+                                                []).append(stmt.value)
+                    sources = self._analyze_assign(stmt, escaping_vars)
+                    if (sources and
+                            _may_hold_reference(
+                                self.typemap[stmt.target.name])):
+                        edges.append((stmt.target.name, sources))
+                elif isinstance(stmt, ir.Return):
+                    escaping_vars.add(stmt.value.name)
+                elif isinstance(stmt, (ir.SetItem, ir.SetAttr)):
+                    # The stored value escapes into the target
+                    escaping_vars.add(stmt.value.name)
+                elif isinstance(stmt, (ir.Del, ir.DelItem, ir.Jump,
+                                       ir.Branch)):
+                    pass
+                else:
+                    escaping_vars.update(var.name
+                                         for var in stmt.list_vars())
+
+        # Propagate the sites along the alias graph
+        var_sites = {}
+        for site, names in self.aliases.items():
+            for name in names:
+                var_sites.setdefault(name, set()).add(site)
+        changed = True
+        while changed:
+            changed = False
+            for target, sources in edges:
+                sites = var_sites.setdefault(target, set())
+                for name in sources:
+                    new = var_sites.get(name, ()) - sites
+                    if new:
+                        sites |= new
+                        changed = True
+        for name, sites in var_sites.items():
+            for site in sites:
+                self.aliases[site].add(name)
+            if name in escaping_vars:
+                self.escaping |= sites
+
+    def _analyze_assign(self, stmt, escaping_vars):
+        """
+        Analyze an assignment, and return the names of the variables the
+        target may be an alias of.
+        """
+        value = stmt.value
+        if isinstance(value, ir.Var):
+            return [value.name]
+        elif isinstance(value, ir.Yield):
+            escaping_vars.add(value.value.name)
+            return []
+        elif not isinstance(value, ir.Expr):
+            # Constants, globals and arguments
+            return []
+
+        used = [var.name for var in value.list_vars()]
+        if self._is_allocation(value):
+            # A new array: register the site
+            site = len(self.sites)
+            self.sites[value] = site
+            self.aliases[site] = set([stmt.target.name])
+            return []
+        if value.op == 'call' and not self._is_safe_call(value):
+            # The callee may keep references to its arguments
+            escaping_vars.update(used)
+        return used
+
+    def _is_allocation(self, expr):
+        """
+        Whether *expr* creates a new array (whose allocation is lowered
+        in the function itself).
+        """
+        if expr.op == 'arrayexpr':
+            return True
+        if expr.op != 'call' or isinstance(expr.func, ir.Intrinsic):
+            return False
+        fnty = self.typemap[expr.func.name]
+        if isinstance(fnty, types.BoundFunction):
+            return (isinstance(fnty.this, types.Array)
+                    and fnty.template.key == "array.copy")
+        return (isinstance(fnty, types.Function)
+                and fnty.template.key in _SHAPE_ALLOCATORS + _LIKE_ALLOCATORS)
+
+    def _is_safe_call(self, expr):
+        """
+        Whether the function called by *expr* can't keep references to
+        its arguments, except in its return value.
+        """
+        if isinstance(expr.func, ir.Intrinsic):
+            return False
+        fnty = self.typemap[expr.func.name]
+        if isinstance(fnty, types.BoundFunction):
+            # Array methods
+            return isinstance(fnty.this, types.Array)
+        if isinstance(fnty, types.Function):
+            key = fnty.template.key
+            return _is_numpy_function(key) or _is_builtin_function(key)
+        return False
+
+
+class _LiveVariables(object):
+    """
+    The variables which may hold a value at each statement of a function
+    (i.e. they have been assigned and not deleted yet).
+    """
+
+    def __init__(self, blocks, cfg):
+        self.blocks = blocks
+        adds = {}
+        dels = {}
+        for offset, block in blocks.items():
+            adds[offset] = set()
+            dels[offset] = set()
+            for stmt in block.body:
+                if isinstance(stmt, ir.Assign):
+                    adds[offset].add(stmt.target.name)
+                    dels[offset].discard(stmt.target.name)
+                elif isinstance(stmt, ir.Del):
+                    adds[offset].discard(stmt.value)
+                    dels[offset].add(stmt.value)
+
+        self.entry_vars = dict((offset, set()) for offset in blocks)
+        changed = True
+        while changed:
+            changed = False
+            for offset in cfg.topo_order():
+                if offset not in blocks:
+                    continue
+                out = (self.entry_vars[offset] | adds[offset]) - dels[offset]
+                for succ, _ in cfg.successors(offset):
+                    if succ in blocks and not self.entry_vars[succ] >= out:
+                        self.entry_vars[succ] |= out
+                        changed = True
+
+    def at(self, offset, stmt):
+        """
+        Return the set of variables which may hold a value before *stmt*
+        in the block at *offset*.
+        """
+        live = set(self.entry_vars[offset])
+        for other in self.blocks[offset].body:
+            if other is stmt:
+                break
+            if isinstance(other, ir.Assign):
+                live.add(other.target.name)
+            elif isinstance(other, ir.Del):
+                live.discard(other.value)
+        return live
@@ -76,6 +76,16 @@ closure1 = make_closure(3)
 closure2 = make_closure(5)
 
 
+def make_closure_calling(func):
+    @jit(cache=True, nopython=True)
+    def closure_calling(x):
+        return func(x, x)
+
+    return closure_calling
+
+closure3 = make_closure_calling(inner)
+
+
 Z = 1
 
 # Exercise returning a record instance.  This used to hardcode the dtype
@@ -18,12 +18,10 @@ def matmulcore(A, B, C):
 
 class TestVectorizeDecor(unittest.TestCase):
 
-    def test_cpu_guvectorize(self):
-        target = 'cpu'
-
+    def check_guvectorize(self, target, **kws):
         gufunc = guvectorize([void(float32[:,:], float32[:,:], float32[:,:])],
                              '(m,n),(n,p)->(m,p)',
-                             target=target)(matmulcore)
+                             target=target, **kws)(matmulcore)
 
         matrix_ct = 1001 # an odd number to test thread/block division in CUDA
         A = np.arange(matrix_ct * 2 * 4, dtype=np.float32).reshape(matrix_ct, 2, 4)
@@ -34,6 +32,18 @@ class TestVectorizeDecor(unittest.TestCase):
 
         self.assertTrue(np.allclose(C, Gold))
 
+        # Fewer outer iterations than threads
+        C = gufunc(A[:2], B[:2])
+        self.assertTrue(np.allclose(C, Gold[:2]))
+
+    def test_cpu_guvectorize(self):
+        self.check_guvectorize('cpu')
+
+    def test_parallel_guvectorize(self):
+        self.check_guvectorize('parallel')
+        # Always use the thread pool
+        self.check_guvectorize('parallel', serial_threshold=0)
+
 
 if __name__ == '__main__':
     unittest.main()
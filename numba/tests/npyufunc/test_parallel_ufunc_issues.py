@@ -1,7 +1,9 @@
 from __future__ import print_function, absolute_import, division
 
 from numba import unittest_support as unittest
-from numba import vectorize
+from numba import (vectorize, njit, set_num_threads, get_num_threads,
+                   parallel_map, config)
+from numba.npyufunc import parallel
 import numpy as np
 import time
 
@@ -26,6 +28,155 @@ class TestParUfuncIssues(unittest.TestCase):
             # Reduce sleep time
             sleep_time /= 2
 
+    def test_num_threads(self):
+        """
+        The number of threads can be changed after compilation.
+        """
+        @vectorize('float64(float64, float64)', target='parallel')
+        def fnv(a, b):
+            return a + b
+
+        orig = get_num_threads()
+        self.assertEqual(orig, parallel.NUM_THREADS)
+        try:
+            a = b = np.arange(10**5, dtype=np.float64)
+            for n in range(1, parallel.NUM_THREADS + 1):
+                set_num_threads(n)
+                self.assertEqual(get_num_threads(), n)
+                np.testing.assert_equal(fnv(a, b), a + b)
+            # Fewer elements than threads
+            np.testing.assert_equal(fnv(a[:1], b[:1]), a[:1] + b[:1])
+            with self.assertRaises(ValueError):
+                set_num_threads(0)
+            with self.assertRaises(ValueError):
+                set_num_threads(parallel.NUM_THREADS + 1)
+        finally:
+            set_num_threads(orig)
+
+    def test_schedules(self):
+        """
+        All scheduling policies compute the right result, including with
+        uneven per-element costs.
+        """
+        @vectorize('float64(float64)', target='parallel')
+        def uneven(x):
+            # Much more work for the first elements
+            n = 1000 if x < 100 else 1
+            acc = 0.0
+            for i in range(n):
+                acc += x
+            return acc / n
+
+        a = np.arange(10**4, dtype=np.float64)
+        orig = parallel.get_schedule()
+        try:
+            for schedule in ('static', 'dynamic', 'guided'):
+                for grain_size in (0, 1, 7, 10**5):
+                    parallel.set_schedule(schedule, grain_size)
+                    self.assertEqual(parallel.get_schedule(),
+                                     (schedule, grain_size))
+                    np.testing.assert_allclose(uneven(a), a)
+            with self.assertRaises(ValueError):
+                parallel.set_schedule('foo')
+            with self.assertRaises(ValueError):
+                parallel.set_schedule('dynamic', -1)
+        finally:
+            parallel.set_schedule(*orig)
+
+    def test_serial_threshold(self):
+        """
+        The serial threshold can be set at compile time and at runtime,
+        and results don't depend on it.
+        """
+        @vectorize('float64(float64, float64)', target='parallel')
+        def default(a, b):
+            return a + b
+
+        @vectorize('float64(float64, float64)', target='parallel',
+                   serial_threshold=10)
+        def fnv(a, b):
+            return a + b
+
+        self.assertEqual(parallel.get_serial_threshold(default),
+                         config.PARALLEL_SERIAL_THRESHOLD)
+        self.assertEqual(parallel.get_serial_threshold(fnv), 10)
+        a = b = np.arange(100, dtype=np.float64)
+        for threshold in (0, 5, 100, 101, 10**6):
+            parallel.set_serial_threshold(fnv, threshold)
+            self.assertEqual(parallel.get_serial_threshold(fnv), threshold)
+            for n in (1, 5, 50, 100):
+                np.testing.assert_equal(fnv(a[:n], b[:n]), a[:n] + b[:n])
+        with self.assertRaises(ValueError):
+            parallel.set_serial_threshold(fnv, -1)
+        with self.assertRaises(TypeError):
+            parallel.set_serial_threshold(np.add, 10)
+
+    def test_parallel_reduce(self):
+        @vectorize(['int64(int64, int64)', 'float64(float64, float64)'],
+                   target='parallel', identity=0, serial_threshold=0)
+        def add(a, b):
+            return a + b
+
+        @vectorize('int64(int64, int64)', target='parallel',
+                   serial_threshold=0)
+        def no_identity(a, b):
+            return a + b
+
+        for n in (0, 1, 3, 10**5 + 1):
+            a = np.arange(n, dtype=np.int64)
+            self.assertEqual(parallel.parallel_reduce(add, a), a.sum())
+            # Non-contiguous and multi-dimensional arrays
+            self.assertEqual(parallel.parallel_reduce(add, a[::3]),
+                             a[::3].sum())
+            if n > 1:
+                self.assertEqual(parallel.parallel_reduce(no_identity, a[1:]),
+                                 a[1:].sum())
+            else:
+                # Empty reduction without an identity
+                with self.assertRaises(ValueError):
+                    parallel.parallel_reduce(no_identity, a[1:])
+        a = np.arange(10**5, dtype=np.float64).reshape((100, -1))
+        self.assertAlmostEqual(parallel.parallel_reduce(add, a), a.sum())
+        # No loop for this dtype: falls back on the NumPy machinery
+        a = np.arange(100, dtype=np.int32)
+        self.assertEqual(parallel.parallel_reduce(add, a), a.sum())
+        with self.assertRaises(TypeError):
+            parallel.parallel_reduce(np.add, a)
+
+    def test_parallel_map(self):
+        @njit(nogil=True)
+        def square(a):
+            return a * a
+
+        @njit(nogil=True)
+        def fill(a):
+            a[:] = 1.0
+
+        @njit(nogil=True)
+        def total(a):
+            if a.size == 0:
+                raise ValueError("empty chunk")
+            return a.sum()
+
+        a = np.arange(10**5, dtype=np.float64).reshape((1000, -1))
+        for chunks in (None, 1, 3, 1000, 10**4):
+            np.testing.assert_equal(parallel_map(square, a, chunks=chunks),
+                                    a * a)
+        b = np.zeros(1001)
+        self.assertIs(parallel_map(fill, b, chunks=7), None)
+        np.testing.assert_equal(b, 1.0)
+        sums = parallel_map(total, a.ravel(), chunks=4)
+        self.assertEqual(len(sums), 4)
+        self.assertEqual(sum(sums), a.sum())
+        with self.assertRaises(ValueError):
+            parallel_map(total, a[:0])
+        with self.assertRaises(ValueError):
+            parallel_map(square, a, chunks=0)
+
+    def test_available_cpu_count(self):
+        count = config._get_available_cpu_count()
+        self.assertGreaterEqual(count, 1)
+
 
 if __name__ == '__main__':
     unittest.main()
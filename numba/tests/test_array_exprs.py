@@ -321,5 +321,46 @@ class TestRewriteIssues(MemoryLeakMixin, unittest.TestCase):
         np.testing.assert_allclose(got, expect)
 
 
+class TestParallelArrayExprs(MemoryLeakMixin, unittest.TestCase):
+    """
+    Array expressions in @jit(parallel=True) functions.
+    """
+
+    def check(self, pyfunc, *args):
+        cfunc = njit(parallel=True)(pyfunc)
+        expect = pyfunc(*args)
+        got = cfunc(*args)
+        self.assertEqual(got.dtype, expect.dtype)
+        np.testing.assert_allclose(got, expect)
+
+    def test_sizes(self):
+        # Below and above the serial threshold
+        for n in (0, 1, 10, 10**5 + 1):
+            a = np.linspace(0., 1., n)
+            x = np.arange(n, dtype=np.float64)
+            self.check(axy, a, x, 2.)
+            self.check(pos_root, a + 1., x, a)
+
+    def test_broadcast(self):
+        a = np.arange(10**5, dtype=np.float64).reshape((1000, 100))
+        # Broadcast along the outer dimension, and lower-dimensional operand
+        self.check(axy, a, a[:1], np.arange(100.))
+        self.check(axy, a[:1], a, np.arange(100.))
+        # Non-contiguous operands
+        self.check(axy, a[::2], a[1::2], a[::2, ::-1])
+
+    def test_error(self):
+        @njit(parallel=True)
+        def foo(a, b):
+            return (a + b) // b
+
+        a = np.arange(10**5)
+        b = np.ones_like(a)
+        np.testing.assert_equal(foo(a, b), a + 1)
+        b[-1] = 0
+        with self.assertRaises(ZeroDivisionError):
+            foo(a, b)
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -8,14 +8,16 @@ import subprocess
 import sys
 import tempfile
 import threading
+import time
 import warnings
 
 import numpy as np
 
 from numba import unittest_support as unittest
-from numba import utils, vectorize, jit
+from numba import (compiler, utils, vectorize, jit, types,
+                   wait_background_compilation)
 from numba.config import NumbaWarning
-from .support import TestCase
+from .support import TestCase, override_config
 
 
 def dummy(x):
@@ -38,6 +40,31 @@ def star_defaults(x, y=2, *z):
     return x, y, z
 
 
+KEYWORDS = frozenset(['alpha', 'beta', 'gamma', 'delta'])
+UNHASHABLE = object()
+
+
+def in_constant_set(x):
+    return x in ('alpha', 'beta', 'gamma', 'delta')
+
+
+def in_global_set(x):
+    return x in KEYWORDS
+
+
+def use_unhashable(x):
+    return UNHASHABLE
+
+
+def make_set_closure():
+    keys = frozenset(['alpha', 'beta', 'gamma', 'delta'])
+    def in_closure_set(x):
+        return x in keys
+    return in_closure_set
+
+in_closure_set = make_set_closure()
+
+
 class TestDispatcher(TestCase):
 
     def compile_func(self, pyfunc):
@@ -125,6 +152,40 @@ class TestDispatcher(TestCase):
             t.join()
         self.assertFalse(errors)
 
+    def test_concurrent_compilation(self):
+        """
+        Test that compiling distinct dispatchers from several threads
+        at once, all sharing the same callee and subroutines, gives
+        correct results.
+        """
+        errors = []
+
+        @jit(nopython=True)
+        def callee(x):
+            return x.sum()
+
+        def make_caller(i):
+            def caller(x):
+                return callee(x) + i
+            return jit(nopython=True)(caller)
+
+        callers = [make_caller(i) for i in range(16)]
+        arr = np.arange(10, dtype=np.float64)
+
+        def wrapper(i):
+            try:
+                self.assertPreciseEqual(callers[i](arr), arr.sum() + i)
+            except BaseException as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=wrapper, args=(i,))
+                   for i in range(len(callers))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertFalse(errors)
+
     def test_named_args(self):
         """
         Test passing named arguments to a dispatcher.
@@ -263,6 +324,75 @@ class TestDispatcher(TestCase):
                          "complex128, complex128")
 
 
+class TestBackgroundCompilation(TestCase):
+
+    def setUp(self):
+        wait_background_compilation()
+
+    def test_python_fallback(self):
+        f = jit(nopython=True, background=True)(add)
+        # Before compilation finishes, the Python function is called
+        self.assertPreciseEqual(f(1, 2), 3)
+        wait_background_compilation()
+        self.assertEqual(f.signatures, [(types.int64, types.int64)])
+        self.assertPreciseEqual(f(1, 2), 3)
+        self.assertEqual(len(f.overloads), 1)
+
+    def test_compatible_overload(self):
+        f = jit(nopython=True, background=True)(add)
+        f.compile((types.float64, types.float64))
+        # The existing overload is used until (int64, int64) is compiled
+        self.assertPreciseEqual(f(1, 2), 3.0)
+        wait_background_compilation()
+        self.assertPreciseEqual(f(1, 2), 3)
+        self.assertEqual(len(f.overloads), 2)
+
+    def test_star_args(self):
+        f = jit(nopython=True, background=True)(star_defaults)
+        self.assertPreciseEqual(f(4, 5, 6, 7), (4, 5, (6, 7)))
+        self.assertPreciseEqual(f(4), (4, 2, ()))
+        wait_background_compilation()
+        self.assertPreciseEqual(f(4, 5, 6, 7), (4, 5, (6, 7)))
+        self.assertEqual(len(f.overloads), 2)
+
+    def test_compilation_error(self):
+        def bad(x):
+            return object()
+
+        f = jit(nopython=True, background=True)(bad)
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always', NumbaWarning)
+            self.assertIsInstance(f(1), object)
+            wait_background_compilation()
+        self.assertEqual(len(w), 1)
+        self.assertIn("Background compilation of bad", str(w[0].message))
+        # The Python function keeps being used, without recompiling
+        self.assertIsInstance(f(1), object)
+        wait_background_compilation()
+        self.assertEqual(f.signatures, [])
+
+    @unittest.skipUnless(hasattr(os, 'fork'), "needs os.fork()")
+    def test_fork(self):
+        f = jit(nopython=True, background=True)(add)
+        # Start the background threads in the parent
+        f(1, 2)
+        wait_background_compilation()
+        pid = os.fork()
+        if pid == 0:
+            # Child: compilation must happen in fresh threads
+            status = 1
+            try:
+                f(1.5, 2.5)
+                wait_background_compilation()
+                if len(f.overloads) == 2:
+                    status = 0
+            finally:
+                os._exit(status)
+        _, status = os.waitpid(pid, 0)
+        self.assertEqual(status, 0)
+        self.assertEqual(len(f.overloads), 1)
+
+
 class TestDispatcherMethods(TestCase):
 
     def test_recompile(self):
@@ -299,6 +429,55 @@ class TestDispatcherMethods(TestCase):
         self.assertPreciseEqual(foo(1), 3)
         self.assertPreciseEqual(foo(1.5), 3)
 
+    def test_get_compile_stats(self):
+        @jit(nopython=True)
+        def foo(x):
+            return x + 1
+
+        foo(1)
+        foo(1.5)
+        all_stats = foo.get_compile_stats()
+        self.assertEqual(len(all_stats), 2)
+        stats = foo.get_compile_stats((types.int64,))
+        self.assertEqual(stats, all_stats[(types.int64,)])
+        self.assertEqual([(st.pipeline, st.stage) for st in stats],
+                         [("nopython", "analyzing bytecode"),
+                          ("nopython", "nopython frontend"),
+                          ("nopython", "annotate type"),
+                          ("nopython", "nopython rewrites"),
+                          ("nopython", "nopython mode backend")])
+        for st in stats:
+            self.assertGreaterEqual(st.wall_time, 0.0)
+            if st.peak_rss is not None:
+                self.assertGreater(st.peak_rss, 0)
+                self.assertGreaterEqual(st.peak_rss_increase, 0)
+            if sys.platform.startswith('linux'):
+                self.assertIsInstance(st.rss_growth, utils.INT_TYPES)
+
+    def test_process_compile_stats(self):
+        def foo(x):
+            return x + 1
+
+        compiler.reset_compile_stats()
+        jit(nopython=True)(foo)(1)
+        self.assertEqual(compiler.get_compile_stats(), [])
+        with override_config('COMPILE_STATS', 1):
+            cfunc = jit(nopython=True)(foo)
+            cfunc(1)
+        records = compiler.get_compile_stats()
+        self.assertEqual(len(records), 1)
+        name, sig, stats = records[0]
+        self.assertIn("foo", name)
+        self.assertEqual(sig.args, (types.int64,))
+        self.assertEqual(stats, cfunc.get_compile_stats(sig.args))
+        summary = compiler.get_compile_stats_summary()
+        count, wall_time, rss_growth = summary["nopython",
+                                               "nopython frontend"]
+        self.assertEqual(count, 1)
+        self.assertEqual(wall_time, stats[1].wall_time)
+        compiler.reset_compile_stats()
+        self.assertEqual(compiler.get_compile_stats(), [])
+
     def test_inspect_llvm(self):
         # Create a jited function
         @jit
@@ -380,6 +559,43 @@ class TestDispatcherMethods(TestCase):
         self.assertEqual(exp_f, got_f)
 
 
+class TestContentHasher(TestCase):
+
+    def compute_in_subprocess(self, funcname, hash_seed,
+                              expr="_ContentHasher(func).compute()"):
+        code = """if 1:
+            from numba.dispatcher import _ContentHasher, FunctionCache
+            from numba.tests.test_dispatcher import %s as func
+            print(%s)
+            """ % (funcname, expr)
+        env = dict(os.environ, PYTHONHASHSEED=str(hash_seed))
+        popen = subprocess.Popen([sys.executable, "-c", code],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env=env)
+        out, err = popen.communicate()
+        self.assertEqual(popen.returncode, 0, err.decode())
+        return out.strip()
+
+    def test_sets_stable_across_processes(self):
+        # Set iteration order depends on the string hash seed
+        for funcname in ('in_constant_set', 'in_global_set'):
+            stamps = set(self.compute_in_subprocess(funcname, seed)
+                         for seed in range(1, 6))
+            self.assertEqual(len(stamps), 1, funcname)
+
+    def test_closure_key_stable_across_processes(self):
+        # Closure constants are folded into the cache file names
+        expr = "FunctionCache(func)._filename_base"
+        names = set(self.compute_in_subprocess('in_closure_set', seed, expr)
+                    for seed in range(1, 6))
+        self.assertEqual(len(names), 1)
+
+    def test_unhashable(self):
+        from numba.dispatcher import _ContentHasher, _UnhashableValue
+        with self.assertRaises(_UnhashableValue):
+            _ContentHasher(use_unhashable).compute()
+
+
 class TestCache(TestCase):
 
     here = os.path.dirname(__file__)
@@ -426,7 +642,7 @@ class TestCache(TestCase):
     def cache_contents(self):
         try:
             return [fn for fn in os.listdir(self.cache_dir)
-                    if not fn.endswith(('.pyc', ".pyo"))]
+                    if not fn.endswith(('.pyc', ".pyo", ".lock"))]
         except OSError as e:
             if e.errno != errno.ENOENT:
                 raise
@@ -537,7 +753,7 @@ class TestCache(TestCase):
         self.check_cache(0)
 
     def test_looplifted(self):
-        # Loop-lifted functions can't be cached and raise a warning
+        # Loop-lifted functions are cached along with their lifted loops
         mod = self.import_module()
 
         with warnings.catch_warnings(record=True) as w:
@@ -545,12 +761,20 @@ class TestCache(TestCase):
 
             f = mod.looplifted
             self.assertPreciseEqual(f(4), 6)
-            self.check_cache(0)
+            self.check_cache(4)  # 2 index, 2 data
 
-        self.assertEqual(len(w), 1)
-        self.assertEqual(str(w[0].message),
-                         'Cannot cache compiled function "looplifted" '
-                         'as it uses lifted loops')
+        self.assertEqual(len(w), 0)
+        mtimes = self.get_cache_mtimes()
+
+        mod = self.import_module()
+        f = mod.looplifted
+        self.assertPreciseEqual(f(5), 10)
+        [cres] = f._compileinfos.values()
+        [loop] = cres.lifted
+        # The lifted loop was loaded from the cache too
+        [loop_cres] = loop._compileinfos.values()
+        self.assertIsInstance(loop_cres.type_annotation, str)
+        self.assertEqual(self.get_cache_mtimes(), mtimes)
 
     def test_ctypes(self):
         # Functions using a ctypes pointer can't be cached and raise
@@ -569,6 +793,8 @@ class TestCache(TestCase):
                       str(w[0].message))
 
     def test_closure(self):
+        # Closures over constants are cached separately for each set
+        # of values
         mod = self.import_module()
 
         with warnings.catch_warnings(record=True) as w:
@@ -578,12 +804,30 @@ class TestCache(TestCase):
             self.assertPreciseEqual(f(3), 6)
             f = mod.closure2
             self.assertPreciseEqual(f(3), 8)
-            self.check_cache(0)
+            self.check_cache(4)  # 2 index, 2 data
+
+        self.assertEqual(len(w), 0)
+        mtimes = self.get_cache_mtimes()
+
+        mod = self.import_module()
+        self.assertPreciseEqual(mod.closure2(3), 8)
+        self.assertPreciseEqual(mod.closure1(3), 6)
+        self.assertEqual(self.get_cache_mtimes(), mtimes)
+
+    def test_closure_nonconstant(self):
+        # Closures over other values can't be cached and raise a warning
+        mod = self.import_module()
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always', NumbaWarning)
 
-        self.assertEqual(len(w), 2)
-        for item in w:
-            self.assertIn('Cannot cache compiled function "closure"',
-                          str(item.message))
+            f = mod.closure3
+            self.assertPreciseEqual(f(3), 7)
+            self.check_cache(2)  # 1 index, 1 data for inner()
+
+        self.assertEqual(len(w), 1)
+        self.assertIn('Cannot cache compiled function "closure_calling"',
+                      str(w[0].message))
 
     def test_cache_reuse(self):
         mod = self.import_module()
@@ -620,6 +864,344 @@ class TestCache(TestCase):
         f = mod.add_objmode_usecase
         self.assertPreciseEqual(f(2, 3), 15)
 
+    def test_cache_content_invalidation(self):
+        # With content-based invalidation, modifying the source file
+        # without changing the function keeps the cache valid, but
+        # changing a global the function refers to invalidates it.
+        with override_config('CACHE_INVALIDATION', 'content'):
+            mod = self.import_module()
+            f = mod.add_usecase
+            self.assertPreciseEqual(f(2, 3), 6)
+            mtimes = self.get_cache_mtimes()
+
+            with open(self.modfile, "a") as f:
+                f.write("\n# Unrelated change\n")
+
+            mod = self.import_module()
+            f = mod.add_usecase
+            self.assertPreciseEqual(f(2, 3), 6)
+            self.assertEqual(self.get_cache_mtimes(), mtimes)
+
+            with open(self.modfile, "a") as f:
+                f.write("\nZ = 10\n")
+
+            mod = self.import_module()
+            f = mod.add_usecase
+            self.assertPreciseEqual(f(2, 3), 15)
+            f = mod.outer
+            self.assertPreciseEqual(f(3, 2), 11)
+
+    def test_cache_content_hash_computed_once(self):
+        # The content hash is computed lazily, and only once per function
+        from numba import dispatcher
+        hashers = []
+        orig_compute = dispatcher._ContentHasher.compute
+
+        def compute(hasher):
+            hashers.append(hasher)
+            return orig_compute(hasher)
+
+        dispatcher._ContentHasher.compute = compute
+        try:
+            with override_config('CACHE_INVALIDATION', 'content'):
+                mod = self.import_module()
+                self.assertEqual(hashers, [])
+                f = mod.add_usecase
+                self.assertPreciseEqual(f(2, 3), 6)
+                self.assertPreciseEqual(f(2.5, 3), 6.5)
+        finally:
+            dispatcher._ContentHasher.compute = orig_compute
+        self.assertEqual(len(hashers), 1)
+        self.check_cache(3)
+
+    def test_cache_dir(self):
+        # NUMBA_CACHE_DIR redirects cache files away from __pycache__
+        cache_root = os.path.join(self.tempdir, "cache_root")
+        with override_config('CACHE_DIR', cache_root):
+            mod = self.import_module()
+            f = mod.add_usecase
+            self.assertPreciseEqual(f(2, 3), 6)
+            self.check_cache(0)
+            self.assertEqual(len(os.listdir(cache_root)), 2)
+
+            mod = self.import_module()
+            f = mod.add_usecase
+            self.assertPreciseEqual(f(2.5, 3), 6.5)
+            self.assertEqual(len(os.listdir(cache_root)), 3)
+
+    def test_no_cache_dir_until_saving(self):
+        # Decorating a cached function doesn't touch the filesystem
+        old = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+        try:
+            mod = self.import_module()
+        finally:
+            sys.dont_write_bytecode = old
+        self.assertFalse(os.path.exists(self.cache_dir))
+        self.assertPreciseEqual(mod.add_usecase(2, 3), 6)
+        self.check_cache(2)
+
+    def test_cache_bundle(self):
+        from numba import dispatcher
+        mod = self.import_module()
+        mod.add_usecase(2, 3)
+        mod.outer(3, 2)
+        self.check_cache(4)
+        contents = sorted(self.cache_contents())
+
+        bundle = os.path.join(self.tempdir, "bundle.zip")
+        self.assertEqual(dispatcher.export_cache_bundle(self.modname, bundle),
+                         4)
+        shutil.rmtree(self.cache_dir)
+        self.assertEqual(dispatcher.import_cache_bundle(bundle), 4)
+        self.assertEqual(sorted(self.cache_contents()), contents)
+        mtimes = self.get_cache_mtimes()
+
+        # The imported files are reused
+        mod = self.import_module()
+        self.assertPreciseEqual(mod.add_usecase(2, 3), 6)
+        self.assertPreciseEqual(mod.outer(3, 2), 2)
+        self.assertEqual(self.get_cache_mtimes(), mtimes)
+
+    @unittest.skipIf(sys.platform.startswith('win'),
+                     "read-only directories need POSIX permissions")
+    def test_cache_bundle_readonly(self):
+        # A bundle installed in __pycache__ is used even if the directory
+        # isn't writable at runtime (e.g. a read-only system install)
+        from numba import dispatcher
+        mod = self.import_module()
+        mod.add_usecase(2, 3)
+        bundle = os.path.join(self.tempdir, "bundle.zip")
+        self.assertEqual(dispatcher.export_cache_bundle(self.modname, bundle),
+                         2)
+        shutil.rmtree(self.cache_dir)
+        self.assertEqual(dispatcher.import_cache_bundle(bundle), 2)
+
+        user_cache_dir = os.path.join(self.tempdir, "user_cache")
+        old_get_user_cache_dir = dispatcher._get_user_cache_dir
+        dispatcher._get_user_cache_dir = lambda: user_cache_dir
+        old_dont_write_bytecode = sys.dont_write_bytecode
+        sys.dont_write_bytecode = True
+        os.chmod(self.cache_dir, 0o555)
+        try:
+            mod = self.import_module()
+            self.assertPreciseEqual(mod.add_usecase(2, 3), 6)
+        finally:
+            os.chmod(self.cache_dir, 0o755)
+            sys.dont_write_bytecode = old_dont_write_bytecode
+            dispatcher._get_user_cache_dir = old_get_user_cache_dir
+        # Cache hit: nothing was compiled and saved in the fallback
+        # user-wide directory
+        self.assertFalse(os.path.exists(user_cache_dir))
+
+    def test_cache_archive(self):
+        # The archive backend stores all overloads of a module in one file
+        with override_config('CACHE_BACKEND', 'archive'):
+            mod = self.import_module()
+            self.assertPreciseEqual(mod.add_usecase(2, 3), 6)
+            self.assertPreciseEqual(mod.add_usecase(2.5, 3), 6.5)
+            self.assertPreciseEqual(mod.outer(3, 2), 2)
+            self.check_cache(1)
+
+            mod = self.import_module()
+            self.assertPreciseEqual(mod.add_usecase(2.5, 3), 6.5)
+            self.assertPreciseEqual(mod.outer(3, 2), 2)
+            self.check_cache(1)
+
+            # recompile() flushes the function's entries
+            mod.Z = 10
+            f = mod.add_usecase
+            f.recompile()
+            self.assertPreciseEqual(f(2, 3), 15)
+            mod = self.import_module()
+            self.assertPreciseEqual(mod.add_usecase(2, 3), 15)
+
+    def test_cache_archive_eviction(self):
+        # With a size budget, the least recently loaded entries are evicted
+        from numba.dispatcher import ArchiveFunctionCache
+        with override_config('CACHE_BACKEND', 'archive'):
+            mod = self.import_module()
+            mod.add_usecase(2, 3)
+            [archive] = self.cache_contents()
+            size = os.path.getsize(os.path.join(self.cache_dir, archive))
+
+            with override_config('CACHE_MAX_SIZE', size + 10):
+                mod = self.import_module()
+                f = mod.add_usecase
+                f(2.5, 3)
+                cache = ArchiveFunctionCache(f.py_func)
+                codegen = f.targetctx.codegen()
+
+                def load(sig):
+                    return cache._archive.load(cache._func_id,
+                                               cache._entry_key(sig, codegen),
+                                               cache._stamp_digest())
+
+                self.assertIsNone(load((types.int64, types.int64)))
+                self.assertIsNotNone(load((types.float64, types.int64)))
+
+    def test_concurrent_processes(self):
+        # When several processes compile the same function concurrently,
+        # only one of them actually compiles it, the others wait and
+        # load the result from the cache.
+        code = """if 1:
+            import sys
+
+            sys.path.insert(0, %(tempdir)r)
+            mod = __import__(%(modname)r)
+            f = mod.add_usecase
+            assert f(2, 3) == 6
+            [cres] = f._compileinfos.values()
+            # A compile result loaded from the cache has a string annotation
+            print(int(not isinstance(cres.type_annotation, str)))
+            """ % dict(tempdir=self.tempdir, modname=self.modname)
+
+        popens = [subprocess.Popen([sys.executable, "-c", code],
+                                   stdout=subprocess.PIPE,
+                                   stderr=subprocess.PIPE)
+                  for i in range(4)]
+        ncompiled = 0
+        for popen in popens:
+            out, err = popen.communicate()
+            if popen.returncode != 0:
+                raise AssertionError("process failed with code %s: "
+                                     "stderr follows\n%s\n"
+                                     % (popen.returncode, err.decode()))
+            ncompiled += int(out.strip())
+        self.assertEqual(ncompiled, 1)
+        self.check_cache(2)  # 1 index, 1 data
+
+    def test_cache_archive_concurrent_saves(self):
+        # Concurrent saves of different functions all end up in the archive
+        from numba.dispatcher import _CacheArchive
+        archive = _CacheArchive(os.path.join(self.tempdir, 'test.nba'))
+        stamp = b's' * 16
+        keys = [(('f%02d' % i).encode() * 6)[:16] for i in range(16)]
+
+        def save(func_id):
+            archive.save(func_id, b'k' * 16, stamp, func_id * 100)
+
+        threads = [threading.Thread(target=save, args=(key,))
+                   for key in keys]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        for key in keys:
+            self.assertEqual(archive.load(key, b'k' * 16, stamp), key * 100)
+
+    def test_cache_archive_append(self):
+        # Saves append to the archive, which is only rewritten once
+        # compacting it is worthwhile
+        from numba.dispatcher import _CacheArchive
+        path = os.path.join(self.tempdir, 'test.nba')
+        archive = _CacheArchive(path)
+        stamp = b's' * 16
+        key = b'k' * 16
+        func_ids = [(b'%04d' % i) * 4 for i in range(16)]
+
+        archive.save(func_ids[0], key, stamp, b'x' * 10000)
+        record_size = _CacheArchive._record.size
+        for func_id in func_ids[1:]:
+            size = os.path.getsize(path)
+            archive.save(func_id, key, stamp, func_id)
+            self.assertEqual(os.path.getsize(path),
+                             size + record_size + len(func_id))
+        for func_id in func_ids[1:]:
+            self.assertEqual(archive.load(func_id, key, stamp), func_id)
+
+        # The latest entry wins
+        size = os.path.getsize(path)
+        archive.save(func_ids[1], key, stamp, b'y')
+        self.assertEqual(os.path.getsize(path), size + record_size + 1)
+        self.assertEqual(archive.load(func_ids[1], key, stamp), b'y')
+
+        # Superseding the bulk of the archive triggers a compaction
+        size = os.path.getsize(path)
+        archive.save(func_ids[0], key, stamp, b'z')
+        self.assertLess(os.path.getsize(path), size)
+        self.assertEqual(archive.load(func_ids[0], key, stamp), b'z')
+        self.assertEqual(archive.load(func_ids[1], key, stamp), b'y')
+        for func_id in func_ids[2:]:
+            self.assertEqual(archive.load(func_id, key, stamp), func_id)
+
+        # The leftovers of an interrupted save are ignored
+        with open(path, 'ab') as f:
+            f.write(b'garbage')
+        self.assertEqual(archive.load(func_ids[1], key, stamp), b'y')
+        archive.save(func_ids[2], key, stamp, b'w')
+        self.assertEqual(archive.load(func_ids[2], key, stamp), b'w')
+
+    def test_cache_archive_entry_too_large(self):
+        # An entry larger than the size budget on its own isn't saved
+        from numba.dispatcher import _CacheArchive
+        path = os.path.join(self.tempdir, 'test.nba')
+        archive = _CacheArchive(path, max_size=1000)
+        stamp = b's' * 16
+        key = b'k' * 16
+        archive.save(b'a' * 16, key, stamp, b'x' * 100)
+
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always', NumbaWarning)
+            archive.save(b'b' * 16, key, stamp, b'x' * 1000)
+
+        self.assertEqual(len(w), 1)
+        self.assertIn("larger than NUMBA_CACHE_MAX_SIZE", str(w[0].message))
+        self.assertIsNone(archive.load(b'b' * 16, key, stamp))
+        self.assertEqual(archive.load(b'a' * 16, key, stamp), b'x' * 100)
+        self.assertLessEqual(os.path.getsize(path), 1000)
+
+    def test_lock_threads(self):
+        # The cache locks also exclude the threads of the process, even
+        # while other locks of the same file are taken and released
+        from numba.dispatcher import _InterProcessLock
+        path = os.path.join(self.tempdir, 'test.lock')
+        inside = []
+        overlaps = []
+
+        def run():
+            for i in range(20):
+                with _InterProcessLock(path, 1, timeout=60):
+                    inside.append(i)
+                    if len(inside) > 1:
+                        overlaps.append(i)
+                    time.sleep(0.001)
+                    inside.pop()
+                with _InterProcessLock(path, 2, timeout=60):
+                    pass
+
+        threads = [threading.Thread(target=run) for i in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(overlaps, [])
+        self.assertEqual(_InterProcessLock._files, {})
+
+    @unittest.skipIf(sys.platform.startswith('win'), "POSIX only")
+    def test_lock_unsupported(self):
+        # If the filesystem doesn't support locking (e.g. ENOLCK on NFS),
+        # compiling proceeds without the lock, with a single warning
+        import fcntl
+
+        def lockf(*args):
+            raise IOError(errno.ENOLCK, "No locks available")
+
+        orig_lockf = fcntl.lockf
+        fcntl.lockf = lockf
+        try:
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always', NumbaWarning)
+                mod = self.import_module()
+                self.assertPreciseEqual(mod.add_usecase(2, 3), 6)
+                self.assertPreciseEqual(mod.add_usecase(2.5, 3), 6.5)
+        finally:
+            fcntl.lockf = orig_lockf
+        self.check_cache(3)
+        w = [str(x.message) for x in w]
+        self.assertEqual(len(w), 1, w)
+        self.assertIn("proceeding without the lock", w[0])
+
     def test_recompile(self):
         # Explicit call to recompile() should overwrite the cache
         mod = self.import_module()
@@ -945,5 +945,43 @@ def benchmark_refct_speed():
     print(numba_time)
 
 
+def benchmark_refct_pruning():
+    """Compare the refct operations left in an array loop, and its speed,
+    with and without the pruning of refct pairs across basic blocks.
+    """
+    from numba.runtime import atomicops
+
+    def pyfunc(x, y, t):
+        s = 0.0
+        for i in range(t):
+            z = x
+            if i % 3 == 0:
+                z = y
+            s += z[i % z.size]
+        return s
+
+    x = np.random.random(100)
+    y = np.random.random(100)
+    t = 100000
+
+    for prune in (False, True):
+        atomicops._prune_across_blocks = prune
+        try:
+            cfunc = nrtjit(pyfunc)
+            cfunc(x, y, 1)
+        finally:
+            atomicops._prune_across_blocks = True
+        ir = cfunc.inspect_llvm(cfunc.signatures[0])
+
+        def bench_cfunc():
+            cfunc(x, y, t)
+
+        print("prune across blocks: %s" % prune)
+        print("  atomic ops: %d" % ir.count("atomicrmw"))
+        print("  refct calls: %d" % (ir.count("call void @NRT_incref") +
+                                     ir.count("call void @NRT_decref")))
+        print("  %s" % (utils.benchmark(bench_cfunc),))
+
+
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,70 @@
+from __future__ import print_function, absolute_import, division
+
+import subprocess
+import sys
+
+from numba import unittest_support as unittest
+from .support import TestCase
+
+
+class TestNumbaImport(TestCase):
+    """
+    Test behaviour of importing Numba.
+    """
+
+    def run_in_subprocess(self, code):
+        popen = subprocess.Popen([sys.executable, "-c", code],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE)
+        out, err = popen.communicate()
+        if popen.returncode != 0:
+            raise AssertionError("process failed with code %s: stderr "
+                                 "follows\n%s\n"
+                                 % (popen.returncode, err.decode()))
+        return out.decode().strip()
+
+    def test_laziness(self):
+        """
+        Importing top-level numba features must not import optional
+        subsystems.
+        """
+        lazy = ['numba.cuda', 'numba.hsa', 'numba.pycc',
+                'numba.annotations']
+        code = """if 1:
+            import sys
+            import numba
+            from numba import jit, vectorize, guvectorize
+            print(' '.join(m for m in {lazy!r} if m in sys.modules))
+            """.format(lazy=lazy)
+        self.assertEqual(self.run_in_subprocess(code), "")
+
+    def test_lazy_cuda(self):
+        """
+        numba.cuda is imported on first attribute access.
+        """
+        code = """if 1:
+            import sys
+            import numba
+            assert 'numba.cuda' not in sys.modules
+            print(callable(numba.cuda.is_available))
+            assert 'numba.cuda' in sys.modules
+            """
+        self.assertEqual(self.run_in_subprocess(code), "True")
+
+    def test_lazy_cuda_jit_target(self):
+        """
+        The CUDA jit targets can be used before numba.cuda is imported.
+        """
+        code = """if 1:
+            import sys
+            import numba
+            assert 'numba.cuda' not in sys.modules
+            for target in ('cuda', 'gpu'):
+                print(callable(numba.jit(target=target)))
+            """
+        self.assertEqual(self.run_in_subprocess(code).split(),
+                         ["True", "True"])
+
+
+if __name__ == '__main__':
+    unittest.main()
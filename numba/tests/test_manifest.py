@@ -0,0 +1,145 @@
+from __future__ import print_function, absolute_import, division
+
+import os
+import shutil
+import tempfile
+import warnings
+
+from numba import unittest_support as unittest
+from numba import jit, types, warmup
+from numba.config import NumbaWarning
+from numba.manifest import SignatureManifest
+from .support import TestCase, override_config
+
+
+@jit(nopython=True)
+def add_recorded(x, y):
+    return x + y
+
+
+@jit(nopython=True)
+def add_warmup(x, y):
+    return x + y
+
+
+@jit(nopython=True)
+def mul_warmup(x, y):
+    return x * y
+
+
+@jit(nopython=True)
+def sub_inprocess(x, y):
+    return x - y
+
+
+@jit(nopython=True)
+def neg_warmup(x):
+    return -x
+
+
+@jit(nopython=True)
+def neg_inprocess(x):
+    return -x
+
+
+class BaseManifestTest(TestCase):
+
+    def setUp(self):
+        self.tempdir = tempfile.mkdtemp(prefix='numba-test-')
+        self.manifest_path = os.path.join(self.tempdir, 'sigs.manifest')
+
+    def tearDown(self):
+        shutil.rmtree(self.tempdir)
+
+    def write_manifest(self, records):
+        manifest = SignatureManifest(self.manifest_path)
+        for func, args in records:
+            manifest.record(__name__, func.__name__, args)
+
+
+class TestRecording(BaseManifestTest):
+
+    def test_record(self):
+        int_sig = (types.int64, types.int64)
+        float_sig = (types.float64, types.float64)
+        with override_config('SIGNATURE_MANIFEST', self.manifest_path):
+            add_recorded(1, 2)
+            add_recorded(1.0, 2.0)
+            add_recorded(3, 4)
+            def local_func(x):
+                return x
+            # Not recorded, as it can't be looked up by name
+            jit(nopython=True)(local_func)(1)
+        expected = [((__name__, 'add_recorded'), [int_sig, float_sig])]
+        self.assertEqual(SignatureManifest(self.manifest_path).read(),
+                         expected)
+        # Recording again doesn't duplicate entries
+        with override_config('SIGNATURE_MANIFEST', self.manifest_path):
+            add_recorded.recompile()
+        manifest = SignatureManifest(self.manifest_path)
+        self.assertEqual(manifest.read(), expected)
+        self.assertEqual(len(list(manifest._iter_records())), 2)
+
+    def test_truncated(self):
+        manifest = SignatureManifest(self.manifest_path)
+        manifest.record('mod', 'f', (types.int32,))
+        manifest.record('mod', 'g', (types.float32,))
+        with open(self.manifest_path, 'rb+') as f:
+            f.truncate(os.path.getsize(self.manifest_path) - 3)
+        self.assertEqual(manifest.read(), [(('mod', 'f'), [(types.int32,)])])
+
+
+class TestWarmup(BaseManifestTest):
+
+    def test_warmup(self):
+        int_sig = (types.int64, types.int64)
+        float_sig = (types.float64, types.float64)
+        self.write_manifest([(add_warmup, int_sig), (add_warmup, float_sig),
+                             (mul_warmup, int_sig)])
+        self.assertEqual(warmup(self.manifest_path, processes=2), 3)
+        self.assertEqual(sorted(add_warmup.signatures, key=str),
+                         [float_sig, int_sig])
+        self.assertEqual(mul_warmup.signatures, [int_sig])
+        self.assertPreciseEqual(add_warmup(1, 2), 3)
+        self.assertPreciseEqual(add_warmup(1.5, 2.0), 3.5)
+        self.assertPreciseEqual(mul_warmup(3, 4), 12)
+        # Already compiled signatures are skipped
+        self.assertEqual(warmup(self.manifest_path, processes=2), 0)
+
+    def test_warmup_in_process(self):
+        int_sig = (types.int64, types.int64)
+        self.write_manifest([(sub_inprocess, int_sig)])
+        self.assertEqual(warmup(self.manifest_path, processes=0), 1)
+        self.assertEqual(sub_inprocess.signatures, [int_sig])
+        self.assertPreciseEqual(sub_inprocess(5, 3), 2)
+
+    def test_missing_function(self):
+        manifest = SignatureManifest(self.manifest_path)
+        manifest.record(__name__, 'no_such_function', (types.int64,))
+        with warnings.catch_warnings(record=True) as w:
+            warnings.simplefilter('always', NumbaWarning)
+            self.assertEqual(warmup(manifest), 0)
+        self.assertEqual(len(w), 1)
+        self.assertIn("no_such_function: JIT function not found",
+                      str(w[0].message))
+
+    def test_compilation_error(self):
+        # A signature failing to compile doesn't prevent the others
+        # from being warmed up
+        int_sig = (types.int64,)
+        bad_sig = (types.none,)
+        for func, processes in [(neg_warmup, 2), (neg_inprocess, 0)]:
+            self.write_manifest([(func, bad_sig), (func, int_sig)])
+            with warnings.catch_warnings(record=True) as w:
+                warnings.simplefilter('always', NumbaWarning)
+                self.assertEqual(warmup(self.manifest_path,
+                                        processes=processes), 1)
+            self.assertEqual(len(w), 1)
+            self.assertIn("Cannot warm up %s.%s" % (__name__, func.__name__),
+                          str(w[0].message))
+            self.assertEqual(func.signatures, [int_sig])
+            os.unlink(self.manifest_path)
+
+
+if __name__ == '__main__':
+    unittest.main()
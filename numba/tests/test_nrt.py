@@ -2,16 +2,21 @@ from __future__ import absolute_import, division, print_function
 
 import math
 import os
+import subprocess
 import sys
+import threading
 
 import numpy as np
+from llvmlite import binding as llvm_binding
 
 from numba import unittest_support as unittest
-from numba import njit
+from numba import njit, prange
 from numba.compiler import compile_isolated, Flags, types
 from numba.runtime import rtsys
+from numba.runtime.atomicops import remove_redundant_nrt_refct
 from numba.config import PYVERSION
-from .support import MemoryLeakMixin, TestCase
+from .support import (MemoryLeakMixin, TestCase, captured_stdout,
+                      override_config)
 
 enable_nrt_flags = Flags()
 enable_nrt_flags.set("nrt")
@@ -234,6 +239,313 @@ class TestTracemalloc(unittest.TestCase):
         self.assertLess(stat.size, N * 0.01)
 
 
+class TestPoolAllocator(TestCase):
+    """
+    Test the NRT size-class pool allocator (NUMBA_NRT_POOL_ALLOCATOR).
+    As the allocator is chosen at startup, this runs in a child process.
+    """
+
+    def run_in_subprocess(self, code):
+        env = os.environ.copy()
+        env['NUMBA_NRT_POOL_ALLOCATOR'] = '1'
+        popen = subprocess.Popen([sys.executable, "-c", code],
+                                 stdout=subprocess.PIPE,
+                                 stderr=subprocess.PIPE, env=env)
+        out, err = popen.communicate()
+        if popen.returncode != 0:
+            raise AssertionError("process failed with code %s: stderr "
+                                 "follows\n%s\n"
+                                 % (popen.returncode, err.decode()))
+        return out.decode().strip()
+
+    def test_pool_allocator(self):
+        code = """if 1:
+            import threading
+            import numpy as np
+            from numba import njit
+            from numba.runtime import rtsys
+
+            @njit
+            def scratch(n, size):
+                s = 0.0
+                for i in range(n):
+                    a = np.ones(size)
+                    b = np.arange(size * 2)
+                    s += a.sum() + b[-1]
+                return s
+
+            @njit
+            def grow(n):
+                l = [0]
+                for i in range(1, n):
+                    l.append(i)
+                s = 0
+                for x in l:
+                    s += x
+                return s
+
+            scratch(1, 1)
+            grow(1)
+            before = rtsys.get_allocation_stats()
+            results = []
+            def run():
+                for size in (1, 10, 1000, 10**5):
+                    results.append(scratch(100, size) ==
+                                   100 * (3 * size - 1))
+                results.append(grow(10**4) == 10**4 * (10**4 - 1) // 2)
+            threads = [threading.Thread(target=run) for i in range(4)]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            after = rtsys.get_allocation_stats()
+            assert all(results), results
+            assert after.alloc - before.alloc == after.free - before.free
+            assert after.mi_alloc - before.mi_alloc == \\
+                after.mi_free - before.mi_free
+            print(after.pool_hit - before.pool_hit,
+                  after.pool_miss - before.pool_miss)
+            """
+        hits, misses = map(int, self.run_in_subprocess(code).split())
+        # Most small allocations are recycled
+        self.assertGreater(hits, misses)
+
+
+class TestAllocationProfile(MemoryLeakMixin, TestCase):
+    """
+    Test the per-function allocation profiles (NUMBA_NRT_PROFILE).
+    """
+
+    def compile_profiled(self, pyfunc):
+        with override_config('NRT_PROFILE', 1):
+            cfunc = njit(pyfunc)
+            cfunc.compile("(intp,)")
+        [cres] = cfunc.overloads.values()
+        return cfunc, cres.fndesc.mangled_name
+
+    def test_profile(self):
+        def keep(n):
+            return np.empty(n, dtype=np.int8)
+
+        def temporaries(n):
+            s = 0
+            for i in range(3):
+                s += np.ones(n, dtype=np.int8).sum()
+            return s
+
+        ckeep, keep_name = self.compile_profiled(keep)
+        # Each temporary array makes a new allocation
+        with override_config('OPT_TEMP_ARRAYS', 0):
+            ctemp, temp_name = self.compile_profiled(temporaries)
+        # Not compiled with profiling
+        cother = njit(keep)
+        rtsys.reset_allocation_profile()
+
+        arr = ckeep(1000)
+        self.assertEqual(ctemp(100), 300)
+        cother(1000)
+
+        profile = rtsys.get_allocation_profile()
+        prof = profile[keep_name]
+        self.assertEqual(prof.count, 1)
+        self.assertGreaterEqual(prof.bytes, 1000)
+        self.assertEqual(prof.live_bytes, prof.bytes)
+        self.assertEqual(prof.peak_bytes, prof.bytes)
+        prof = profile[temp_name]
+        self.assertEqual(prof.count, 3)
+        self.assertGreaterEqual(prof.bytes, 300)
+        self.assertEqual(prof.live_bytes, 0)
+        self.assertLess(prof.peak_bytes, prof.bytes)
+
+        # The live bytes are updated when the array is released
+        del arr
+        prof = rtsys.get_allocation_profile()[keep_name]
+        self.assertEqual(prof.live_bytes, 0)
+        self.assertGreaterEqual(prof.peak_bytes, 1000)
+
+        rtsys.reset_allocation_profile()
+        prof = rtsys.get_allocation_profile()[keep_name]
+        self.assertEqual(prof, (0, 0, 0, 0))
+
+    def test_dump(self):
+        def keep(n):
+            return np.empty(n, dtype=np.int8)
+
+        cfunc, name = self.compile_profiled(keep)
+        cfunc(10)
+        with captured_stdout() as stdout:
+            rtsys.dump_allocation_profile()
+        lines = stdout.getvalue().splitlines()
+        self.assertIn("peak bytes", lines[0])
+        self.assertTrue(any(line.endswith(name) for line in lines[1:]))
+
+
+_refct_loop_template = """
+declare void @NRT_incref(i8*)
+declare void @NRT_decref(i8*)
+declare void @use(i8*)
+
+define void @loop(i8* %a, i8* %b, i64 %n) {{
+entry:
+  {entry}
+  br label %header
+header:
+  %i = phi i64 [0, %entry], [%i.next, %latch]
+  %cond = icmp slt i64 %i, %n
+  br i1 %cond, label %body, label %exit
+body:
+  call void @NRT_incref(i8* %a)
+  call void @use(i8* %a)
+  %c = icmp eq i64 %i, 5
+  br i1 %c, label %then, label %latch
+then:
+  {then}
+  call void @use(i8* %b)
+  br label %latch
+latch:
+  call void @NRT_decref(i8* %a)
+  %i.next = add i64 %i, 1
+  br label %header
+exit:
+  ret void
+}}
+"""
+
+
+class TestRefCtPruning(TestCase):
+    """
+    Test the pruning of NRT refct operations across basic blocks.
+    """
+
+    def prune(self, entry="", then=""):
+        ll_module = llvm_binding.parse_assembly(
+            _refct_loop_template.format(entry=entry, then=then))
+        return str(remove_redundant_nrt_refct(ll_module))
+
+    def count_refct_ops(self, ir):
+        return (ir.count("call void @NRT_incref"),
+                ir.count("call void @NRT_decref"))
+
+    def test_loop_pair(self):
+        # The incref and decref surround a branch in the loop body
+        self.assertEqual(self.count_refct_ops(self.prune()), (0, 0))
+
+    def test_null_pointer(self):
+        ir = self.prune(then="call void @NRT_decref(i8* null)")
+        self.assertEqual(self.count_refct_ops(ir), (0, 0))
+
+    def test_decref_in_between(self):
+        # The decref of %b may release %a if it is an alias
+        ir = self.prune(then="call void @NRT_decref(i8* %b)")
+        self.assertEqual(self.count_refct_ops(ir), (1, 2))
+
+    def test_early_return(self):
+        ir = self.prune(then="ret void\nunused:")
+        self.assertEqual(self.count_refct_ops(ir), (1, 1))
+
+    def test_not_in_lockstep(self):
+        # The extra incref runs once, the decref at each iteration:
+        # only the pair in the loop body is removed
+        ir = self.prune(entry="call void @NRT_incref(i8* %a)")
+        self.assertEqual(self.count_refct_ops(ir), (1, 0))
+
+
+def swap_arrays(x, y, n):
+    for i in range(n):
+        x, y = y, x
+    return x, y
+
+
+class TestNonAtomicRefct(MemoryLeakMixin, TestCase):
+    """
+    Test non-atomic refcount updates (the nonatomic_refct option).
+    """
+
+    def compile(self, **flag_names):
+        flags = Flags()
+        flags.set("nrt")
+        for name in flag_names:
+            flags.set(name)
+        arrty = types.Array(types.float64, 1, 'C')
+        return compile_isolated(swap_arrays, (arrty, arrty, types.intp),
+                                flags=flags)
+
+    def test_flags(self):
+        cres = self.compile()
+        self.assertTrue(cres.target_context.atomic_refct)
+        cres = self.compile(nonatomic_refct=True)
+        self.assertFalse(cres.target_context.atomic_refct)
+        # Functions which may run concurrently stay atomic
+        cres = self.compile(nonatomic_refct=True, release_gil=True)
+        self.assertTrue(cres.target_context.atomic_refct)
+        cres = self.compile(nonatomic_refct=True, auto_parallel=True)
+        self.assertTrue(cres.target_context.atomic_refct)
+
+    def test_config(self):
+        with override_config('NRT_NONATOMIC', 1):
+            cfunc = njit(swap_arrays)
+            x = np.arange(3.)
+            cfunc(x, x, 1)
+        [cres] = cfunc._compileinfos.values()
+        self.assertFalse(cres.target_context.atomic_refct)
+
+    def make_arrays(self):
+        # Arrays allocated by the NRT: their meminfo is shared by all
+        # the functions they are passed to
+        @njit
+        def make(n):
+            return np.arange(n) * 1.0
+        return make(3), make(4)
+
+    def test_refcounts(self):
+        cfunc = njit(nonatomic_refct=True)(swap_arrays)
+        x, y = self.make_arrays()
+        a, b = cfunc(x, y, 3)
+        np.testing.assert_equal(a, y)
+        np.testing.assert_equal(b, x)
+        del a, b
+        self.assertEqual(x.base.refcount, 1)
+        self.assertEqual(y.base.refcount, 1)
+
+    def test_with_nogil_threads(self):
+        # Concurrent nogil functions make the non-atomic function use
+        # atomic operations on the meminfos they share
+        nonatomic = njit(nonatomic_refct=True)(swap_arrays)
+        nogil = njit(nogil=True)(swap_arrays)
+        x, y = self.make_arrays()
+        nonatomic(x, y, 1)
+        nogil(x, y, 1)
+
+        def run(cfunc):
+            for i in range(50):
+                cfunc(x, y, 10001)
+
+        threads = [threading.Thread(target=run, args=(cfunc,))
+                   for cfunc in (nonatomic, nogil, nogil)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(x.base.refcount, 1)
+        self.assertEqual(y.base.refcount, 1)
+
+    def test_prange_callee(self):
+        # A non-atomic function called from a prange() body runs
+        # concurrently on the worker threads, with the GIL held by the
+        # caller: it must still update shared meminfos atomically
+        nonatomic = njit(nonatomic_refct=True)(swap_arrays)
+
+        @njit
+        def run(x, y, n):
+            for i in prange(n):
+                nonatomic(x, y, 1001)
+
+        x, y = self.make_arrays()
+        run(x, y, 10**4)
+        self.assertEqual(x.base.refcount, 1)
+        self.assertEqual(y.base.refcount, 1)
+
+
 class TestNRTIssue(MemoryLeakMixin, TestCase):
     def test_issue_with_refct_op_pruning(self):
         """
@@ -0,0 +1,122 @@
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+
+from numba import unittest_support as unittest
+from numba import njit, prange
+from numba.errors import LoweringError
+from .support import MemoryLeakMixin
+
+
+def prange_sum(a, b, c):
+    s = 0
+    for i in prange(a, b, c):
+        s += i
+    return s
+
+
+def prange_norm(a):
+    s = 0.0
+    p = 1.0
+    for i in prange(a.shape[0]):
+        x = a[i] * a[i]
+        s += x
+        p *= 1.0
+    return np.sqrt(s) * p
+
+
+def prange_write(a, out):
+    k = 3
+    for i in prange(a.shape[0]):
+        x = a[i]
+        if x > 0:
+            y = x * k
+        else:
+            y = -x
+        out[i] = y
+
+
+def prange_nested(a):
+    out = np.zeros_like(a)
+    for i in prange(a.shape[0]):
+        for j in prange(a.shape[1]):
+            out[i, j] = a[i, j] + i
+    return out
+
+
+def prange_raise(a):
+    for i in prange(a.shape[0]):
+        if a[i] < 0:
+            raise ValueError("negative value")
+
+
+def prange_break(n):
+    for i in prange(n):
+        if i > 3:
+            break
+
+
+def prange_return(n):
+    for i in prange(n):
+        if i > 3:
+            return i
+    return 0
+
+
+def prange_lastprivate(n):
+    x = 0
+    for i in prange(n):
+        x = i
+    return x
+
+
+class TestPrange(MemoryLeakMixin, unittest.TestCase):
+
+    def test_reduction(self):
+        cfunc = njit(prange_sum)
+        for args in [(0, 0, 1), (0, 1, 1), (0, 10**5, 1), (5, -10**4, -3),
+                     (-10, 10**4 + 7, 7)]:
+            self.assertEqual(cfunc(*args), prange_sum(*args))
+        cfunc = njit(prange_norm)
+        a = np.linspace(0., 1., 10**5)
+        self.assertAlmostEqual(cfunc(a), prange_norm(a))
+        self.assertEqual(cfunc(a[:0]), 0.0)
+
+    def test_private(self):
+        cfunc = njit(prange_write)
+        a = np.arange(-10**4, 10**4, dtype=np.float64)
+        expect = np.zeros_like(a)
+        got = np.zeros_like(a)
+        prange_write(a, expect)
+        cfunc(a, got)
+        np.testing.assert_equal(got, expect)
+
+    def test_nested(self):
+        # The inner loop runs serially
+        cfunc = njit(prange_nested)
+        a = np.arange(10**4, dtype=np.float64).reshape((100, 100))
+        np.testing.assert_equal(cfunc(a), prange_nested(a))
+
+    def test_exception(self):
+        cfunc = njit(prange_raise)
+        a = np.arange(10**5, dtype=np.float64)
+        cfunc(a)
+        a[10**4] = -1.
+        with self.assertRaises(ValueError) as raises:
+            cfunc(a)
+        self.assertEqual(str(raises.exception), "negative value")
+
+    def test_unsupported(self):
+        for pyfunc in (prange_break, prange_return, prange_lastprivate):
+            with self.assertRaises(LoweringError) as raises:
+                njit(pyfunc)(10)
+            self.assertIn("prange()", str(raises.exception))
+
+    def test_interpreted(self):
+        # prange() works like range() in the interpreter
+        self.assertEqual(list(prange(2, 10, 3)), list(range(2, 10, 3)))
+        self.assertEqual(prange_sum(0, 10, 1), 45)
+
+
+if __name__ == '__main__':
+    unittest.main()
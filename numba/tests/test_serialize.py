@@ -7,7 +7,7 @@ import sys
 from numba import unittest_support as unittest
 from numba.errors import TypingError
 from numba.targets import registry
-from .support import TestCase
+from .support import TestCase, override_config
 from .serialize_usecases import *
 
 
@@ -90,6 +90,55 @@ class TestDispatcherPickling(TestCase):
         # Same with an object mode function
         self.run_with_protocols(self.check_call, dyn_func_objmode, 36, (6,))
 
+    def check_object_code(self, proto, func, expected_result, args):
+        func(*args)
+        with override_config('PICKLE_OBJECT_CODE', 1):
+            pickled = pickle.dumps(func, proto)
+        self.simulate_fresh_target()
+        new_func = pickle.loads(pickled)
+        self.assertEqual(new_func.signatures, func.signatures)
+        # The overloads were loaded rather than compiled
+        for stats in new_func.get_compile_stats().values():
+            self.assertIs(stats, None)
+        self.assertPreciseEqual(new_func(*args), expected_result)
+
+    def test_object_code(self):
+        self.run_with_protocols(self.check_object_code, add_with_sig, 5, (1, 4))
+        self.run_with_protocols(self.check_object_code, add_nopython, 5.5, (1.2, 4.3))
+        inner = closure_calling_other_closure(3.0)
+        self.run_with_protocols(self.check_object_code, inner, 8.0, (4.0,))
+
+    def test_object_code_mismatch(self):
+        add_nopython(1.2, 4.3)
+        with override_config('PICKLE_OBJECT_CODE', 1):
+            func_reduced, locals, targetoptions, can_compile, sigs, compiled = \
+                add_nopython.__reduce__()[1][1:]
+        magic_tuple, data = compiled
+        self.assertEqual(len(data), len(add_nopython.signatures))
+        # An incompatible host ignores the machine code
+        compiled = ('some-other-triple',) + magic_tuple[1:], data
+        new_func = type(add_nopython)._rebuild(func_reduced, locals,
+                                               targetoptions, can_compile,
+                                               sigs, compiled)
+        self.assertEqual(new_func.signatures, [])
+        self.assertPreciseEqual(new_func(1.2, 4.3), 5.5)
+
+    def test_other_process_object_code(self):
+        func = closure_calling_other_closure(3.0)
+        func(4.0)
+        with override_config('PICKLE_OBJECT_CODE', 1):
+            pickled = pickle.dumps(func)
+        code = """if 1:
+            import pickle
+
+            data = {pickled!r}
+            func = pickle.loads(data)
+            assert len(func.signatures) == 1, func.signatures
+            res = func(4.0)
+            assert res == 8.0, res
+            """.format(**locals())
+        subprocess.check_call([sys.executable, "-c", code])
+
     def test_other_process(self):
         """
         Check that reconstructing doesn't depend on resources already
@@ -0,0 +1,125 @@
+from __future__ import print_function, absolute_import, division
+
+import numpy as np
+
+from numba import unittest_support as unittest
+from numba import njit
+from numba.runtime import rtsys
+from .support import MemoryLeakMixin, TestCase, override_config
+
+
+def zeros_in_loop(n):
+    s = 0.0
+    for i in range(n):
+        a = np.zeros(3)
+        a[0] = i
+        a[2] = 2 * i
+        s += a.sum()
+    return s
+
+def ones_in_loop(n):
+    s = 0
+    for i in range(n):
+        a = np.ones((2, 3), dtype=np.int32)
+        a[1, 2] = i
+        s += a.sum()
+    return s
+
+def variable_size_in_loop(m, n):
+    s = 0.0
+    for i in range(n):
+        a = np.empty(m)
+        a[:] = i
+        s += a.sum()
+    return s
+
+def array_expr_in_loop(x, n):
+    s = 0.0
+    for i in range(n):
+        y = x * i + 1
+        s += y.sum()
+    return s
+
+def copy_in_loop(x, n):
+    s = 0.0
+    for i in range(n):
+        y = x.copy()
+        y[0] = i
+        s += y.sum()
+    return s
+
+def alias_across_iterations(n):
+    prev = np.zeros(2)
+    s = 0.0
+    for i in range(n):
+        a = np.zeros(2)
+        a[0] = i
+        s += prev[0]
+        prev = a
+    return s + prev[0]
+
+def returned_from_loop(n):
+    a = np.zeros(1)
+    for i in range(n):
+        a = np.zeros(3)
+        a[1] = i
+    return a
+
+def stored_in_tuple(n):
+    t = (np.zeros(1), np.zeros(1))
+    for i in range(n):
+        a = np.zeros(2)
+        a[0] = i
+        t = (a, t[0])
+    return t[1]
+
+
+class TestTemporaryArrays(MemoryLeakMixin, TestCase):
+    """
+    Test the allocation of temporary arrays on the stack or in reused
+    buffers (NUMBA_OPT_TEMP_ARRAYS).
+    """
+
+    def count_allocations(self, cfunc, *args):
+        before = rtsys.get_allocation_stats()
+        cfunc(*args)
+        after = rtsys.get_allocation_stats()
+        return after.alloc - before.alloc
+
+    def check_results(self, pyfunc, *args):
+        cfunc = njit(pyfunc)
+        expected = pyfunc(*args)
+        got = cfunc(*args)
+        self.assertPreciseEqual(got, expected)
+        return cfunc
+
+    def test_stack_allocation(self):
+        for pyfunc in (zeros_in_loop, ones_in_loop):
+            cfunc = self.check_results(pyfunc, 10)
+            self.assertEqual(self.count_allocations(cfunc, 100), 0)
+
+    def test_buffer_reuse(self):
+        cfunc = self.check_results(variable_size_in_loop, 5, 10)
+        self.assertEqual(self.count_allocations(cfunc, 5, 100), 1)
+        x = np.arange(100.)
+        cfunc = self.check_results(array_expr_in_loop, x, 10)
+        self.assertEqual(self.count_allocations(cfunc, x, 100), 1)
+        cfunc = self.check_results(copy_in_loop, x, 10)
+        self.assertEqual(self.count_allocations(cfunc, x, 100), 1)
+
+    def test_aliases(self):
+        self.check_results(alias_across_iterations, 10)
+        self.check_results(stored_in_tuple, 10)
+
+    def test_escaping(self):
+        cfunc = self.check_results(returned_from_loop, 10)
+        self.assertEqual(cfunc(5).base.refcount, 1)
+
+    def test_disabled(self):
+        with override_config('OPT_TEMP_ARRAYS', 0):
+            cfunc = self.check_results(zeros_in_loop, 10)
+        self.assertEqual(self.count_allocations(cfunc, 100), 100)
+
+
+if __name__ == '__main__':
+    unittest.main()
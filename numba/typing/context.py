@@ -1,6 +1,7 @@
 from __future__ import print_function, absolute_import
 
 from collections import defaultdict
+import threading
 import types as pytypes
 import weakref
 
@@ -46,6 +47,10 @@ class BaseContext(object):
     """
 
     def __init__(self):
+        # Dispatchers may be compiled concurrently from several threads,
+        # so insertions into the tables below are done under this lock.
+        # Lookups don't need it, but mustn't insert entries implicitly.
+        self._lock = threading.RLock()
         self.functions = defaultdict(list)
         self.attributes = {}
         self._globals = utils.UniqueDict()
@@ -92,7 +97,7 @@ class BaseContext(object):
         Resolve function type *func* for argument types *args* and *kws*.
         A signature is returned.
         """
-        defns = self.functions[func]
+        defns = self.functions.get(func, ())
         for defn in defns:
             res = defn.apply(args, kws)
             if res is not None:
@@ -212,12 +217,13 @@ class BaseContext(object):
         self.install(templates.builtin_registry)
 
     def install(self, registry):
-        for ftcls in registry.functions:
-            self.insert_function(ftcls(self))
-        for ftcls in registry.attributes:
-            self.insert_attributes(ftcls(self))
-        for gv, gty in registry.globals:
-            self.insert_global(gv, gty)
+        with self._lock:
+            for ftcls in registry.functions:
+                self.insert_function(ftcls(self))
+            for ftcls in registry.attributes:
+                self.insert_attributes(ftcls(self))
+            for gv, gty in registry.globals:
+                self.insert_global(gv, gty)
 
     def _lookup_global(self, gv):
         """
@@ -242,19 +248,22 @@ class BaseContext(object):
             gv = weakref.ref(gv, on_disposal)
         except TypeError:
             pass
-        self._globals[gv] = gty
+        with self._lock:
+            self._globals[gv] = gty
 
     def insert_global(self, gv, gty):
         self._insert_global(gv, gty)
 
     def insert_attributes(self, at):
         key = at.key
-        assert key not in self.attributes, "Duplicated attributes template %r" % (key,)
-        self.attributes[key] = at
+        with self._lock:
+            assert key not in self.attributes, "Duplicated attributes template %r" % (key,)
+            self.attributes[key] = at
 
     def insert_function(self, ft):
         key = ft.key
-        self.functions[key].append(ft)
+        with self._lock:
+            self.functions[key].append(ft)
 
     def insert_overloaded(self, overloaded):
         self._insert_global(overloaded, types.Dispatcher(overloaded))
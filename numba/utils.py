@@ -3,6 +3,7 @@ from __future__ import print_function, division, absolute_import
 import atexit
 import collections
 import functools
+import importlib
 import io
 import itertools
 import os
@@ -10,6 +11,7 @@ import threading
 import timeit
 import math
 import sys
+import types
 
 import numpy
 
@@ -261,6 +263,25 @@ class cached_property(object):
         return res
 
 
+class LazyModule(types.ModuleType):
+    """
+    A placeholder for module *name*, which is imported on first attribute
+    access.  This allows exposing costly optional subpackages as
+    attributes of a package without importing them upfront.
+    """
+
+    def __init__(self, name):
+        super(LazyModule, self).__init__(name)
+
+    def __getattr__(self, attr):
+        # Only called for attributes not yet in our __dict__
+        if attr.startswith('__'):
+            raise AttributeError(attr)
+        module = importlib.import_module(self.__name__)
+        self.__dict__.update(module.__dict__)
+        return getattr(module, attr)
+
+
 def runonce(fn):
     @functools.wraps(fn)
     def inner():